@@ -1,70 +1,501 @@
 import matplotlib.pyplot as plt
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import openpyxl
+import argparse
 import os
-# import geopandas as gpd
+import re
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import geopandas as gpd
+from geography_cardiff import (read_areas, build_area_index, build_cardiff_geometry, build_geometry_levels,
+                               geometry_level_paths, NATIONAL_SHAPEFILE_PATH, CARDIFF_SHAPEFILE_PATH,
+                               AREA_INDEX_PATH, CARDIFF_GEOMETRY_DIR)
+from pipeline import Stage, run_pipeline, file_hash
 
-print(os.getcwd())
+# streamlit-free modules shared with the app
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "streamlit_app"))
+from cobenefit_tensor import CobenefitTensor, axes_path
+from rollup_cube import build_rollup_cube, merge_rollup_cubes
+from data_quality import profile_long_table, merge_profiles
+from inequality import inequality_metrics
+from spatial_stats import add_smoothed_rates
 
-# import main data table
-print("l2 data is getting imported ...")
-df_l2 = pd.read_excel("data/Level_2.xlsx")
+LEVEL2_PATH = "data/Level_2.xlsx"
+LOOKUP_PATH = "data/lookups.xlsx"
+WIMD_PATH = "data/wimd-2025-index-and-domain-ranks-by-small-area.ods"
+PARTITIONS_DIR = "data/partitions"
 
-# import lookup
-print("Lookup data is getting imported ...")
-df_lkup = pd.read_excel("data/lookups.xlsx").drop('Unnamed: 4', axis=1)
+# intermediate artifacts of the staged build (see python_code/pipeline.py)
+CACHE_DIR = "data/cache"
+LOOKUP_CACHE_PATH = f"{CACHE_DIR}/lookup.parquet"
+WIMD_CACHE_PATH = f"{CACHE_DIR}/wimd.parquet"
+WIMD_RANKS_CACHE_PATH = f"{CACHE_DIR}/wimd_ranks.parquet"
+ODS_CACHE_DIR = f"{CACHE_DIR}/ods"
 
-# merge two tables
-df_l2Car_lookup = df_l2.merge(
-    df_lkup[df_lkup['local_authority'] == "Cardiff"],
-    on='small_area',
-    how='inner'
-)
+# WIMD sheets needed by the build -> number of title rows above the header
+WIMD_SHEETS = {
+    "Deciles_quintiles_quartiles": 3,
+    "WIMD_2025_ranks": 2,
+}
+LEVEL2_CARDIFF_PATH = f"{CACHE_DIR}/level2_cardiff.parquet"
+
+LONG_TABLE_PATH = "data/lsoa_cardiff_wimd.parquet"
+LONG_TABLE_CSV_PATH = "data/lsoa_cardiff_wimd.csv"
+TOTALS_PATH = "data/l2data_totals.parquet"
+TOTALS_CSV_PATH = "data/l2data_totals.csv"
+TENSOR_PATH = "data/cobenefit_tensor.npy"
+ROLLUP_CUBE_PATH = "data/rollup_cube.parquet"
+DATA_QUALITY_PATH = "data/data_quality.parquet"
+# inequality metrics by local authority and _std column, and the Lorenz / concentration curves
+INEQUALITY_PATH = "data/inequality.parquet"
+INEQUALITY_CURVES_PATH = "data/inequality_curves.parquet"
+
+##### ARTIFACT SCHEMAS
+# Typed columnar artifacts read by the app (see streamlit_app/data_access.py).
+# The CSV copies are still written for inspection, but the app prefers the parquet files.
+YEAR_COLS = [str(year) for year in range(2025, 2051)]
+COBENEFIT_COLS = ['air_quality', 'congestion', 'dampness', 'diet_change', 'excess_cold', 'excess_heat',
+                  'hassle_costs', 'noise', 'physical_activity', 'road_repairs', 'road_safety', 'sum']
 
-# import wimd: https://www.gov.wales/welsh-index-multiple-deprivation-2025
-print("WIMD data is getting imported ...")
-wimd = pd.read_excel(
-    "data/wimd-2025-index-and-domain-ranks-by-small-area.ods",
-    sheet_name = "Deciles_quintiles_quartiles",
-    skiprows=3,
-    engine="odf"
+# long format: one row per LSOA and co-benefit type, one column per year
+LONG_SCHEMA = pa.schema(
+    [('co-benefit_type', pa.dictionary(pa.int8(), pa.string()))]
+    + [(year, pa.float64()) for year in YEAR_COLS]
+    + [('sum', pa.float64()),
+       ('population', pa.int32()),
+       ('households', pa.int32()),
+       ('LSOA code', pa.string()),
+       ('LSOA name (Eng)', pa.string()),
+       ('WIMD 2025 overall rank ', pa.int16()),
+       ('WIMD 2025 overall decile', pa.int8()),
+       ('WIMD 2025 overall quintile', pa.int8()),
+       ('average_household_size', pa.float64())]
 )
 
-# merge tables
-df_l2Car_lookup_wimd= pd.merge(df_l2Car_lookup, wimd, how='left', left_on=['small_area'], right_on=['LSOA code'])
-df_l2Car_lookup_wimd.drop(
-    columns=['small_area',
-             'local_authority',
-             'nation',
-             'Local Authority name (Eng)',
-             'WIMD 2025 overall quartile',
-             'WIMD 2025 overall deprivation group'],
-    inplace=True
+# wide format: one row per LSOA, one column per co-benefit (totals 2025-2050), its _std version
+# and the _std_eb version smoothed with the neighbouring LSOAs
+TOTALS_SCHEMA = pa.schema(
+    [('LSOA code', pa.string()),
+     ('LSOA name (Eng)', pa.string()),
+     ('WIMD 2025 overall quintile', pa.int8()),
+     ('WIMD 2025 overall rank ', pa.int16()),
+     ('population', pa.int32()),
+     ('households', pa.int32()),
+     ('average_household_size', pa.float64())]
+    + [(col, pa.float64()) for col in COBENEFIT_COLS]
+    + [(f'{col}_std', pa.float64()) for col in COBENEFIT_COLS]
+    + [(f'{col}_std_eb', pa.float64()) for col in COBENEFIT_COLS]
 )
 
-df_l2Car_lookup_wimd['average_household_size']= round(df_l2Car_lookup_wimd['population']/df_l2Car_lookup_wimd['households'],2)
-# df_l2Car_lookup_wimd['sum_std1000']= 1000*df_l2Car_lookup_wimd['sum']/df_l2Car_lookup_wimd['population']
-
-# save as csv
-df_l2Car_lookup_wimd.to_csv(
-    "data/lsoa_cardiff_wimd.csv"
-    , index=False)
-
-l2data = pd.read_csv("data/lsoa_cardiff_wimd.csv")
-l2data_totals = l2data.pivot(
-    index = ['LSOA code', 'LSOA name (Eng)', 'WIMD 2025 overall quintile',
-             'population', 'households','average_household_size'],
-    columns = 'co-benefit_type',
-    values = 'sum'
-    ).reset_index()
-
-# Standardize co-benefit columns by dividing by population and multiplying by 1,000,000
-cobenefit_cols = ['air_quality', 'congestion', 'dampness', 'diet_change', 'excess_cold', 'excess_heat', 'hassle_costs', 'noise', 'physical_activity', 'road_repairs', 'road_safety', 'sum']
-for col in cobenefit_cols:
-    l2data_totals[f'{col}_std'] = 1000000 * l2data_totals[col] / l2data_totals['population']
-    
-
-# save it for further processing
-l2data_totals.to_csv("data/l2data_totals.csv")
+
+def write_parquet(df, path, schema):
+    """
+    Write a DataFrame as a zstd-compressed parquet file, cast to an explicit schema.
+    """
+    table = pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False)
+    pq.write_table(table, path, compression="zstd")
+    print(f"Saved {path} ({os.path.getsize(path) / 1024:.1f} KB)")
+
+
+def read_excel_rows_for_areas(path, small_areas, key_col='small_area', sheet_name=None):
+    """
+    Stream an Excel sheet row by row (openpyxl read-only mode) and keep only the rows
+    whose `key_col` is in `small_areas`.
+
+    The workbook is never fully loaded, so peak memory depends on the number of rows
+    kept rather than on the size of the (all UK) file.
+
+    Parameters:
+    - path: .xlsx file
+    - small_areas: set of area codes to keep
+    - key_col: header of the column holding the area code
+    - sheet_name: sheet to read (if None, uses the first sheet, as pd.read_excel does)
+    """
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name else workbook.worksheets[0]
+        rows = sheet.iter_rows(values_only=True)
+
+        # header row, named as pd.read_excel would name it
+        header = [h if h is not None else f"Unnamed: {i}" for i, h in enumerate(next(rows))]
+        key_idx = header.index(key_col)
+
+        kept = [row for row in rows if row[key_idx] in small_areas]
+    finally:
+        workbook.close()
+
+    print(f"Kept {len(kept):,} rows of {path}")
+    return pd.DataFrame(kept, columns=header)
+
+
+def load_lookup(path=LOOKUP_PATH):
+    """
+    Small area -> local authority lookup.
+    """
+    print("Lookup data is getting imported ...")
+    return pd.read_excel(path).drop('Unnamed: 4', axis=1)
+
+
+def convert_ods_sheets(path, sheets, cache_dir=ODS_CACHE_DIR):
+    """
+    One-off conversion of ODS sheets to parquet, cached by the content hash of the ODS file.
+
+    The ODF parser is by far the slowest reader pandas has, and the WIMD workbook only
+    changes with a new WIMD release, so every later build reads the parquet copies instead.
+
+    Parameters:
+    - path: .ods file
+    - sheets: dict of sheet name -> number of rows to skip above the header
+    - cache_dir: folder holding one sub-folder per ODS file version
+
+    Returns a dict of sheet name -> parquet path.
+    """
+    digest = file_hash(path, {})[:16]
+    version_dir = os.path.join(cache_dir, digest)
+    sheet_paths = {sheet: os.path.join(version_dir, f"{sheet}.parquet") for sheet in sheets}
+
+    if all(os.path.exists(p) for p in sheet_paths.values()):
+        print(f"Using cached sheets of {path} ({digest})")
+        return sheet_paths
+
+    print(f"Converting {path} to parquet (once per file version) ...")
+    os.makedirs(version_dir, exist_ok=True)
+    # the document is parsed once, then each sheet is read from the parsed workbook
+    with pd.ExcelFile(path, engine="odf") as workbook:
+        for sheet, skiprows in sheets.items():
+            df = workbook.parse(sheet, skiprows=skiprows)
+            df.columns = [str(col) for col in df.columns]
+            df.to_parquet(sheet_paths[sheet], index=False)
+
+    # drop the conversions of older file versions
+    for other in os.listdir(cache_dir):
+        if other != digest:
+            shutil.rmtree(os.path.join(cache_dir, other), ignore_errors=True)
+
+    return sheet_paths
+
+
+def load_wimd(path=WIMD_PATH, sheet="Deciles_quintiles_quartiles"):
+    """
+    WIMD 2025 table by LSOA (deciles/quintiles/quartiles by default, or the domain ranks
+    with sheet="WIMD_2025_ranks"), read from the parquet cache of the ODS workbook.
+    """
+    # import wimd: https://www.gov.wales/welsh-index-multiple-deprivation-2025
+    print("WIMD data is getting imported ...")
+    return pd.read_parquet(convert_ods_sheets(path, WIMD_SHEETS)[sheet])
+
+
+def merge_wimd(df_l2_lookup, wimd):
+    """
+    Join the Level 2 rows (already merged with the lookup) to WIMD and tidy the columns.
+    Returns the long-format table (one row per LSOA and co-benefit type).
+    """
+    df_l2_lookup_wimd = pd.merge(df_l2_lookup, wimd, how='left', left_on=['small_area'], right_on=['LSOA code'])
+
+    # areas outside Wales have no WIMD row: keep their code so they still pivot to one row each
+    df_l2_lookup_wimd['LSOA code'] = df_l2_lookup_wimd['LSOA code'].fillna(df_l2_lookup_wimd['small_area'])
+
+    df_l2_lookup_wimd.drop(
+        columns=['small_area',
+                 'local_authority',
+                 'nation',
+                 'Local Authority name (Eng)',
+                 'WIMD 2025 overall quartile',
+                 'WIMD 2025 overall deprivation group'],
+        inplace=True
+    )
+
+    df_l2_lookup_wimd['average_household_size']= round(df_l2_lookup_wimd['population']/df_l2_lookup_wimd['households'],2)
+    # df_l2_lookup_wimd['sum_std1000']= 1000*df_l2_lookup_wimd['sum']/df_l2_lookup_wimd['population']
+
+    # year columns come out of Excel as integers
+    df_l2_lookup_wimd.columns = [str(col) for col in df_l2_lookup_wimd.columns]
+    return df_l2_lookup_wimd
+
+
+def build_totals(l2data, geometry=None):
+    """
+    Pivot the long table to one row per LSOA (totals 2025-2050 by co-benefit type)
+    and add the per-person _std columns and their smoothed _std_eb versions.
+
+    Parameters:
+    - l2data: long table
+    - geometry: LSOA polygons (small_area, geometry) giving the neighbours of the smoothing;
+      without it the _std_eb columns are left empty (null)
+    """
+    l2data_totals = l2data.pivot(
+        index = ['LSOA code', 'LSOA name (Eng)', 'WIMD 2025 overall quintile', 'WIMD 2025 overall rank ',
+                 'population', 'households','average_household_size'],
+        columns = 'co-benefit_type',
+        values = 'sum'
+        ).reset_index()
+
+    # Standardize co-benefit columns by dividing by population and multiplying by 1,000,000
+    for col in COBENEFIT_COLS:
+        l2data_totals[f'{col}_std'] = 1000000 * l2data_totals[col] / l2data_totals['population']
+
+    # empirical-Bayes rates, shrunk towards the neighbourhood for the small populations
+    if geometry is not None and len(geometry) > 0:
+        l2data_totals = add_smoothed_rates(l2data_totals, geometry, COBENEFIT_COLS, scale=1000000)
+    else:
+        # no neighbours to smooth with: nulls, so the app does not show raw rates as smoothed
+        print("Warning: no geometry for the smoothed rates, the _std_eb columns are left empty")
+        for col in COBENEFIT_COLS:
+            l2data_totals[f'{col}_std_eb'] = float('nan')
+
+    return l2data_totals
+
+
+def local_authority_slug(local_authority):
+    """
+    Folder name for a local authority partition, e.g. "Vale of Glamorgan" -> "vale_of_glamorgan".
+    """
+    return re.sub(r'[^a-z0-9]+', '_', local_authority.lower()).strip('_')
+
+
+def build_local_authority_partition(local_authority, df_l2_lookup, wimd, geometry, output_dir=PARTITIONS_DIR):
+    """
+    Build and save one local authority partition: long table, totals table and geometry.
+    Runs in a worker process of the partitioned build.
+    """
+    partition_dir = os.path.join(output_dir, local_authority_slug(local_authority))
+    os.makedirs(partition_dir, exist_ok=True)
+
+    l2data = merge_wimd(df_l2_lookup, wimd)
+    write_parquet(l2data, os.path.join(partition_dir, "lsoa_wimd.parquet"), LONG_SCHEMA)
+
+    l2data_totals = build_totals(l2data, geometry)
+    write_parquet(l2data_totals, os.path.join(partition_dir, "l2data_totals.parquet"), TOTALS_SCHEMA)
+
+    build_rollup_cube(l2data, local_authority=local_authority).to_parquet(
+        os.path.join(partition_dir, "rollup_cube.parquet"), index=False)
+
+    # zero/null counts, incl. areas without a WIMD row or without population
+    profile_long_table(l2data, local_authority=local_authority).to_parquet(
+        os.path.join(partition_dir, "data_quality.parquet"), index=False)
+
+    if len(geometry) > 0:
+        geometry.to_file(os.path.join(partition_dir, "lsoa.shp"), engine="pyogrio")
+        build_geometry_levels(geometry, os.path.join(partition_dir, "geometry"))
+
+    return local_authority, len(l2data_totals), len(geometry)
+
+
+##### STAGES
+# Each stage reads and writes files only, so the pipeline can skip it when its inputs are unchanged.
+
+def stage_lookup():
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    load_lookup().to_parquet(LOOKUP_CACHE_PATH, index=False)
+
+
+def stage_wimd():
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    load_wimd().to_parquet(WIMD_CACHE_PATH, index=False)
+    load_wimd(sheet="WIMD_2025_ranks").to_parquet(WIMD_RANKS_CACHE_PATH, index=False)
+
+
+def stage_level2_cardiff():
+    df_lkup = pd.read_parquet(LOOKUP_CACHE_PATH)
+    df_lkup_cardiff = df_lkup[df_lkup['local_authority'] == "Cardiff"]
+
+    # import main data table (streamed: only the Cardiff rows are kept)
+    print("l2 data is getting imported ...")
+    df_l2 = read_excel_rows_for_areas(LEVEL2_PATH, set(df_lkup_cardiff['small_area']))
+
+    # merge two tables
+    df_l2Car_lookup = df_l2.merge(
+        df_lkup_cardiff,
+        on='small_area',
+        how='inner'
+    )
+    df_l2Car_lookup.columns = [str(col) for col in df_l2Car_lookup.columns]
+    df_l2Car_lookup.to_parquet(LEVEL2_CARDIFF_PATH, index=False)
+
+
+def stage_long_table():
+    df_l2Car_lookup_wimd = merge_wimd(pd.read_parquet(LEVEL2_CARDIFF_PATH), pd.read_parquet(WIMD_CACHE_PATH))
+
+    # save as csv and parquet
+    df_l2Car_lookup_wimd.to_csv(
+        LONG_TABLE_CSV_PATH
+        , index=False)
+    write_parquet(df_l2Car_lookup_wimd, LONG_TABLE_PATH, LONG_SCHEMA)
+
+
+def stage_totals():
+    l2data = pd.read_parquet(LONG_TABLE_PATH)
+    l2data['co-benefit_type'] = l2data['co-benefit_type'].astype(str)
+    l2data_totals = build_totals(l2data, gpd.read_file(CARDIFF_SHAPEFILE_PATH))
+
+    # save it for further processing
+    l2data_totals.to_csv(TOTALS_CSV_PATH)
+    write_parquet(l2data_totals, TOTALS_PATH, TOTALS_SCHEMA)
+
+
+def stage_tensor():
+    l2data = pd.read_parquet(LONG_TABLE_PATH)
+    tensor = CobenefitTensor.from_long_table(l2data, year_cols=YEAR_COLS)
+    tensor.save(TENSOR_PATH)
+    print(f"Saved {TENSOR_PATH}: {tensor}")
+
+
+def stage_rollup():
+    l2data = pd.read_parquet(LONG_TABLE_PATH)
+    cube = build_rollup_cube(l2data, local_authority="Cardiff", year_cols=YEAR_COLS)
+    cube.to_parquet(ROLLUP_CUBE_PATH, index=False)
+    print(f"Saved {ROLLUP_CUBE_PATH} ({len(cube):,} rows)")
+
+
+def stage_area_index():
+    build_area_index(NATIONAL_SHAPEFILE_PATH, AREA_INDEX_PATH)
+
+
+def stage_quality():
+    l2data = pd.read_parquet(LONG_TABLE_PATH)
+    profile = profile_long_table(l2data, local_authority="Cardiff")
+    profile.to_parquet(DATA_QUALITY_PATH, index=False)
+    print(f"Saved {DATA_QUALITY_PATH} ({len(profile):,} rows)")
+
+
+def stage_inequality():
+    # the totals carry the WIMD rank (TOTALS_SCHEMA)
+    l2data_totals = pd.read_parquet(TOTALS_PATH)
+    metrics, curves = inequality_metrics(l2data_totals, local_authority="Cardiff")
+    metrics.to_parquet(INEQUALITY_PATH, index=False)
+    curves.to_parquet(INEQUALITY_CURVES_PATH, index=False)
+    print(f"Saved {INEQUALITY_PATH} ({len(metrics):,} rows)")
+
+
+def stage_geography():
+    build_cardiff_geometry(codes_path=LONG_TABLE_CSV_PATH, output_path=CARDIFF_SHAPEFILE_PATH)
+
+
+def stage_geometry_levels():
+    build_geometry_levels(gpd.read_file(CARDIFF_SHAPEFILE_PATH), CARDIFF_GEOMETRY_DIR)
+
+
+def input_stages():
+    """
+    Stages shared by every build: national lookup and WIMD converted to parquet once,
+    and the feature index of the national shapefile.
+    """
+    return [
+        Stage("lookup", stage_lookup, inputs=[LOOKUP_PATH], outputs=[LOOKUP_CACHE_PATH]),
+        Stage("wimd", stage_wimd, inputs=[WIMD_PATH], outputs=[WIMD_CACHE_PATH, WIMD_RANKS_CACHE_PATH]),
+        Stage("area_index", stage_area_index, inputs=[NATIONAL_SHAPEFILE_PATH], outputs=[AREA_INDEX_PATH]),
+    ]
+
+
+def cardiff_stages():
+    """
+    Default build: Cardiff only, written to the files read by the app.
+    """
+    return input_stages() + [
+        Stage("level2_cardiff", stage_level2_cardiff,
+              inputs=[LEVEL2_PATH, LOOKUP_CACHE_PATH], outputs=[LEVEL2_CARDIFF_PATH]),
+        Stage("long_table", stage_long_table,
+              inputs=[LEVEL2_CARDIFF_PATH, WIMD_CACHE_PATH], outputs=[LONG_TABLE_PATH, LONG_TABLE_CSV_PATH]),
+        Stage("totals", stage_totals,
+              inputs=[LONG_TABLE_PATH, CARDIFF_SHAPEFILE_PATH], outputs=[TOTALS_PATH, TOTALS_CSV_PATH]),
+        Stage("tensor", stage_tensor,
+              inputs=[LONG_TABLE_PATH], outputs=[TENSOR_PATH, axes_path(TENSOR_PATH)]),
+        Stage("rollup", stage_rollup,
+              inputs=[LONG_TABLE_PATH], outputs=[ROLLUP_CUBE_PATH]),
+        Stage("quality", stage_quality,
+              inputs=[LONG_TABLE_PATH], outputs=[DATA_QUALITY_PATH]),
+        Stage("inequality", stage_inequality,
+              inputs=[TOTALS_PATH], outputs=[INEQUALITY_PATH, INEQUALITY_CURVES_PATH]),
+        Stage("geography", stage_geography,
+              inputs=[NATIONAL_SHAPEFILE_PATH, AREA_INDEX_PATH, LONG_TABLE_CSV_PATH], outputs=[CARDIFF_SHAPEFILE_PATH]),
+        Stage("geometry_levels", stage_geometry_levels,
+              inputs=[CARDIFF_SHAPEFILE_PATH], outputs=geometry_level_paths(CARDIFF_GEOMETRY_DIR)),
+    ]
+
+
+def build_all_local_authorities(output_dir=PARTITIONS_DIR, max_workers=None, force=False):
+    """
+    Partitioned build: read the national inputs once (Level 2, lookup, WIMD, shapefile)
+    and write one partition per local authority in `lookups.xlsx` to `output_dir/<slug>/`.
+    The per-local-authority work runs in a process pool.
+    """
+    # lookup and WIMD come from the staged cache, rebuilt only when their source files change
+    run_pipeline(input_stages(), force=force)
+    df_lkup = pd.read_parquet(LOOKUP_CACHE_PATH)
+
+    # one streaming pass over Level 2, keeping every area known to the lookup
+    print("l2 data is getting imported ...")
+    df_l2 = read_excel_rows_for_areas(LEVEL2_PATH, set(df_lkup['small_area']))
+    df_l2_lookup = df_l2.merge(df_lkup, on='small_area', how='inner')
+
+    wimd = pd.read_parquet(WIMD_CACHE_PATH)
+
+    # only the areas with Level 2 data are decoded from the national shapefile
+    national_shapefile = read_areas(df_l2_lookup['small_area'].unique())
+    area_to_la = df_lkup.set_index('small_area')['local_authority']
+    national_shapefile['local_authority'] = national_shapefile['small_area'].map(area_to_la)
+
+    l2_groups = dict(tuple(df_l2_lookup.groupby('local_authority')))
+    geometry_groups = dict(tuple(national_shapefile.groupby('local_authority')))
+    empty_geometry = national_shapefile.iloc[0:0]
+
+    print(f"Building {len(l2_groups)} local authority partitions ...")
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                build_local_authority_partition,
+                local_authority,
+                df_l2_la,
+                wimd,
+                geometry_groups.get(local_authority, empty_geometry).drop(columns='local_authority'),
+                output_dir
+            )
+            for local_authority, df_l2_la in l2_groups.items()
+        ]
+        for future in as_completed(futures):
+            local_authority, n_areas, n_geometries = future.result()
+            print(f"{local_authority}: {n_areas} areas, {n_geometries} geometries")
+
+    # national cube: the partition cubes are additive, so merging them needs no rescan
+    cubes = [pd.read_parquet(os.path.join(output_dir, local_authority_slug(la), "rollup_cube.parquet"))
+             for la in l2_groups]
+    merge_rollup_cubes(cubes).to_parquet(os.path.join(output_dir, "rollup_cube.parquet"), index=False)
+
+    # national data-quality report, merged from the partition profiles the same way
+    profiles = [pd.read_parquet(os.path.join(output_dir, local_authority_slug(la), "data_quality.parquet"))
+                for la in l2_groups]
+    merge_profiles(profiles).to_parquet(os.path.join(output_dir, "data_quality.parquet"), index=False)
+
+    # inequality metrics are not additive: one sorted pass over the totals of every partition,
+    # plus all areas together
+    l2data_totals = pd.concat(
+        [pd.read_parquet(os.path.join(output_dir, local_authority_slug(la), "l2data_totals.parquet"))
+         .assign(local_authority=la) for la in l2_groups],
+        ignore_index=True)
+    metrics, curves = inequality_metrics(l2data_totals, include_all=True)
+    metrics.to_parquet(os.path.join(output_dir, "inequality.parquet"), index=False)
+    curves.to_parquet(os.path.join(output_dir, "inequality_curves.parquet"), index=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prepare the co-benefits data for the app")
+    parser.add_argument("--all-local-authorities", action="store_true",
+                        help=f"write one partition per local authority to {PARTITIONS_DIR}/ instead of the Cardiff files")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes for the partitioned build")
+    parser.add_argument("--force", action="store_true",
+                        help="re-run every stage even if its inputs are unchanged")
+    args = parser.parse_args()
+
+    print(os.getcwd())
+
+    if args.all_local_authorities:
+        build_all_local_authorities(max_workers=args.workers, force=args.force)
+    else:
+        run_pipeline(cardiff_stages(), force=args.force)
 
 # L3 OLD CODE
 # # import main data table
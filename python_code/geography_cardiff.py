@@ -1,34 +1,195 @@
-import streamlit as st
 import geopandas as gpd
 import pandas as pd
-import pydeck as pdk
+import pyogrio
+import shapely
 import json
 import os
+import sys
 
-# Load the Cardiff LSOA codes from your CSV
-df_wimd = pd.read_csv("data/lsoa_cardiff_wimd.csv")
-cardiff_codes = df_wimd["LSOA code"].astype(str).str.strip().unique()
+# streamlit-free modules shared with the app
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "streamlit_app"))
+from map_geometry import build_topology
 
-print(f"Found {len(cardiff_codes)} unique Cardiff LSOA codes")
+NATIONAL_SHAPEFILE_PATH = "data/shapefile/small_areas_british_grid.shp"
+CARDIFF_SHAPEFILE_PATH = "data/cardiff_shapefile/cardiff_lsoa.shp"
 
-# Load the full shapefile
-print("Loading full shapefile...")
-full_shapefile = gpd.read_file("data/shapefile/small_areas_british_grid.shp", engine="pyogrio")
-print(f"Full shapefile has {len(full_shapefile)} features")
+# persisted index of the national shapefile: feature id, area code and bounding box per feature
+AREA_INDEX_PATH = "data/cache/small_area_index.parquet"
 
-# Normalize the column name
-full_shapefile["small_area"] = full_shapefile["small_area"].astype(str).str.strip()
+# pre-reprojected (EPSG:4326), pre-simplified GeoParquet copies of the Cardiff geometry
+CARDIFF_GEOMETRY_DIR = "data/cardiff_geometry"
+GEOMETRY_LEVELS_FILE = "levels.json"
+# shared-arc (TopoJSON-style) encoding of the full resolution level, see map_geometry.build_topology
+TOPOLOGY_FILE = "lsoa_topology.json"
 
-# Filter to only Cardiff LSOAs
-cardiff_shapefile = full_shapefile[full_shapefile["small_area"].isin(cardiff_codes)].copy()
-print(f"Cardiff subset has {len(cardiff_shapefile)} features")
+# simplification levels: tolerance in metres (British National Grid) and the zoom band
+# [min_zoom, max_zoom) each level is drawn at. At Cardiff's latitude a pixel is roughly
+# 190 m at zoom 9, 50 m at zoom 11 and 12 m at zoom 13, so the removed detail stays
+# below about a pixel.
+GEOMETRY_LEVELS = [
+    {"tolerance": 200, "min_zoom": 0, "max_zoom": 9},
+    {"tolerance": 50, "min_zoom": 9, "max_zoom": 11},
+    {"tolerance": 20, "min_zoom": 11, "max_zoom": 13},
+    {"tolerance": 0, "min_zoom": 13, "max_zoom": 25},
+]
 
 
-# Save the filtered shapefile
-output_path = "data/cardiff_shapefile/cardiff_lsoa.shp"
-cardiff_shapefile.to_file(output_path, engine="pyogrio")
+def load_national_shapefile(path=NATIONAL_SHAPEFILE_PATH):
+    """
+    Load the full (all UK) small area shapefile, with a normalised `small_area` column.
+    """
+    print("Loading full shapefile...")
+    full_shapefile = gpd.read_file(path, engine="pyogrio")
+    print(f"Full shapefile has {len(full_shapefile)} features")
 
-print(f"\nSubset shapefile saved to: {output_path}")
-print(f"Original file size: {os.path.getsize('data/shapefile/small_areas_british_grid.shp') / (1024*1024):.2f} MB")
-print(f"New file size: {os.path.getsize(output_path) / (1024*1024):.2f} MB")
+    # Normalize the column name
+    full_shapefile["small_area"] = full_shapefile["small_area"].astype(str).str.strip()
+    return full_shapefile
 
+
+def build_area_index(path=NATIONAL_SHAPEFILE_PATH, index_path=AREA_INDEX_PATH):
+    """
+    Build the feature index of the national shapefile and save it as parquet.
+
+    Only the bounding boxes (.shx/.shp headers) and the `small_area` attribute (.dbf) are
+    read, no polygon is decoded. Columns: fid, small_area, minx, miny, maxx, maxy.
+    """
+    fids, bounds = pyogrio.read_bounds(path)
+    codes = pyogrio.read_dataframe(path, columns=["small_area"], read_geometry=False, fid_as_index=True)
+
+    index = pd.DataFrame({
+        "fid": fids,
+        "small_area": codes["small_area"].reindex(fids).astype(str).str.strip().to_numpy(),
+        "minx": bounds[0],
+        "miny": bounds[1],
+        "maxx": bounds[2],
+        "maxy": bounds[3],
+    })
+
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    index.to_parquet(index_path, index=False)
+    print(f"Area index of {len(index)} features saved to: {index_path}")
+    return index
+
+
+def areas_where_clause(area_codes, column="small_area"):
+    """
+    OGR SQL attribute filter selecting `area_codes`, e.g. "small_area IN ('W01001234', ...)".
+    """
+    quoted = ", ".join("'" + str(code).replace("'", "''") + "'" for code in area_codes)
+    return f"{column} IN ({quoted})"
+
+
+def read_areas(area_codes, path=NATIONAL_SHAPEFILE_PATH, index_path=AREA_INDEX_PATH):
+    """
+    Read only the features whose `small_area` is in `area_codes` from the national shapefile.
+
+    With the area index (see build_area_index) the matching feature ids are looked up
+    first and only those features are decoded. Without it, the filter is pushed down to
+    the reader as an attribute `where` on `small_area`.
+    """
+    area_codes = sorted({str(code).strip() for code in area_codes})
+
+    if os.path.exists(index_path):
+        index = pd.read_parquet(index_path)
+        fids = index.loc[index["small_area"].isin(area_codes), "fid"].to_numpy()
+        print(f"Reading {len(fids)} of {len(index)} features (area index)")
+        areas = pyogrio.read_dataframe(path, fids=fids)
+    else:
+        print("No area index, filtering in the reader ...")
+        areas = pyogrio.read_dataframe(path, where=areas_where_clause(area_codes))
+
+    # Normalize the column name
+    areas["small_area"] = areas["small_area"].astype(str).str.strip()
+    return subset_areas(areas, area_codes)
+
+
+def subset_areas(full_shapefile, area_codes):
+    """
+    Keep only the features whose `small_area` is in `area_codes`.
+    """
+    return full_shapefile[full_shapefile["small_area"].isin(area_codes)].copy()
+
+
+def geometry_level_file(tolerance):
+    return f"lsoa_{tolerance}m.parquet"
+
+
+def geometry_level_paths(output_dir=CARDIFF_GEOMETRY_DIR, levels=GEOMETRY_LEVELS):
+    """
+    Files written by build_geometry_levels (one GeoParquet per level plus levels.json).
+    """
+    return ([os.path.join(output_dir, geometry_level_file(level["tolerance"])) for level in levels]
+            + [os.path.join(output_dir, GEOMETRY_LEVELS_FILE), os.path.join(output_dir, TOPOLOGY_FILE)])
+
+
+def simplify_coverage(geometry, tolerance):
+    """
+    Topology-preserving simplification of a polygon coverage: shared edges are simplified
+    once, so neighbouring areas stay gap- and overlap-free.
+    `tolerance` is in the units of the geometry's CRS (metres for British National Grid).
+    """
+    if tolerance <= 0:
+        return geometry
+    simplified = shapely.coverage_simplify(geometry.values, tolerance)
+    return gpd.GeoSeries(simplified, index=geometry.index, crs=geometry.crs)
+
+
+def build_geometry_levels(areas, output_dir=CARDIFF_GEOMETRY_DIR, levels=GEOMETRY_LEVELS):
+    """
+    Save `areas` (small_area + geometry) at every simplification level as GeoParquet
+    already reprojected to EPSG:4326, plus levels.json describing the zoom band of each file
+    and the shared-arc topology of the full resolution geometry.
+    Simplification is done in British National Grid, so tolerances are in metres.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    areas = areas[["small_area", "geometry"]].to_crs(epsg=27700)
+
+    written = []
+    for level in levels:
+        simplified = areas.copy()
+        simplified["geometry"] = simplify_coverage(areas.geometry, level["tolerance"])
+        simplified = simplified.to_crs(epsg=4326)
+
+        file_name = geometry_level_file(level["tolerance"])
+        simplified.to_parquet(os.path.join(output_dir, file_name), index=False, compression="zstd")
+
+        n_vertices = int(shapely.get_num_coordinates(simplified.geometry.values).sum())
+        written.append(dict(level, file=file_name, vertices=n_vertices))
+        print(f"Level {level['tolerance']} m (zoom {level['min_zoom']}-{level['max_zoom']}): {n_vertices:,} vertices")
+
+    with open(os.path.join(output_dir, GEOMETRY_LEVELS_FILE), "w") as f:
+        json.dump(written, f, indent=2)
+
+    full = areas.to_crs(epsg=4326)
+    topology = build_topology(full.geometry.values, ids=full["small_area"].tolist())
+    with open(os.path.join(output_dir, TOPOLOGY_FILE), "w") as f:
+        json.dump(topology, f, separators=(",", ":"))
+    print(f"Topology: {len(topology['arcs']):,} shared arcs")
+
+
+def build_cardiff_geometry(codes_path="data/lsoa_cardiff_wimd.csv", output_path=CARDIFF_SHAPEFILE_PATH):
+    """
+    Subset the national shapefile to the Cardiff LSOAs listed in `codes_path` and save it.
+    """
+    # Load the Cardiff LSOA codes from your CSV
+    df_wimd = pd.read_csv(codes_path, usecols=["LSOA code"])
+    cardiff_codes = df_wimd["LSOA code"].astype(str).str.strip().unique()
+
+    print(f"Found {len(cardiff_codes)} unique Cardiff LSOA codes")
+
+    # Read only the Cardiff LSOAs
+    cardiff_shapefile = read_areas(cardiff_codes)
+    print(f"Cardiff subset has {len(cardiff_shapefile)} features")
+
+
+    # Save the filtered shapefile
+    cardiff_shapefile.to_file(output_path, engine="pyogrio")
+
+    print(f"\nSubset shapefile saved to: {output_path}")
+    print(f"Original file size: {os.path.getsize(NATIONAL_SHAPEFILE_PATH) / (1024*1024):.2f} MB")
+    print(f"New file size: {os.path.getsize(output_path) / (1024*1024):.2f} MB")
+
+
+if __name__ == "__main__":
+    build_cardiff_geometry()
@@ -0,0 +1,152 @@
+import glob
+import hashlib
+import json
+import os
+
+MANIFEST_PATH = "data/cache/prep_manifest.json"
+
+
+class Stage:
+    """
+    A named prep step with declared input and output files.
+
+    Parameters:
+    - name: stage name (used in the manifest and in the logs)
+    - func: function called with no arguments to (re)build the outputs
+    - inputs: list of files read by the stage (a .shp path also covers its sidecar files)
+    - outputs: list of files written by the stage
+    """
+    def __init__(self, name, func, inputs, outputs):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+
+    def __repr__(self):
+        return f"Stage({self.name!r})"
+
+
+def expand_paths(paths):
+    """
+    Expand shapefile paths to every sidecar file sharing the same stem (.shp, .dbf, .shx, ...).
+    """
+    expanded = []
+    for path in paths:
+        stem, ext = os.path.splitext(path)
+        if ext.lower() == ".shp":
+            expanded.extend(sorted(glob.glob(glob.escape(stem) + ".*")) or [path])
+        else:
+            expanded.append(path)
+    return expanded
+
+
+def file_hash(path, known_files):
+    """
+    sha256 of a file's content.
+
+    The hash is cached in `known_files` together with the file size and mtime, so
+    an unchanged file is not read again on the next run.
+    """
+    stat = os.stat(path)
+    known = known_files.get(path)
+    if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+        return known["sha256"]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+
+    known_files[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest.hexdigest()}
+    return digest.hexdigest()
+
+
+def order_stages(stages):
+    """
+    Topological order of the stages: a stage runs after every stage producing one of its inputs.
+    """
+    producers = {}
+    for stage in stages:
+        for path in stage.outputs:
+            producers[path] = stage
+
+    ordered, visiting, done = [], set(), set()
+
+    def visit(stage):
+        if stage.name in done:
+            return
+        if stage.name in visiting:
+            raise ValueError(f"Cycle in prep stages at {stage.name!r}")
+        visiting.add(stage.name)
+        for path in stage.inputs:
+            if path in producers:
+                visit(producers[path])
+        visiting.discard(stage.name)
+        done.add(stage.name)
+        ordered.append(stage)
+
+    for stage in stages:
+        visit(stage)
+    return ordered
+
+
+def load_manifest(path=MANIFEST_PATH):
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {"files": {}, "stages": {}}
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+def run_pipeline(stages, manifest_path=MANIFEST_PATH, force=False):
+    """
+    Run the stages in dependency order, skipping every stage whose input hashes match
+    the manifest and whose outputs are still on disk unchanged.
+
+    Because outputs are hashed too, a stage that re-runs but writes identical outputs
+    does not trigger its downstream stages.
+
+    Returns the list of stage names that were executed.
+    """
+    manifest = load_manifest(manifest_path)
+    known_files = manifest.setdefault("files", {})
+    executed = []
+
+    for stage in order_stages(stages):
+        input_paths = expand_paths(stage.inputs)
+        missing = [p for p in input_paths if not os.path.exists(p)]
+        if missing:
+            raise FileNotFoundError(f"Stage {stage.name!r} is missing inputs: {missing}")
+
+        input_hashes = {p: file_hash(p, known_files) for p in input_paths}
+        previous = manifest["stages"].get(stage.name)
+
+        output_paths = expand_paths(stage.outputs)
+        outputs_unchanged = (
+            previous is not None
+            and all(os.path.exists(p) for p in output_paths)
+            and all(previous["outputs"].get(p) == file_hash(p, known_files) for p in output_paths)
+        )
+
+        if not force and outputs_unchanged and previous["inputs"] == input_hashes:
+            print(f"[{stage.name}] up to date, skipped")
+            continue
+
+        print(f"[{stage.name}] running ...")
+        stage.func()
+        executed.append(stage.name)
+
+        output_paths = expand_paths(stage.outputs)
+        manifest["stages"][stage.name] = {
+            "inputs": input_hashes,
+            "outputs": {p: file_hash(p, known_files) for p in output_paths},
+        }
+        # save after every stage, so an interrupted run keeps the finished stages
+        save_manifest(manifest, manifest_path)
+
+    return executed
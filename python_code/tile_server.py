@@ -0,0 +1,139 @@
+import argparse
+import os
+import re
+import sys
+from functools import lru_cache
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from mapbox_vector_tile.Mapbox import vector_tile_pb2
+
+# streamlit-free modules shared with the app
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "streamlit_app"))
+from map_geometry import TILES_DIR, ATTRIBUTE_TABLES_DIR, read_attribute_table
+
+DEFAULT_PORT = 8765
+TILE_PATH = re.compile(r"^/tiles/(\d+)/(\d+)/(\d+)\.pbf$")
+TABLE_NAME = re.compile(r"^[0-9a-f]{1,64}$")
+
+
+@lru_cache(maxsize=16)
+def load_table(name, mtime_ns):
+    # the mtime is part of the key, so a rewritten table is read again
+    return read_attribute_table(name)
+
+
+def set_value(value, python_value):
+    """Fill an MVT value message from a Python scalar."""
+    if isinstance(python_value, bool):
+        value.bool_value = python_value
+    elif isinstance(python_value, int):
+        value.sint_value = python_value
+    elif isinstance(python_value, float):
+        value.double_value = python_value
+    else:
+        value.string_value = str(python_value)
+
+
+def join_attributes(tile_bytes, table, key="small_area"):
+    """
+    Add the properties of `table` ({small_area: {property: value}}) to every feature of
+    the tile, matched on its `key` property. Geometry is left as encoded on disk.
+    """
+    tile = vector_tile_pb2.tile()
+    tile.ParseFromString(tile_bytes)
+
+    for layer in tile.layers:
+        if key not in layer.keys:
+            continue
+        key_index = list(layer.keys).index(key)
+        key_offset = {}
+        value_offset = {}
+
+        for feature in layer.features:
+            tags = feature.tags
+            # tags are (key index, value index) pairs
+            area_value = next((tags[i + 1] for i in range(0, len(tags), 2) if tags[i] == key_index), None)
+            if area_value is None:
+                continue
+            properties = table.get(layer.values[area_value].string_value)
+            if not properties:
+                continue
+
+            for name, python_value in properties.items():
+                if python_value is None:
+                    continue
+                if name not in key_offset:
+                    layer.keys.append(name)
+                    key_offset[name] = len(layer.keys) - 1
+                value_key = (type(python_value).__name__, python_value)
+                if value_key not in value_offset:
+                    set_value(layer.values.add(), python_value)
+                    value_offset[value_key] = len(layer.values) - 1
+                tags.extend([key_offset[name], value_offset[value_key]])
+
+    return tile.SerializeToString()
+
+
+class TileHandler(BaseHTTPRequestHandler):
+    """
+    GET /tiles/{z}/{x}/{y}.pbf[?table=<name>]
+
+    Serves the vector tiles from TILES_DIR. With `table`, the attribute table written by
+    the app (map_geometry.write_attribute_table) is joined on `small_area` first.
+    Missing tiles (no area there) answer 204.
+    """
+    tiles_dir = TILES_DIR
+    tables_dir = ATTRIBUTE_TABLES_DIR
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        match = TILE_PATH.match(url.path)
+        if not match:
+            self.send_error(404)
+            return
+
+        z, x, y = match.groups()
+        tile_path = os.path.join(self.tiles_dir, z, x, f"{y}.pbf")
+        if not os.path.exists(tile_path):
+            self.send_response(204)
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            return
+
+        with open(tile_path, "rb") as f:
+            body = f.read()
+
+        table_name = parse_qs(url.query).get("table", [None])[0]
+        if table_name:
+            table_path = os.path.join(self.tables_dir, f"{table_name}.json")
+            if not TABLE_NAME.match(table_name) or not os.path.exists(table_path):
+                self.send_error(404, "Unknown attribute table")
+                return
+            body = join_attributes(body, load_table(table_name, os.stat(table_path).st_mtime_ns))
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-protobuf")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        # attribute tables are named by content, so a joined tile never changes for a given URL
+        self.send_header("Cache-Control", "max-age=3600")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host="127.0.0.1", port=DEFAULT_PORT):
+    server = ThreadingHTTPServer((host, port), TileHandler)
+    print(f"Serving {TileHandler.tiles_dir} on http://{host}:{port}/tiles/{{z}}/{{x}}/{{y}}.pbf")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the local vector tiles")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+    serve(args.host, args.port)
@@ -0,0 +1,167 @@
+import argparse
+import json
+import os
+import sys
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import geopandas as gpd
+import mapbox_vector_tile
+import numpy as np
+import pandas as pd
+import pyogrio
+import shapely
+
+from geography_cardiff import read_areas, simplify_coverage, NATIONAL_SHAPEFILE_PATH
+
+# streamlit-free modules shared with the app
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "streamlit_app"))
+from map_geometry import TILES_DIR, TILES_METADATA_FILE, TILE_LAYER_NAME
+
+MIN_ZOOM = 6
+MAX_ZOOM = 14
+TILE_EXTENT = 4096
+# clip polygons slightly outside each tile, so outlines do not show at tile edges
+TILE_BUFFER = 64
+
+# half-width of the Web Mercator (EPSG:3857) world, in metres
+WORLD_HALF = 20037508.342789244
+
+
+##### TILE MATHS
+def tile_size(zoom):
+    """Width of a tile at `zoom`, in Web Mercator metres."""
+    return 2 * WORLD_HALF / 2 ** zoom
+
+
+def tile_bounds(x, y, zoom):
+    """(minx, miny, maxx, maxy) of tile (x, y) in Web Mercator metres (y counted from the top)."""
+    size = tile_size(zoom)
+    minx = -WORLD_HALF + x * size
+    maxy = WORLD_HALF - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def tile_ranges(bounds, zoom):
+    """
+    Inclusive tile index ranges covering each bounding box.
+
+    Parameters:
+    - bounds: (N, 4) array of minx, miny, maxx, maxy in Web Mercator metres
+    - zoom: zoom level
+
+    Returns four int arrays: x_first, x_last, y_first, y_last.
+    """
+    size = tile_size(zoom)
+    n_tiles = 2 ** zoom
+    x_first = np.floor((bounds[:, 0] + WORLD_HALF) / size).astype(int)
+    x_last = np.floor((bounds[:, 2] + WORLD_HALF) / size).astype(int)
+    y_first = np.floor((WORLD_HALF - bounds[:, 3]) / size).astype(int)
+    y_last = np.floor((WORLD_HALF - bounds[:, 1]) / size).astype(int)
+    return (np.clip(x_first, 0, n_tiles - 1), np.clip(x_last, 0, n_tiles - 1),
+            np.clip(y_first, 0, n_tiles - 1), np.clip(y_last, 0, n_tiles - 1))
+
+
+def simplification_tolerance(zoom):
+    """About half a screen pixel (256 px tiles) at `zoom`, in metres."""
+    return tile_size(zoom) / 512
+
+
+##### TILE BUILD
+def write_zoom_level(areas, zoom, output_dir=TILES_DIR):
+    """
+    Write every non-empty tile of one zoom level to `output_dir/{z}/{x}/{y}.pbf`.
+
+    Parameters:
+    - areas: GeoDataFrame (small_area + geometry) in EPSG:3857
+    - zoom: zoom level
+
+    The polygons are simplified for the zoom (shared edges stay shared), assigned to the
+    tiles their bounding box touches, clipped to the buffered tile and encoded as one
+    MVT layer whose features carry `small_area` (and their row number as the feature id).
+    """
+    geometry = simplify_coverage(areas.geometry, simplification_tolerance(zoom)).values
+    codes = areas["small_area"].to_numpy()
+
+    # features -> tiles, from the bounding boxes only
+    tiles = defaultdict(list)
+    x_first, x_last, y_first, y_last = tile_ranges(shapely.bounds(geometry), zoom)
+    for i in range(len(geometry)):
+        for x in range(x_first[i], x_last[i] + 1):
+            for y in range(y_first[i], y_last[i] + 1):
+                tiles[(x, y)].append(i)
+
+    n_written = 0
+    for (x, y), rows in tiles.items():
+        minx, miny, maxx, maxy = tile_bounds(x, y, zoom)
+        buffer = (maxx - minx) * TILE_BUFFER / TILE_EXTENT
+        clipped = shapely.clip_by_rect(geometry[rows], minx - buffer, miny - buffer, maxx + buffer, maxy + buffer)
+
+        features = [
+            {"geometry": geom, "properties": {"small_area": codes[row]}, "id": int(row)}
+            for row, geom in zip(rows, clipped) if not geom.is_empty
+        ]
+        if not features:
+            continue
+
+        tile = mapbox_vector_tile.encode(
+            [{"name": TILE_LAYER_NAME, "features": features}],
+            default_options={"quantize_bounds": (minx, miny, maxx, maxy), "extents": TILE_EXTENT},
+        )
+        tile_dir = os.path.join(output_dir, str(zoom), str(x))
+        os.makedirs(tile_dir, exist_ok=True)
+        with open(os.path.join(tile_dir, f"{y}.pbf"), "wb") as f:
+            f.write(tile)
+        n_written += 1
+
+    return zoom, n_written
+
+
+def build_vector_tiles(areas, output_dir=TILES_DIR, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM, max_workers=None):
+    """
+    Slice small-area polygons into Mapbox Vector Tiles on local disk (one process per zoom level)
+    and write `metadata.json` (zoom range, bounds, layer name) next to them.
+
+    Parameters:
+    - areas: GeoDataFrame with `small_area` and geometry, in any CRS
+    """
+    areas = areas[["small_area", "geometry"]].to_crs(epsg=3857)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(write_zoom_level, areas, zoom, output_dir)
+                   for zoom in range(min_zoom, max_zoom + 1)]
+        for future in as_completed(futures):
+            zoom, n_written = future.result()
+            print(f"zoom {zoom}: {n_written} tiles")
+
+    minx, miny, maxx, maxy = areas.to_crs(epsg=4326).total_bounds
+    metadata = {
+        "layer": TILE_LAYER_NAME,
+        "min_zoom": min_zoom,
+        "max_zoom": max_zoom,
+        "bounds": [minx, miny, maxx, maxy],
+        "features": len(areas),
+    }
+    with open(os.path.join(output_dir, TILES_METADATA_FILE), "w") as f:
+        json.dump(metadata, f, indent=2)
+    print(f"Tiles saved to: {output_dir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build vector tiles of the small-area geometry")
+    parser.add_argument("--areas", default=None,
+                        help="CSV with an 'LSOA code' column to tile only those areas (default: all of data/shapefile)")
+    parser.add_argument("--min-zoom", type=int, default=MIN_ZOOM)
+    parser.add_argument("--max-zoom", type=int, default=MAX_ZOOM)
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    args = parser.parse_args()
+
+    if args.areas:
+        codes = pd.read_csv(args.areas, usecols=["LSOA code"])["LSOA code"].astype(str).str.strip().unique()
+        areas = read_areas(codes)
+    else:
+        areas = pyogrio.read_dataframe(NATIONAL_SHAPEFILE_PATH, columns=["small_area"])
+        areas["small_area"] = areas["small_area"].astype(str).str.strip()
+
+    build_vector_tiles(gpd.GeoDataFrame(areas), min_zoom=args.min_zoom, max_zoom=args.max_zoom,
+                       max_workers=args.workers)
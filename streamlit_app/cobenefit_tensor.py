@@ -0,0 +1,149 @@
+import json
+import numpy as np
+import pandas as pd
+
+
+class CobenefitTensor:
+    """
+    Dense (area, co-benefit, year) array of co-benefit values with integer-coded axes.
+
+    The three axes are stored as plain lists (area codes, co-benefit names, years) and
+    the values as one contiguous float array, so every aggregation is a NumPy reduction
+    over an axis instead of a string filter on the long table.
+
+    Parameters:
+    - values: float array shaped (n_areas, n_cobenefits, n_years)
+    - areas: list of area codes (axis 0)
+    - cobenefits: list of co-benefit names (axis 1)
+    - years: list of years as integers (axis 2)
+    """
+    def __init__(self, values, areas, cobenefits, years):
+        self.values = values
+        self.areas = list(areas)
+        self.cobenefits = list(cobenefits)
+        self.years = [int(year) for year in years]
+
+        self._area_codes = {area: i for i, area in enumerate(self.areas)}
+        self._cobenefit_codes = {cobenefit: i for i, cobenefit in enumerate(self.cobenefits)}
+
+    def __repr__(self):
+        return (f"CobenefitTensor({len(self.areas)} areas x {len(self.cobenefits)} co-benefits x "
+                f"{len(self.years)} years)")
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    ##### BUILD / SAVE / LOAD
+    @classmethod
+    def from_long_table(cls, l2data, year_cols=None, area_col='LSOA code', cobenefit_col='co-benefit_type'):
+        """
+        Build the tensor from the long table (one row per area and co-benefit type,
+        one column per year). Missing (area, co-benefit) pairs are NaN.
+        """
+        if year_cols is None:
+            year_cols = [col for col in l2data.columns if str(col).isdigit()]
+
+        areas = sorted(l2data[area_col].astype(str).unique())
+        cobenefits = sorted(l2data[cobenefit_col].astype(str).unique())
+
+        area_idx = pd.Categorical(l2data[area_col].astype(str), categories=areas).codes
+        cobenefit_idx = pd.Categorical(l2data[cobenefit_col].astype(str), categories=cobenefits).codes
+
+        values = np.full((len(areas), len(cobenefits), len(year_cols)), np.nan)
+        values[area_idx, cobenefit_idx, :] = l2data[year_cols].to_numpy(dtype=float)
+
+        return cls(values, areas, cobenefits, year_cols)
+
+    def save(self, path):
+        """
+        Save the values as a .npy file (memory-mappable) and the axes as a JSON sidecar
+        next to it (`<path>.axes.json`).
+        """
+        np.save(path, np.ascontiguousarray(self.values))
+        with open(axes_path(path), "w") as f:
+            json.dump({"areas": self.areas, "cobenefits": self.cobenefits, "years": self.years}, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        """
+        Load a saved tensor. By default the values are memory-mapped read-only, so only
+        the slices actually used are read from disk.
+        """
+        with open(axes_path(path)) as f:
+            axes = json.load(f)
+        values = np.load(path, mmap_mode=mmap_mode)
+        return cls(values, axes["areas"], axes["cobenefits"], axes["years"])
+
+    ##### AXIS CODES
+    def area_index(self, areas=None):
+        """Integer positions of `areas` on axis 0 (all areas if None)."""
+        if areas is None:
+            return slice(None)
+        return np.array([self._area_codes[str(area)] for area in areas], dtype=int)
+
+    def cobenefit_index(self, cobenefits=None):
+        """Integer positions of `cobenefits` on axis 1 (a single name gives a scalar)."""
+        if cobenefits is None:
+            return slice(None)
+        if isinstance(cobenefits, str):
+            return self._cobenefit_codes[cobenefits]
+        return np.array([self._cobenefit_codes[cobenefit] for cobenefit in cobenefits], dtype=int)
+
+    def year_index(self, years=None):
+        """
+        Positions of `years` on axis 2: None for all years, a (first, last) tuple for an
+        inclusive range, or a list of years.
+        """
+        if years is None:
+            return slice(None)
+        if isinstance(years, tuple):
+            first, last = years
+            return slice(self.years.index(int(first)), self.years.index(int(last)) + 1)
+        return np.array([self.years.index(int(year)) for year in years], dtype=int)
+
+    def select_years(self, years=None):
+        """Years (as integers) matching `years`, in axis order."""
+        return list(np.asarray(self.years)[self.year_index(years)])
+
+    ##### SLICING
+    def select(self, areas=None, cobenefits=None, years=None):
+        """
+        Values for the requested areas, co-benefits and years.
+
+        Each argument is None (everything), a list of labels, or (years only) an inclusive
+        (first, last) range. A single co-benefit name drops that axis.
+        """
+        values = self.values[self.area_index(areas)]
+        values = values[:, self.cobenefit_index(cobenefits)]
+        return values[..., self.year_index(years)]
+
+    def total_by_year(self, cobenefits=None, areas=None, years=None):
+        """
+        Sum over areas: (n_cobenefits, n_years) array, or (n_years,) for a single co-benefit.
+        """
+        return np.nansum(self.select(areas, cobenefits, years), axis=0)
+
+    def total_by_area(self, cobenefits=None, areas=None, years=None):
+        """
+        Sum over years: (n_areas, n_cobenefits) array, or (n_areas,) for a single co-benefit.
+        """
+        return np.nansum(self.select(areas, cobenefits, years), axis=-1)
+
+    def by_year_frame(self, cobenefits=None, areas=None, years=None):
+        """
+        City-wide totals as a DataFrame: one row per co-benefit, one column per year
+        (year labels as strings, matching the long table).
+        """
+        if cobenefits is None:
+            cobenefits = self.cobenefits
+        return pd.DataFrame(
+            self.total_by_year(list(cobenefits), areas, years),
+            index=pd.Index(list(cobenefits), name='co-benefit_type'),
+            columns=[str(year) for year in self.select_years(years)]
+        )
+
+
+def axes_path(path):
+    """Path of the JSON file holding the axes of the tensor saved at `path`."""
+    return f"{path}.axes.json"
@@ -0,0 +1,417 @@
+import os
+import glob
+import json
+import streamlit as st
+import pandas as pd
+import geopandas as gpd
+import pyarrow.parquet as pq
+from cobenefit_tensor import CobenefitTensor, axes_path
+from rollup_cube import build_rollup_cube, cube_matrix, ALL_QUINTILES, TOTAL_YEAR
+from data_quality import profile_long_table
+from stats_engine import GroupTests
+from inequality import inequality_metrics, add_rank, std_columns, RANK_COL
+from spatial_stats import add_smoothed_rates
+from resampling import permutation_anova, kruskal_wallis, bootstrap_medians, N_RESAMPLES
+
+
+# Parquet artifacts written by python_code/data_prep.py; the CSV files are the fallback
+L2DATA_TOTALS_PATH = "data/l2data_totals.parquet"
+L2DATA_TIME_PATH = "data/lsoa_cardiff_wimd.parquet"
+L2DATA_TOTALS_CSV_PATH = "data/l2data_totals.csv"
+L2DATA_TIME_CSV_PATH = "data/lsoa_cardiff_wimd.csv"
+CARDIFF_SHAPEFILE_PATH = "data/cardiff_shapefile/cardiff_lsoa.shp"
+COBENEFIT_TENSOR_PATH = "data/cobenefit_tensor.npy"
+ROLLUP_CUBE_PATH = "data/rollup_cube.parquet"
+# data-quality profiles: Cardiff build, and the merged report of the partitioned build
+DATA_QUALITY_PATH = "data/data_quality.parquet"
+NATIONAL_DATA_QUALITY_PATH = "data/partitions/data_quality.parquet"
+# inequality metrics and curves: Cardiff build, and every local authority of the partitioned build
+INEQUALITY_PATH = "data/inequality.parquet"
+INEQUALITY_CURVES_PATH = "data/inequality_curves.parquet"
+NATIONAL_INEQUALITY_PATH = "data/partitions/inequality.parquet"
+NATIONAL_INEQUALITY_CURVES_PATH = "data/partitions/inequality_curves.parquet"
+# EPSG:4326 GeoParquet geometry at several simplification levels (python_code/geography_cardiff.py)
+CARDIFF_GEOMETRY_DIR = "data/cardiff_geometry"
+GEOMETRY_LEVELS_FILE = "levels.json"
+TOPOLOGY_FILE = "lsoa_topology.json"
+
+
+##### FILE VERSIONS
+def file_version(path):
+    """
+    Version token for a file on disk: (modification time in ns, size in bytes).
+
+    A shapefile is made of several sidecar files (.shp, .dbf, .shx, ...), so for
+    those the token covers every file sharing the same stem.
+    """
+    stem, ext = os.path.splitext(path)
+    if ext.lower() == ".shp":
+        paths = sorted(glob.glob(glob.escape(stem) + ".*"))
+    else:
+        paths = [path]
+
+    version = []
+    for p in paths:
+        stat = os.stat(p)
+        version.append((os.path.basename(p), stat.st_mtime_ns, stat.st_size))
+    return tuple(version)
+
+
+##### CACHED READERS
+# The readers below are cached once per process with st.cache_resource, so the
+# same objects are shared between every session and every rerun.
+# The file version is part of the cache key: when a file changes on disk the next
+# call misses the cache and the stale entry is evicted (max_entries).
+# Returned frames are shared: treat them as read-only and .copy() before modifying.
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def _read_table(path, version, columns=None):
+    if path.endswith(".parquet"):
+        # memory-mapped read of the requested columns only
+        table = pq.read_table(path, columns=list(columns) if columns else None, memory_map=True)
+        return table.to_pandas()
+    return pd.read_csv(path, usecols=list(columns) if columns else None)
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _read_shapefile(path, version, epsg):
+    gdf = gpd.read_file(path).to_crs(epsg=epsg)
+    gdf["small_area"] = gdf["small_area"].astype(str).str.strip()
+    return gdf
+
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def _read_geoparquet(path, version):
+    # already in EPSG:4326, no reprojection needed
+    gdf = gpd.read_parquet(path)
+    gdf["small_area"] = gdf["small_area"].astype(str).str.strip()
+    gdf.attrs["dataset_version"] = (path, version)
+    return gdf
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _read_levels(path, version):
+    with open(path) as f:
+        return json.load(f)
+
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def _read_topology(path, version):
+    with open(path) as f:
+        topology = json.load(f)
+    topology["dataset_version"] = (path, version)
+    return topology
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _merge_geodata(shapefile_path, shapefile_version, totals_path, totals_version, epsg):
+    if shapefile_path.endswith(".parquet"):
+        gdf = _read_geoparquet(shapefile_path, shapefile_version)
+    else:
+        gdf = _read_shapefile(shapefile_path, shapefile_version, epsg)
+    totals = _smoothed_totals(totals_path, totals_version, *_smoothing_geometry())
+
+    # Merge population data with geometry
+    merged = gdf.merge(
+        totals.rename(columns={"LSOA code": "small_area"}),
+        on="small_area",
+        how="left"
+    )
+    merged.attrs["dataset_version"] = (shapefile_version, totals_version, epsg)
+    return merged
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _smoothed_totals(totals_path, totals_version, shapefile_path, shapefile_version):
+    totals = _read_table(totals_path, totals_version)
+    # _std columns without their smoothed _std_eb version (totals built before the smoothing)
+    missing = [col[:-len('_std')] for col in std_columns(totals)
+               if f'{col}_eb' not in totals.columns and col[:-len('_std')] in totals.columns]
+    if not missing:
+        return totals
+    if shapefile_path is None:
+        # no neighbours to smooth with: empty columns, so the pages hide the smoothed rates
+        return totals.assign(**{f'{col}_std_eb': float('nan') for col in missing})
+    areas = _read_shapefile(shapefile_path, shapefile_version, 4326)
+    return add_smoothed_rates(totals, areas, missing, scale=1000000)
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _load_tensor(path, version):
+    return CobenefitTensor.load(path)
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _tensor_from_long_table(path, version):
+    return CobenefitTensor.from_long_table(_read_table(path, version))
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _cube_from_long_table(path, version):
+    return build_rollup_cube(_read_table(path, version))
+
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def _cube_year_matrix(cube_source, local_authority, quintile, _cube):
+    years = sorted(year for year in _cube['year'].unique() if year != TOTAL_YEAR) + [TOTAL_YEAR]
+    return cube_matrix(_cube, local_authority=local_authority, quintile=quintile, years=years)
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _group_tests(path, version, group_col):
+    return GroupTests(_read_table(path, version), group_col)
+
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def _resampling_tests(path, version, group_col, value_col, n_resamples, seed):
+    data = _read_table(path, version)
+    values, groups = data[value_col], data[group_col]
+    return {
+        'permutation_anova': permutation_anova(values, groups, n_resamples=n_resamples, seed=seed),
+        'kruskal_wallis': kruskal_wallis(values, groups, n_resamples=n_resamples, seed=seed),
+        'bootstrap': bootstrap_medians(values, groups, n_resamples=n_resamples, seed=seed),
+    }
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _inequality_from_tables(totals_path, totals_version, long_path, long_version):
+    totals = _read_table(totals_path, totals_version)
+    if RANK_COL not in totals.columns:
+        # totals written before the rank was added: take it from the long table
+        totals = add_rank(totals, _read_table(long_path, long_version, ('LSOA code', RANK_COL)))
+    return inequality_metrics(totals)
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _profile_from_long_table(path, version):
+    return profile_long_table(_read_table(path, version))
+
+
+def resolve_path(path, fallback_path):
+    """
+    Return `path` if it exists, otherwise `fallback_path` (e.g. the CSV copy when
+    the parquet artifacts have not been built yet).
+    """
+    if os.path.exists(path):
+        return path
+    return fallback_path
+
+
+def _smoothing_geometry():
+    """
+    (path, version) of the full resolution Cardiff shapefile giving the neighbours of the
+    smoothed rates, or (None, None) if it is missing.
+    """
+    if not os.path.exists(CARDIFF_SHAPEFILE_PATH):
+        return None, None
+    return CARDIFF_SHAPEFILE_PATH, file_version(CARDIFF_SHAPEFILE_PATH)
+
+
+def load_l2data_totals(path=None, columns=None):
+    """
+    Wide table of LSOA totals (one row per LSOA, one column per co-benefit, its _std version
+    and its smoothed _std_eb version, see spatial_stats.smoothed_rates).
+    Shared between sessions: do not modify in place.
+
+    Parameters:
+    - path: parquet or CSV file (if None, uses the parquet artifact, falling back to the CSV)
+    - columns: optional list of columns to read (only those columns are decoded)
+
+    Tables built before the smoothing get their _std_eb columns computed once per version
+    of the table (not when `columns` are given).
+    """
+    if path is None:
+        path = resolve_path(L2DATA_TOTALS_PATH, L2DATA_TOTALS_CSV_PATH)
+    if columns:
+        return _read_table(path, file_version(path), tuple(columns))
+    return _smoothed_totals(path, file_version(path), *_smoothing_geometry())
+
+
+def load_quintile_tests(path=None, quintile_col='WIMD 2025 overall quintile'):
+    """
+    ANOVA of every numeric column of the totals table across WIMD quintiles (see
+    stats_engine.GroupTests), computed once per version of the table; the post-hoc
+    tables are computed on first use and kept with it.
+    Shared between sessions: do not modify in place.
+
+    Parameters:
+    - path: parquet or CSV file (if None, uses the parquet artifact, falling back to the CSV)
+    - quintile_col: grouping column
+    """
+    if path is None:
+        path = resolve_path(L2DATA_TOTALS_PATH, L2DATA_TOTALS_CSV_PATH)
+    return _group_tests(path, file_version(path), quintile_col)
+
+
+def load_resampling_tests(value_col, path=None, quintile_col='WIMD 2025 overall quintile',
+                          n_resamples=N_RESAMPLES, seed=0):
+    """
+    Resampling tests of `value_col` across WIMD quintiles (see resampling.py): permutation
+    ANOVA, Kruskal-Wallis and bootstrap confidence intervals of the quintile medians and of
+    their gaps to quintile 1. Computed once per version of the table, column and seed.
+    Shared between sessions: do not modify in place.
+    """
+    if path is None:
+        path = resolve_path(L2DATA_TOTALS_PATH, L2DATA_TOTALS_CSV_PATH)
+    return _resampling_tests(path, file_version(path), quintile_col, value_col, n_resamples, seed)
+
+
+def load_l2data_time(path=None, columns=None):
+    """
+    Long table of yearly co-benefit values (one row per LSOA and co-benefit type).
+    Shared between sessions: do not modify in place.
+
+    Parameters:
+    - path: parquet or CSV file (if None, uses the parquet artifact, falling back to the CSV)
+    - columns: optional list of columns to read (only those columns are decoded)
+    """
+    if path is None:
+        path = resolve_path(L2DATA_TIME_PATH, L2DATA_TIME_CSV_PATH)
+    return _read_table(path, file_version(path), tuple(columns) if columns else None)
+
+
+def geometry_level_path(zoom=None, directory=CARDIFF_GEOMETRY_DIR):
+    """
+    GeoParquet file of the coarsest simplification level drawn at `zoom` (the full
+    resolution level if zoom is None), or None if the levels have not been built.
+    """
+    levels_path = os.path.join(directory, GEOMETRY_LEVELS_FILE)
+    if not os.path.exists(levels_path):
+        return None
+    levels = _read_levels(levels_path, file_version(levels_path))
+
+    # levels are sorted from coarsest to finest
+    level = levels[-1]
+    if zoom is not None:
+        level = next((lvl for lvl in levels if lvl["min_zoom"] <= zoom < lvl["max_zoom"]), levels[-1])
+    path = os.path.join(directory, level["file"])
+    return path if os.path.exists(path) else None
+
+
+def load_area_geometry(zoom=None, directory=CARDIFF_GEOMETRY_DIR):
+    """
+    LSOA geometries (small_area + geometry, EPSG:4326) simplified for `zoom`, or None if
+    the geometry levels have not been built (callers then keep the shapefile geometry).
+    Shared between sessions: do not modify in place.
+    """
+    path = geometry_level_path(zoom, directory)
+    if path is None:
+        return None
+    return _read_geoparquet(path, file_version(path))
+
+
+def load_topology(directory=CARDIFF_GEOMETRY_DIR):
+    """
+    Shared-arc topology of the full resolution LSOA geometry (see map_geometry.build_topology),
+    or None if it has not been built. Shared between sessions: do not modify in place.
+    """
+    path = os.path.join(directory, TOPOLOGY_FILE)
+    if not os.path.exists(path):
+        return None
+    return _read_topology(path, file_version(path))
+
+
+def load_cardiff_gdf(shapefile_path=None, totals_path=None, epsg=4326):
+    """
+    Cardiff LSOA geometries in `epsg`, merged with the LSOA totals.
+    Shared between sessions: call .copy() before adding columns.
+
+    If shapefile_path is None, the full resolution EPSG:4326 GeoParquet level is used
+    when it exists (no reprojection), otherwise the Cardiff shapefile.
+    """
+    if shapefile_path is None:
+        shapefile_path = CARDIFF_SHAPEFILE_PATH
+        if epsg == 4326:
+            shapefile_path = geometry_level_path() or CARDIFF_SHAPEFILE_PATH
+    if totals_path is None:
+        totals_path = resolve_path(L2DATA_TOTALS_PATH, L2DATA_TOTALS_CSV_PATH)
+    return _merge_geodata(
+        shapefile_path, file_version(shapefile_path),
+        totals_path, file_version(totals_path),
+        epsg
+    )
+
+
+def load_cobenefit_tensor(path=COBENEFIT_TENSOR_PATH):
+    """
+    (area, co-benefit, year) tensor of the yearly co-benefit values, memory-mapped from
+    the artifact written by data_prep.py, or built from the long table if it is missing.
+    Shared between sessions: do not modify in place.
+    """
+    if os.path.exists(path) and os.path.exists(axes_path(path)):
+        return _load_tensor(path, file_version(path) + file_version(axes_path(path)))
+
+    long_path = resolve_path(L2DATA_TIME_PATH, L2DATA_TIME_CSV_PATH)
+    return _tensor_from_long_table(long_path, file_version(long_path))
+
+
+def load_rollup_cube(path=ROLLUP_CUBE_PATH):
+    """
+    Rollup cube of sums, counts and population-weighted means over
+    (local authority, WIMD quintile, co-benefit, year), read from the artifact written
+    by data_prep.py, or built from the long table if it is missing.
+    Shared between sessions: do not modify in place.
+    """
+    cube_source = _rollup_cube_source(path)
+    if cube_source[0] == path:
+        return _read_table(*cube_source)
+    return _cube_from_long_table(*cube_source)
+
+
+def _rollup_cube_source(path):
+    # (path, version) of the cube artifact, or of the long table it is built from
+    if os.path.exists(path):
+        return path, file_version(path)
+    long_path = resolve_path(L2DATA_TIME_PATH, L2DATA_TIME_CSV_PATH)
+    return long_path, file_version(long_path)
+
+
+def load_cobenefit_matrix(local_authority=None, quintile=ALL_QUINTILES, path=ROLLUP_CUBE_PATH):
+    """
+    Co-benefit x year matrix of summed values (£ million), read out of the rollup cube once
+    per dataset version: one row per co-benefit type, one column per year, then TOTAL_YEAR.
+
+    Parameters:
+    - local_authority: local authority name (if None, the only one in the cube, otherwise the national rollup)
+    - quintile: WIMD quintile 1-5, or ALL_QUINTILES
+    - path: rollup cube artifact
+
+    Shared between sessions: do not modify in place.
+    """
+    return _cube_year_matrix(_rollup_cube_source(path), local_authority, quintile, load_rollup_cube(path))
+
+
+def load_inequality():
+    """
+    Inequality metrics (concentration index, Gini, Theil) and Lorenz / concentration curves
+    of the _std columns by local authority, see inequality.py: returns (metrics, curves).
+
+    Read from the partitioned build if it exists (every local authority plus the national
+    rollup), else from the Cardiff artifacts, else computed once per version of the tables.
+    Shared between sessions: do not modify in place.
+    """
+    for path, curves_path in ((NATIONAL_INEQUALITY_PATH, NATIONAL_INEQUALITY_CURVES_PATH),
+                              (INEQUALITY_PATH, INEQUALITY_CURVES_PATH)):
+        if os.path.exists(path) and os.path.exists(curves_path):
+            return _read_table(path, file_version(path)), _read_table(curves_path, file_version(curves_path))
+
+    totals_path = resolve_path(L2DATA_TOTALS_PATH, L2DATA_TOTALS_CSV_PATH)
+    long_path = resolve_path(L2DATA_TIME_PATH, L2DATA_TIME_CSV_PATH)
+    return _inequality_from_tables(totals_path, file_version(totals_path), long_path, file_version(long_path))
+
+
+def load_quality_profile():
+    """
+    Data-quality profile (zero, null and negative counts, min and max per local authority,
+    co-benefit and column, see data_quality.py).
+
+    Read from the report of the partitioned build if it exists (every local authority plus
+    the national rollup), else from the Cardiff artifact, else computed once per version of
+    the long table. Shared between sessions: do not modify in place.
+    """
+    for path in (NATIONAL_DATA_QUALITY_PATH, DATA_QUALITY_PATH):
+        if os.path.exists(path):
+            return _read_table(path, file_version(path))
+
+    long_path = resolve_path(L2DATA_TIME_PATH, L2DATA_TIME_CSV_PATH)
+    return _profile_from_long_table(long_path, file_version(long_path))
@@ -0,0 +1,187 @@
+import numpy as np
+import pandas as pd
+from rollup_cube import ALL_LOCAL_AUTHORITIES
+
+
+# one row per (local authority, co-benefit, column); counts are additive and min/max merge
+# with min/max, so profiles of partitions (e.g. local authorities) merge without rescanning rows
+PROFILE_KEYS = ['local_authority', 'co-benefit_type', 'column']
+PROFILE_COUNTS = ['rows', 'zeros', 'nulls', 'negatives']
+PROFILE_EXTREMES = ['min', 'max']
+
+# attribute columns of the long table checked for missing values (e.g. failed WIMD joins)
+ATTRIBUTE_COLS = ['population', 'households', 'LSOA code', 'LSOA name (Eng)',
+                  'WIMD 2025 overall rank ', 'WIMD 2025 overall decile', 'WIMD 2025 overall quintile']
+
+
+def profile_rows(values, groups, columns, group_names=None, local_authority="Cardiff"):
+    """
+    Profile a (rows x columns) block grouped by `groups`, in one vectorised pass.
+
+    Parameters:
+    - values: DataFrame or 2-D array (n_rows, n_columns)
+    - groups: array of group labels (one per row), e.g. the co-benefit type
+    - columns: names of the columns of `values`
+    - group_names: optional order of the groups (default: sorted labels)
+    - local_authority: geography the rows belong to (stored in the profile)
+
+    Returns a DataFrame with one row per (local_authority, co-benefit_type, column): rows, zeros, nulls,
+    negatives, min and max. Zeros, negatives, min and max are missing for non-numeric columns.
+    """
+    frame = values if isinstance(values, pd.DataFrame) else pd.DataFrame(values, columns=columns)
+    codes, labels = pd.factorize(pd.Series(groups).astype(str), sort=True)
+    if group_names is not None:
+        codes = pd.Categorical(pd.Series(groups).astype(str), categories=list(group_names)).codes
+        labels = list(group_names)
+
+    # sort rows by group, so every statistic is one reduceat over contiguous blocks
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+    present = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]]) if len(order) else np.array([], dtype=int)
+    present_groups = sorted_codes[present]
+
+    n_groups, n_cols = len(labels), len(columns)
+    rows = np.zeros(n_groups, dtype=np.int64)
+    zeros = np.zeros((n_groups, n_cols))
+    nulls = np.zeros((n_groups, n_cols))
+    negatives = np.zeros((n_groups, n_cols))
+    minimum = np.full((n_groups, n_cols), np.nan)
+    maximum = np.full((n_groups, n_cols), np.nan)
+
+    numeric = np.array([pd.api.types.is_numeric_dtype(frame[col]) for col in columns], dtype=bool)
+    if len(order):
+        rows[present_groups] = np.diff(np.r_[present, len(order)])
+        nulls[present_groups] = np.add.reduceat(frame[list(columns)].isna().to_numpy()[order], present, axis=0)
+
+        numeric_cols = [col for col, is_numeric in zip(columns, numeric) if is_numeric]
+        if numeric_cols:
+            x = frame[numeric_cols].to_numpy(dtype=float)[order]
+            zeros[np.ix_(present_groups, numeric)] = np.add.reduceat(x == 0, present, axis=0)
+            negatives[np.ix_(present_groups, numeric)] = np.add.reduceat(x < 0, present, axis=0)
+            # fmin/fmax ignore NaN (all-NaN blocks stay NaN)
+            minimum[np.ix_(present_groups, numeric)] = np.fmin.reduceat(x, present, axis=0)
+            maximum[np.ix_(present_groups, numeric)] = np.fmax.reduceat(x, present, axis=0)
+
+    zeros[:, ~numeric] = np.nan
+    negatives[:, ~numeric] = np.nan
+
+    profile = pd.DataFrame({
+        'local_authority': local_authority,
+        'co-benefit_type': np.repeat(np.asarray(labels, dtype=object), n_cols),
+        'column': np.tile(np.asarray(columns, dtype=object), n_groups),
+        'rows': np.repeat(rows, n_cols),
+        'zeros': zeros.ravel(),
+        'nulls': nulls.ravel(),
+        'negatives': negatives.ravel(),
+        'min': minimum.ravel(),
+        'max': maximum.ravel(),
+    })
+    return _finish_profile(profile)
+
+
+def _finish_profile(profile):
+    for col in PROFILE_COUNTS:
+        profile[col] = profile[col].astype('Int64')
+    return profile[PROFILE_KEYS + PROFILE_COUNTS + PROFILE_EXTREMES].reset_index(drop=True)
+
+
+def profile_long_table(l2data, value_cols=None, attribute_cols=None, group_col='co-benefit_type',
+                       local_authority="Cardiff"):
+    """
+    Data-quality profile of the long table (one row per area and co-benefit type).
+
+    Parameters:
+    - l2data: long table
+    - value_cols: value columns (if None, every all-digit year column plus 'sum')
+    - attribute_cols: other columns checked for missing values (if None, ATTRIBUTE_COLS present in the table)
+    - group_col: grouping column
+    - local_authority: geography of the table (stored in the profile)
+    """
+    if value_cols is None:
+        value_cols = [col for col in l2data.columns if str(col).isdigit()]
+        value_cols += ['sum'] if 'sum' in l2data.columns else []
+    if attribute_cols is None:
+        attribute_cols = [col for col in ATTRIBUTE_COLS if col in l2data.columns]
+
+    columns = list(value_cols) + list(attribute_cols)
+    return profile_rows(l2data[columns], l2data[group_col].to_numpy(), columns, local_authority=local_authority)
+
+
+def profile_tensor(tensor, local_authority="Cardiff"):
+    """
+    Data-quality profile of a CobenefitTensor (area x co-benefit x year).
+    An (area, co-benefit) pair counts as a row when it has at least one non-missing year.
+    """
+    n_areas, n_cobenefits, n_years = tensor.shape
+    # (co-benefit, area, year) -> one row per (co-benefit, area)
+    values = np.asarray(tensor.values).transpose(1, 0, 2).reshape(n_cobenefits * n_areas, n_years)
+    groups = np.repeat(np.asarray(tensor.cobenefits, dtype=object), n_areas)
+
+    present = ~np.all(np.isnan(values), axis=1)
+    return profile_rows(values[present], groups[present], [str(year) for year in tensor.years],
+                        group_names=sorted(tensor.cobenefits), local_authority=local_authority)
+
+
+def _combine(profile, keys):
+    grouped = profile.groupby(keys, sort=False)
+    merged = grouped[PROFILE_COUNTS].sum(min_count=1)
+    merged['min'] = grouped['min'].min()
+    merged['max'] = grouped['max'].max()
+    return merged.reset_index()
+
+
+def merge_profiles(profiles):
+    """
+    Merge the profiles of several partitions (e.g. one per local authority) and add the
+    ALL_LOCAL_AUTHORITIES rollup: counts are added, min/max are combined.
+    """
+    profile = pd.concat(profiles, ignore_index=True)
+    profile = _combine(profile[profile['local_authority'] != ALL_LOCAL_AUTHORITIES], PROFILE_KEYS)
+
+    national = _combine(profile, PROFILE_KEYS[1:])
+    national['local_authority'] = ALL_LOCAL_AUTHORITIES
+    return _finish_profile(pd.concat([profile, national], ignore_index=True))
+
+
+def geography_profile(profile, local_authorities=None, name=None):
+    """
+    Profile of one geography, read out of a (merged) profile without rescanning rows.
+
+    Parameters:
+    - profile: from profile_long_table / merge_profiles
+    - local_authorities: a local authority name, a list of them (merged into one region),
+      or None for the only one in the profile, otherwise ALL_LOCAL_AUTHORITIES
+    - name: local_authority label of a merged region (default: the names joined with ', ')
+    """
+    if local_authorities is None:
+        names = profile['local_authority'].unique()
+        local_authorities = names[0] if len(names) == 1 else ALL_LOCAL_AUTHORITIES
+    if isinstance(local_authorities, str):
+        return profile[profile['local_authority'] == local_authorities].reset_index(drop=True)
+
+    region = _combine(profile[profile['local_authority'].isin(local_authorities)], PROFILE_KEYS[1:])
+    region['local_authority'] = name or ", ".join(local_authorities)
+    return _finish_profile(region)
+
+
+def quality_table(profile, stat='zeros', percent=True, columns=None):
+    """
+    Co-benefit x column table of one statistic of the profile of one geography.
+
+    Parameters:
+    - profile: from profile_long_table / profile_tensor / geography_profile
+    - stat: 'zeros', 'nulls', 'negatives', 'min' or 'max'
+    - percent: for counts, show the percentage of rows instead of the count
+    - columns: columns to show, in this order (default: the year columns, then 'sum')
+    """
+    values = profile[stat].astype(float)
+    if percent and stat in PROFILE_COUNTS:
+        values = 100 * values / profile['rows'].astype(float)
+
+    table = profile.assign(value=values).pivot(index='co-benefit_type', columns='column', values='value')
+    if columns is None:
+        years = sorted(col for col in table.columns if str(col).isdigit())
+        columns = years + (['sum'] if 'sum' in table.columns else [])
+    table = table[list(columns)]
+    table.columns.name = None
+    return table
@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+
+
+##### HISTOGRAM BINNING
+# Histograms are binned here and drawn as bars, so the chart only carries bin edges and
+# counts instead of every value.
+BINNING_RULES = ('fixed', 'fd', 'quantile')
+
+
+def bin_edges(values, rule='fd', bins=None, bin_width=None):
+    """
+    Histogram bin edges for `values` (NaN ignored).
+
+    Parameters:
+    - values: array-like of values
+    - rule: 'fixed' (equal-width bins: `bins` of them, or `bin_width` wide),
+      'fd' (Freedman-Diaconis width 2 * IQR / n^(1/3)) or
+      'quantile' (equal-count bins: `bins` of them)
+    - bins: number of bins for 'fixed' (default 20) and 'quantile' (default 10)
+    - bin_width: bin width for 'fixed'
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)]
+    if values.size == 0:
+        return np.array([0.0, 1.0])
+
+    lo, hi = values.min(), values.max()
+    if hi == lo:
+        return np.array([lo - 0.5, hi + 0.5])
+
+    if rule == 'fixed':
+        if bin_width is not None:
+            start = np.floor(lo / bin_width) * bin_width
+            n_bins = max(1, int(np.ceil((hi - start) / bin_width)))
+            return start + bin_width * np.arange(n_bins + 1)
+        return np.linspace(lo, hi, (bins or 20) + 1)
+
+    if rule == 'fd':
+        q1, q3 = np.percentile(values, [25, 75])
+        width = 2 * (q3 - q1) / values.size ** (1 / 3)
+        if width <= 0:
+            return np.linspace(lo, hi, 21)
+        # cap the bin count, long-tailed columns would otherwise get thousands of bins
+        n_bins = int(min(200, max(1, np.ceil((hi - lo) / width))))
+        return np.linspace(lo, hi, n_bins + 1)
+
+    if rule == 'quantile':
+        edges = np.quantile(values, np.linspace(0, 1, (bins or 10) + 1))
+        return np.unique(edges)
+
+    raise ValueError(f"Unknown binning rule {rule!r}, expected one of {BINNING_RULES}")
+
+
+def histogram_bins(values, rule='fd', bins=None, bin_width=None):
+    """
+    Bin `values` server-side.
+
+    Returns a DataFrame with one row per bin: left, right, centre, width and count
+    (the last bin includes its right edge, as in numpy.histogram).
+    """
+    values = np.asarray(values, dtype=float)
+    edges = bin_edges(values, rule=rule, bins=bins, bin_width=bin_width)
+    counts, edges = np.histogram(values[np.isfinite(values)], bins=edges)
+    return pd.DataFrame({
+        'left': edges[:-1],
+        'right': edges[1:],
+        'centre': (edges[:-1] + edges[1:]) / 2,
+        'width': np.diff(edges),
+        'count': counts,
+    })
+
+
+##### BOX PLOT SUMMARIES
+def box_summary(values, groups):
+    """
+    Box plot statistics of `values` per group, in one grouped pass.
+
+    Quartiles use linear interpolation (Plotly's default quartile method); the fences are
+    the most extreme values within 1.5 IQR of the box (Tukey whiskers), as Plotly draws them.
+
+    Returns:
+    - summary: DataFrame indexed by group with count, q1, median, q3, mean, lowerfence, upperfence
+    - outliers: DataFrame (group, value) of the values outside the fences
+    """
+    frame = pd.DataFrame({'group': np.asarray(groups), 'value': np.asarray(values, dtype=float)}).dropna()
+    grouped = frame.groupby('group')['value']
+
+    summary = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    summary.columns = ['q1', 'median', 'q3']
+    summary.insert(0, 'count', grouped.size())
+    summary['mean'] = grouped.mean()
+
+    # whisker limits per row, then the extreme values inside them per group
+    iqr = summary['q3'] - summary['q1']
+    low_limit = frame['group'].map(summary['q1'] - 1.5 * iqr)
+    high_limit = frame['group'].map(summary['q3'] + 1.5 * iqr)
+    inside = (frame['value'] >= low_limit) & (frame['value'] <= high_limit)
+
+    fences = frame[inside].groupby('group')['value'].agg(['min', 'max'])
+    summary['lowerfence'] = fences['min']
+    summary['upperfence'] = fences['max']
+
+    outliers = frame.loc[~inside, ['group', 'value']].reset_index(drop=True)
+    return summary, outliers
@@ -0,0 +1,177 @@
+import numpy as np
+import pandas as pd
+from rollup_cube import ALL_LOCAL_AUTHORITIES
+
+
+# WIMD rank (1 = most deprived); the header has a trailing space in the source workbook
+RANK_COL = 'WIMD 2025 overall rank '
+WEIGHT_COL = 'population'
+INEQUALITY_METRICS = ['concentration_index', 'gini', 'theil']
+# population shares at which the Lorenz and concentration curves are stored
+CURVE_POINTS = np.linspace(0, 1, 21)
+
+
+def std_columns(data):
+    """Per-person co-benefit columns (the _std columns) of a totals table."""
+    return [col for col in data.columns if str(col).endswith('_std')]
+
+
+def add_rank(totals, l2data, rank_col=RANK_COL, area_col='LSOA code'):
+    """Totals table with the deprivation rank joined from the long table, if it is missing."""
+    if rank_col in totals.columns:
+        return totals
+    ranks = l2data[[area_col, rank_col]].drop_duplicates(area_col)
+    return totals.merge(ranks, on=area_col, how='left')
+
+
+def _segment_cumsum(x, starts, segment):
+    """Cumulative sum of the rows of `x`, restarting at every segment start."""
+    total = np.cumsum(x, axis=0)
+    before = np.vstack([np.zeros((1,) + x.shape[1:]), total])[starts]
+    return total - before[segment]
+
+
+def _rank_index(y, w, starts, segment, totals, means):
+    """
+    Rank-dependent index 2 * cov_w(y, R) / mean for every segment and column, where the rows
+    are sorted by the ranking variable within each segment and R is the fractional rank
+    (population share of the rows ranked before, plus half of the row's own share).
+    Ranked by deprivation this is the concentration index, ranked by y itself the Gini.
+    """
+    fractional_rank = (_segment_cumsum(w, starts, segment) - w / 2) / totals[segment]
+    covariance = np.add.reduceat(w * (y - means[segment]) * (fractional_rank - 0.5), starts, axis=0) / totals
+    return 2 * covariance / means
+
+
+def _curve_points(y, w, starts, segment, totals, means, points=CURVE_POINTS):
+    """
+    Cumulative value share at the population shares `points`, per segment and column, for
+    rows sorted by the ranking variable within each segment. Shape (n_segments, len(points), n_columns).
+    """
+    population_share = _segment_cumsum(w, starts, segment) / totals[segment]
+    value_share = _segment_cumsum(w * y, starts, segment) / (totals * means)[segment]
+
+    # every curve starts at (0, 0); offsetting segment k by 2k makes all the curves of a
+    # column one increasing sequence, so a single np.interp per column reads them all
+    n_segments, n_columns = totals.shape
+    offsets = 2.0 * np.arange(n_segments)
+    curves = np.empty((n_segments, len(points), n_columns))
+    for j in range(n_columns):
+        x = np.concatenate([offsets, 2.0 * segment + population_share[:, j]])
+        v = np.concatenate([np.zeros(n_segments), value_share[:, j]])
+        order = np.argsort(x, kind='stable')
+        queries = (offsets[:, None] + points[None, :]).ravel()
+        curves[:, :, j] = np.interp(queries, x[order], v[order]).reshape(n_segments, len(points))
+    return curves
+
+
+def inequality_metrics(totals, value_cols=None, rank_col=RANK_COL, weight_col=WEIGHT_COL,
+                       la_col='local_authority', local_authority="Cardiff", include_all=False):
+    """
+    Population-weighted inequality of every value column, for every local authority at once.
+
+    The rows are sorted once by (local authority, deprivation rank) for the concentration
+    index and once per column by (local authority, value) for the Gini index, the Theil index
+    and the Lorenz curve; every sum is then a segmented reduction over the sorted rows.
+
+    - concentration_index: in [-1, 1], negative when the values are concentrated in the
+      most deprived areas, positive when in the least deprived areas
+    - gini: 0 (equal) to 1; a few negative values (e.g. in the net 'sum') can push it above 1,
+      so it is left out when the mean is not positive
+    - theil: 0 (equal) upwards, only for columns without negative values
+
+    Parameters:
+    - totals: one row per area, with the value columns, `rank_col` and `weight_col`
+    - value_cols: columns to measure (default: the _std columns)
+    - rank_col: deprivation rank (1 = most deprived); areas without a rank are left out
+    - weight_col: population weights
+    - la_col: local authority column, if present
+    - local_authority: name used when the table has no `la_col` column
+    - include_all: also add the ALL_LOCAL_AUTHORITIES rows (all areas together)
+
+    Returns (metrics, curves):
+    - metrics: one row per (local_authority, column) with mean (population-weighted),
+      population, areas, concentration_index, gini and theil
+    - curves: one row per (local_authority, column, curve, population_share) with the
+      value_share of the 'lorenz' (ranked by value) and 'concentration' (ranked by deprivation) curves
+    """
+    if value_cols is None:
+        value_cols = std_columns(totals)
+    value_cols = list(value_cols)
+
+    totals = totals[totals[rank_col].notna()]
+    la = totals[la_col].astype(str) if la_col in totals.columns else pd.Series(local_authority, index=totals.index)
+    if include_all:
+        totals = pd.concat([totals, totals], ignore_index=True)
+        la = pd.concat([la, pd.Series(ALL_LOCAL_AUTHORITIES, index=la.index)], ignore_index=True)
+    segment_codes, local_authorities = pd.factorize(la, sort=True)
+
+    values = totals[value_cols].to_numpy(dtype=float)
+    weights = totals[weight_col].to_numpy(dtype=float)
+    valid = ~np.isnan(values) & ~np.isnan(weights)[:, None] & (weights > 0)[:, None]
+    w = np.where(valid, weights[:, None], 0.0)
+    y = np.where(valid, values, 0.0)
+
+    # sorted by (local authority, deprivation rank)
+    order = np.lexsort((totals[rank_col].to_numpy(dtype=float), segment_codes))
+    segment = segment_codes[order]
+    starts = np.flatnonzero(np.r_[True, segment[1:] != segment[:-1]])
+
+    population = np.add.reduceat(w[order], starts, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.add.reduceat((w * y)[order], starts, axis=0) / population
+        concentration = _rank_index(y[order], w[order], starts, segment, population, means)
+        concentration_curve = _curve_points(y[order], w[order], starts, segment, population, means)
+
+        # sorted by (local authority, value), column by column
+        by_value = np.argsort(np.where(valid, values, np.inf), axis=0, kind='stable')
+        by_value = np.take_along_axis(by_value, np.argsort(segment_codes[by_value], axis=0, kind='stable'), axis=0)
+        y_sorted = np.take_along_axis(y, by_value, axis=0)
+        w_sorted = np.take_along_axis(w, by_value, axis=0)
+        gini = _rank_index(y_sorted, w_sorted, starts, segment, population, means)
+        lorenz_curve = _curve_points(y_sorted, w_sorted, starts, segment, population, means)
+
+        ratio = y / means[segment_codes]
+        theil_terms = np.where(ratio > 0, w * ratio * np.log(np.where(ratio > 0, ratio, 1.0)), 0.0)
+        theil = np.add.reduceat(theil_terms[order], starts, axis=0) / population
+
+    # the Gini needs a positive mean (e.g. not hassle costs), the Theil index positive values
+    has_negative = np.add.reduceat((valid & (values < 0))[order], starts, axis=0) > 0
+    gini[~(means > 0)] = np.nan
+    theil[has_negative | ~(means > 0)] = np.nan
+
+    n_segments, n_columns = population.shape
+    metrics = pd.DataFrame({
+        'local_authority': np.repeat(np.asarray(local_authorities, dtype=object), n_columns),
+        'column': np.tile(np.asarray(value_cols, dtype=object), n_segments),
+        'mean': means.ravel(),
+        'population': population.ravel(),
+        'areas': np.add.reduceat(valid[order], starts, axis=0).ravel(),
+        'concentration_index': concentration.ravel(),
+        'gini': gini.ravel(),
+        'theil': theil.ravel(),
+    })
+
+    curves = []
+    for name, points in (('lorenz', lorenz_curve), ('concentration', concentration_curve)):
+        if name == 'lorenz':
+            points = np.where((means > 0)[:, None, :], points, np.nan)
+        curves.append(pd.DataFrame({
+            'local_authority': np.repeat(np.asarray(local_authorities, dtype=object), len(CURVE_POINTS) * n_columns),
+            'column': np.tile(np.asarray(value_cols, dtype=object), n_segments * len(CURVE_POINTS)),
+            'curve': name,
+            'population_share': np.tile(np.repeat(CURVE_POINTS, n_columns), n_segments),
+            'value_share': points.ravel(),
+        }))
+    return metrics, pd.concat(curves, ignore_index=True)
+
+
+def league_table(metrics, column='sum_std', metric='concentration_index'):
+    """
+    Local authorities ranked by one inequality metric of one column (most unequal first,
+    by absolute value for the concentration index).
+    """
+    table = metrics[(metrics['column'] == column) & (metrics['local_authority'] != ALL_LOCAL_AUTHORITIES)]
+    table = table.assign(order=table[metric].abs()).sort_values('order', ascending=False).drop(columns='order')
+    table.insert(0, 'rank', np.arange(1, len(table) + 1))
+    return table.reset_index(drop=True)
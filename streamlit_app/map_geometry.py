@@ -0,0 +1,369 @@
+import hashlib
+import json
+import os
+import numpy as np
+import shapely
+
+
+class PolygonBuffers:
+    """
+    Columnar (binary) encoding of a polygon column: one flat coordinate buffer instead of
+    nested [[x, y], ...] lists, in the layout of deck.gl's binary polygon attributes.
+
+    Multi-polygons are split into one polygon per part; `feature_index` maps each
+    polygon back to its row.
+
+    Parameters:
+    - positions: float32 array (n_vertices * 2,) of interleaved x, y coordinates
+    - start_indices: int32 array (n_polygons + 1,), first vertex of each polygon
+    - ring_offsets: int32 array (n_rings + 1,), first vertex of each ring
+    - polygon_rings: int32 array (n_polygons + 1,), first ring of each polygon
+    - feature_index: int32 array (n_polygons,), row of the input each polygon belongs to
+    """
+    def __init__(self, positions, start_indices, ring_offsets, polygon_rings, feature_index):
+        self.positions = positions
+        self.start_indices = start_indices
+        self.ring_offsets = ring_offsets
+        self.polygon_rings = polygon_rings
+        self.feature_index = feature_index
+
+    def __repr__(self):
+        return (f"PolygonBuffers({len(self.feature_index)} polygons, "
+                f"{len(self.positions) // 2} vertices, {self.nbytes:,} bytes)")
+
+    @property
+    def nbytes(self):
+        return sum(buffer.nbytes for buffer in
+                   (self.positions, self.start_indices, self.ring_offsets, self.polygon_rings, self.feature_index))
+
+    @classmethod
+    def from_geometry(cls, geometry):
+        """
+        Encode an array (or GeoSeries) of Polygon / MultiPolygon geometries.
+        Missing (None) and empty geometries become MultiPolygons with no parts: they have
+        no polygons, and feature_index still refers to the input rows.
+        """
+        geometry = np.asarray(geometry, dtype=object)
+        # Polygons are promoted to single-part MultiPolygons, so there is one layout
+        geometry = np.array([shapely.MultiPolygon() if geom is None or geom.is_empty
+                             else shapely.MultiPolygon([geom]) if geom.geom_type == 'Polygon' else geom
+                             for geom in geometry], dtype=object)
+        _, coords, (ring_offsets, polygon_offsets, feature_offsets) = shapely.to_ragged_array(geometry)
+
+        feature_index = np.repeat(np.arange(len(geometry), dtype=np.int32), np.diff(feature_offsets))
+        return cls(
+            positions=coords.astype(np.float32).ravel(),
+            start_indices=ring_offsets[polygon_offsets].astype(np.int32),
+            ring_offsets=ring_offsets.astype(np.int32),
+            polygon_rings=polygon_offsets.astype(np.int32),
+            feature_index=feature_index,
+        )
+
+    def polygon_colours(self, feature_colours):
+        """
+        Packed uint8 RGBA buffer (n_polygons * 4,) from an (n_features, 4) colour array.
+        """
+        return np.asarray(feature_colours, dtype=np.uint8)[self.feature_index].ravel()
+
+    def polygon_records(self, decimals=6, rows=None):
+        """
+        One {"positions": [x0, y0, x1, y1, ...], "holeIndices": [...]} dict per polygon, the
+        flat polygon format of deck.gl's PolygonLayer (position_format="XY").
+
+        Used where the buffers have to go through JSON (st.pydeck_chart): coordinates are
+        rounded to `decimals` places (1e-6 degrees is about 0.1 m).
+        If `rows` is given, only the polygons of those input rows are returned.
+        """
+        positions = np.round(self.positions.astype(np.float64), decimals)
+        polygons = range(len(self.feature_index)) if rows is None else \
+            np.flatnonzero(np.isin(self.feature_index, rows))
+
+        records = []
+        for i in polygons:
+            start, end = self.start_indices[i], self.start_indices[i + 1]
+            # hole rings start after the outer ring, in vertex counts relative to the polygon
+            rings = self.ring_offsets[self.polygon_rings[i]:self.polygon_rings[i + 1]]
+            records.append({
+                "positions": positions[2 * start:2 * end].tolist(),
+                "holeIndices": (rings[1:] - start).tolist(),
+            })
+        return records
+
+
+##### VECTOR TILES
+# Tiles written by python_code/vector_tiles.py and served by python_code/tile_server.py.
+# The tiles only carry `small_area`; the values to draw are joined on it by the tile
+# server from an attribute table written by the app.
+TILES_DIR = "data/tiles"
+TILES_METADATA_FILE = "metadata.json"
+TILE_LAYER_NAME = "small_areas"
+ATTRIBUTE_TABLES_DIR = os.path.join(TILES_DIR, "attributes")
+# one table is written per metric / colour / highlight drawn; only the most recently
+# used ones are kept on disk
+MAX_ATTRIBUTE_TABLES = 64
+
+
+def attribute_table_name(table):
+    """Content hash naming an attribute table, so identical tables are written once."""
+    payload = json.dumps(table, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+def write_attribute_table(table, directory=ATTRIBUTE_TABLES_DIR, max_tables=MAX_ATTRIBUTE_TABLES):
+    """
+    Save an attribute table ({small_area: {property: scalar value}}) for the tile server
+    and return its name (the `table` query parameter of the tile URL).
+
+    A table that already exists is marked as used (modification time); past `max_tables`
+    tables, the least recently used ones are removed.
+    """
+    name = attribute_table_name(table)
+    path = os.path.join(directory, f"{name}.json")
+    try:
+        os.utime(path)
+        return name
+    except FileNotFoundError:
+        pass
+
+    os.makedirs(directory, exist_ok=True)
+    # write then rename, so the server never reads a half-written table
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump(table, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+    _evict_attribute_tables(directory, max_tables)
+    return name
+
+
+def _evict_attribute_tables(directory, max_tables):
+    """Remove all but the `max_tables` most recently used attribute tables of `directory`."""
+    tables = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith(".json"):
+            try:
+                tables.append((entry.stat().st_mtime_ns, entry.path))
+            except FileNotFoundError:
+                pass
+    for _, path in sorted(tables, reverse=True)[max_tables:]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # removed by another session at the same time
+            pass
+
+
+def read_attribute_table(name, directory=ATTRIBUTE_TABLES_DIR):
+    with open(os.path.join(directory, f"{name}.json")) as f:
+        return json.load(f)
+
+
+def read_tiles_metadata(directory=TILES_DIR):
+    """metadata.json of the tile set (layer, zoom range, bounds), or None if no tiles were built."""
+    path = os.path.join(directory, TILES_METADATA_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+##### SHARED-ARC TOPOLOGY
+# TopoJSON-style encoding: coordinates are quantised to an integer grid, every boundary
+# shared by two areas is stored once as an arc, and arcs are delta-encoded.
+# Rings refer to arcs by index (~i for arc i walked backwards).
+TOPOLOGY_STEP = 1e-6  # base grid step in degrees, about 0.1 m
+
+
+def zoom_quantisation_step(zoom, latitude=0.0, tile_pixels=256):
+    """
+    Grid steps (x, y) in degrees of half a screen pixel at `zoom`, for the Web Mercator map
+    around `latitude`: a pixel spans cos(latitude) times fewer degrees of latitude than of
+    longitude (e.g. 0.62 at Cardiff), so the y step is the smaller one.
+    """
+    x_step = 360 / (tile_pixels * 2 ** zoom) / 2
+    return x_step, x_step * np.cos(np.radians(latitude))
+
+
+def _quantised_rings(geom, translate, step):
+    """Rings of a (multi-)polygon as lists of integer grid points, per polygon part."""
+    parts = geom.geoms if geom.geom_type == 'MultiPolygon' else [geom]
+    polygons = []
+    for part in parts:
+        rings = []
+        for ring in [part.exterior] + list(part.interiors):
+            grid = np.round((np.asarray(ring.coords)[:, :2] - translate) / step).astype(np.int64)
+            # drop points that fall on the same grid cell as the previous one
+            keep = np.ones(len(grid), dtype=bool)
+            keep[1:] = np.any(grid[1:] != grid[:-1], axis=1)
+            grid = grid[keep]
+            if len(grid) >= 4:
+                rings.append([tuple(point) for point in grid[:-1].tolist()])  # open ring
+        if rings:
+            polygons.append(rings)
+    return polygons
+
+
+def build_topology(geometry, ids=None, step=TOPOLOGY_STEP):
+    """
+    Encode Polygon / MultiPolygon geometries as a TopoJSON-style topology (dict).
+
+    Parameters:
+    - geometry: array or GeoSeries of geometries (any CRS, usually EPSG:4326)
+    - ids: optional feature ids (e.g. small_area codes), stored as "id" of each geometry
+    - step: quantisation grid step, in the units of the coordinates
+    """
+    geometry = np.asarray(geometry, dtype=object)
+    translate = np.asarray(shapely.total_bounds(geometry)[:2])
+    features = [_quantised_rings(geom, translate, step) for geom in geometry]
+
+    # junctions: points met with different neighbours in different rings, where shared edges start/end
+    neighbours = {}
+    junctions = set()
+    for polygons in features:
+        for rings in polygons:
+            for ring in rings:
+                n = len(ring)
+                for i, point in enumerate(ring):
+                    pair = frozenset((ring[i - 1], ring[(i + 1) % n]))
+                    seen = neighbours.setdefault(point, pair)
+                    if seen != pair:
+                        junctions.add(point)
+
+    arcs = []
+    arc_index = {}
+
+    def arc_id(points):
+        points = tuple(points)
+        if points in arc_index:
+            return arc_index[points]
+        if points[::-1] in arc_index:
+            return ~arc_index[points[::-1]]
+        arc_index[points] = len(arcs)
+        arcs.append(points)
+        return arc_index[points]
+
+    def ring_arcs(ring):
+        cuts = [i for i, point in enumerate(ring) if point in junctions]
+        if not cuts:
+            # closed ring without junctions: start at its smallest point, so an identical ring matches
+            start = min(range(len(ring)), key=ring.__getitem__)
+            rotated = ring[start:] + ring[:start]
+            return [arc_id(rotated + [rotated[0]])]
+        rotated = ring[cuts[0]:] + ring[:cuts[0]]
+        offsets = [i - cuts[0] for i in cuts] + [len(ring)]
+        closed = rotated + [rotated[0]]
+        return [arc_id(closed[offsets[k]:offsets[k + 1] + 1]) for k in range(len(offsets) - 1)]
+
+    geometries = []
+    for i, polygons in enumerate(features):
+        encoded = [[ring_arcs(ring) for ring in rings] for rings in polygons]
+        if not encoded:
+            # every ring collapsed on the grid: null geometry, as in TopoJSON
+            feature = {"type": None}
+        elif len(encoded) == 1:
+            feature = {"type": "Polygon", "arcs": encoded[0]}
+        else:
+            feature = {"type": "MultiPolygon", "arcs": encoded}
+        if ids is not None:
+            feature["id"] = ids[i]
+        geometries.append(feature)
+
+    return {
+        "type": "Topology",
+        "transform": {"scale": [step, step], "translate": translate.tolist()},
+        "arcs": [_delta_encode(np.asarray(arc)) for arc in arcs],
+        "geometries": geometries,
+    }
+
+
+def _delta_encode(points):
+    return np.vstack([points[:1], np.diff(points, axis=0)]).tolist()
+
+
+def _absolute_arcs(topology):
+    return [np.cumsum(np.asarray(arc, dtype=np.int64), axis=0) for arc in topology["arcs"]]
+
+
+def quantise_topology(topology, step):
+    """
+    Coarsen a topology to a grid step (a whole multiple of its current step on each axis),
+    e.g. the zoom_quantisation_step of the map zoom: a number, or an (x, y) pair.
+    Arcs stay shared, so no gaps open between areas.
+
+    Repeated points are removed, so an arc that falls within one grid cell is left as a
+    single point and adds nothing to its rings. Coarse grids can still fold a ring onto
+    itself: decode_topology(..., fallback=topology) redraws those features unquantised.
+    """
+    steps = np.broadcast_to(np.asarray(step, dtype=float), (2,))
+    factors = np.maximum(1, (steps // np.asarray(topology["transform"]["scale"])).astype(np.int64))
+    if (factors == 1).all():
+        return topology
+
+    arcs = []
+    for points in _absolute_arcs(topology):
+        grid = np.round(points / factors).astype(np.int64)
+        # the end points are the same grid cells as before, whichever duplicate is kept
+        keep = np.ones(len(grid), dtype=bool)
+        keep[1:] = np.any(grid[1:] != grid[:-1], axis=1)
+        arcs.append(_delta_encode(grid[keep]))
+
+    scale = (np.asarray(topology["transform"]["scale"]) * factors).tolist()
+    return dict(topology, transform=dict(topology["transform"], scale=scale), arcs=arcs)
+
+
+def decode_topology(topology, decimals=None, fallback=None):
+    """
+    GeoJSON geometry dicts (Polygon / MultiPolygon, or None for a null geometry), one per
+    topology geometry, in order.
+    Rings left with fewer than 4 points by quantisation (once repeated points are removed)
+    are dropped, and so are the polygons whose outer ring was dropped.
+    Coordinates are rounded to `decimals` (default: the precision of the grid step).
+
+    With `fallback` (the topology before quantise_topology), the features that quantisation
+    left empty or invalid (e.g. self-intersecting) are decoded from the fallback instead.
+    """
+    geometries = _decode_geometries(topology, decimals)
+    if fallback is None:
+        return geometries
+
+    shapes = np.array([shapely.from_geojson(json.dumps(geom)) if geom else None for geom in geometries],
+                      dtype=object)
+    broken = np.flatnonzero((shapely.is_empty(shapes) | ~shapely.is_valid(shapes))
+                            & ~shapely.is_missing(shapes))
+    if len(broken):
+        unquantised = _decode_geometries(fallback, None)
+        for i in broken:
+            geometries[i] = unquantised[i]
+    return geometries
+
+
+def _decode_geometries(topology, decimals):
+    scale = np.asarray(topology["transform"]["scale"])
+    translate = np.asarray(topology["transform"]["translate"])
+    if decimals is None:
+        decimals = max(0, int(np.ceil(-np.log10(scale.min()))))
+    arcs = [np.round(points * scale + translate, decimals) for points in _absolute_arcs(topology)]
+
+    def ring_coords(arc_ids):
+        points = np.vstack([arcs[i] if i >= 0 else arcs[~i][::-1] for i in arc_ids])
+        # arcs meet on their end points, and collapsed arcs repeat their neighbours' ends
+        keep = np.ones(len(points), dtype=bool)
+        keep[1:] = np.any(points[1:] != points[:-1], axis=1)
+        return points[keep].tolist()
+
+    def polygon_coords(rings):
+        decoded = [ring_coords(ring) for ring in rings]
+        if len(decoded[0]) < 4:
+            # without its outer ring the polygon is gone, holes included
+            return []
+        return [ring for ring in decoded if len(ring) >= 4]
+
+    geometries = []
+    for feature in topology["geometries"]:
+        if feature["type"] == "Polygon":
+            geometries.append({"type": "Polygon", "coordinates": polygon_coords(feature["arcs"])})
+        elif feature["type"] == "MultiPolygon":
+            polygons = [polygon for polygon in map(polygon_coords, feature["arcs"]) if polygon]
+            geometries.append({"type": "MultiPolygon", "coordinates": polygons})
+        else:
+            geometries.append(None)
+    return geometries
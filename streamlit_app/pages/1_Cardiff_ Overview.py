@@ -6,26 +6,18 @@ import pydeck as pdk
 import json
 from plotly.subplots import make_subplots
 import plotly.graph_objects as go
-from utils import histogram_totals, Top3_Bottom3_LSOAs, bottom_line_message, choropleth_map, create_cobenefit_timeline, cobenefit_colors, style_expanders
+from utils import histogram_totals, histogram_metrics, has_smoothed_rates, Top3_Bottom3_LSOAs, bottom_line_message, choropleth_map, create_cobenefit_timeline, cobenefit_colors, style_expanders
+from data_access import load_l2data_totals, load_l2data_time, load_cardiff_gdf
 
 st.set_page_config(page_title="Cardiff Overview", page_icon=":wales:")
 
-l2data_totals = pd.read_csv("data/l2data_totals.csv")
+l2data_totals = load_l2data_totals()
 
-l2data_time= pd.read_csv("data/lsoa_cardiff_wimd.csv")
+l2data_time= load_l2data_time()
 
 ## geodata
-# Load shapefile and merge with data
-shapefile_path = "data/cardiff_shapefile/cardiff_lsoa.shp"
-cardiff_gdf = gpd.read_file(shapefile_path).to_crs(epsg=4326)
-cardiff_gdf["small_area"] = cardiff_gdf["small_area"].astype(str).str.strip()
-
-# Merge population data with geometry
-cardiff_gdf = cardiff_gdf.merge(
-    l2data_totals.rename(columns={"LSOA code": "small_area"}), 
-    on="small_area", 
-    how="left"
-)
+# Shapefile merged with data (cached and shared; copy because the maps add columns)
+cardiff_gdf = load_cardiff_gdf().copy()
 
 # Add CSS styling for expanders
 style_expanders()
@@ -219,7 +211,7 @@ with col1:
     # Add toggle for normalised vs absolute
     histogram_metric = st.radio(
         "Select metric:",
-        ["Absolute (million £)", "Normalised (£/person)"],
+        histogram_metrics(l2data_totals),
         horizontal=True
     )
     
@@ -236,6 +228,19 @@ with col1:
         - The Total Net-Zero Co-Benefits value ranges from a loss of {min_val:,} million £ (Cathays 12)
         to a gain of {max_val:,} million £ (Cyncoed 1)
         """)
+    elif histogram_metric == "Smoothed (£/person)":
+        histogram_column = 'sum_std_eb'
+        histogram_label = 'Smoothed Net-Zero Co-Benefits [£/person]'
+        min_val = round(min(l2data_totals['sum_std_eb']), 2)
+        max_val = round(max(l2data_totals['sum_std_eb']), 2)
+
+        st.markdown(f"""
+        This chart shows the distribution of **smoothed** Net-Zero Co-Benefits per person across neighbourhoods.
+
+        - Each neighbourhood's value per resident is pulled towards the average of its neighbouring areas, more strongly for the less populated ones (empirical-Bayes smoothing)
+        - This reduces the noise of small populations, while keeping the differences that are consistent across neighbouring areas
+        - The smoothed co-benefits per resident range from {min_val:,} £/person to {max_val:,} £/person.
+        """)
     else:
         histogram_column = 'sum_std'
         histogram_label = 'Normalised Net-Zero Co-Benefits [£/person]'
@@ -271,7 +276,7 @@ if histogram_metric == "Absolute (million £)":
 else:    
     with st.expander('Expand to explore the neighbourhoods with the largest and smallest Normalised Net-Zero Co-benefits'):
         st.dataframe(
-            Top3_Bottom3_LSOAs(value_col='sum_std'
+            Top3_Bottom3_LSOAs(value_col=histogram_column
                                ,value_col_display_name = "Tot Net-Zero Co-Benefits [£/person]"), 
             hide_index=True)
 
@@ -346,10 +351,16 @@ with col2:
         "Tot Co-Benefits": "sum"
         ,"Tot Co-Benefits Normalised": "sum_std"
     }
+    tooltip_html = "Neighbourhood: <b>{LSOA name (Eng)}</b><br/>Tot net-zero co-benefits [mil £]: {sum_rounded}<br/>Normalised tot net-zero co-benefits [£/person]: {sum_std_rounded}"
+    # smoothed rates, unless the totals were built without geometry to smooth with
+    if has_smoothed_rates(cardiff_gdf):
+        metric_options["Tot Co-Benefits Normalised (smoothed)"] = "sum_std_eb"
+        tooltip_html += "<br/>Smoothed [£/person]: {sum_std_eb_rounded}"
 
     metric_titles = {
         "Tot Co-Benefits": "Tot net-zero co-benefits [million £]",
-        "Tot Co-Benefits Normalised": "Normalised tot net-zero co-benefits [£ per person]"
+        "Tot Co-Benefits Normalised": "Normalised tot net-zero co-benefits [£ per person]",
+        "Tot Co-Benefits Normalised (smoothed)": "Smoothed tot net-zero co-benefits [£ per person]"
     }
 
     metric_display = st.selectbox(
@@ -370,7 +381,7 @@ with col2:
         ,legend_title=legend_title
         ,colour_high= (0, 153, 51),
         highlight_lsoa=selected_lsoa
-        ,tooltip_html = "Neighbourhood: <b>{LSOA name (Eng)}</b><br/>Tot net-zero co-benefits [mil £]: {sum_rounded}<br/>Normalised tot net-zero co-benefits [£/person]: {sum_std_rounded}"
+        ,tooltip_html = tooltip_html
 
         #,colour_low= (230, 0, 0)
         )
@@ -6,7 +6,9 @@ import pydeck as pdk
 import json
 from plotly.subplots import make_subplots
 import plotly.graph_objects as go
-from utils import histogram_totals, Top3_Bottom3_LSOAs, bottom_line_message, choropleth_map, create_cobenefit_timeline, cobenefit_colors, style_expanders
+from utils import histogram_totals, per_person_histogram, histogram_metrics, Top3_Bottom3_LSOAs, bottom_line_message, choropleth_map, create_cobenefit_timeline, cobenefit_colors, style_expanders
+from data_access import load_l2data_totals, load_cobenefit_matrix
+from rollup_cube import TOTAL_YEAR
 
 st.set_page_config(page_title="Co-Benefits Analysis", page_icon=":mag:")
 st.sidebar.header("Co-Benefits Analysis :mag:")
@@ -15,9 +17,13 @@ st.markdown("# Co-Benefits Analysis :mag:")
 st.markdown("""This section focusses on the expected value generated in Cardiff through the Net Zero transition. We analysed each available
             co-benefit subcategory, exploring both the distribution of data by neighbourhood and the overall projections through 2050""")
 
-l2data_totals = pd.read_csv("data/l2data_totals.csv")
+l2data_totals = load_l2data_totals()
+# histogram toggle options (no smoothed rates if the totals were built without geometry)
+histogram_options = histogram_metrics(l2data_totals)
 
-l2data_time= pd.read_csv("data/lsoa_cardiff_wimd.csv")
+# city-level sums by co-benefit and year, read out of the rollup cube once per dataset version;
+# the totals and every time series below come from this one matrix
+cobenefit_matrix = load_cobenefit_matrix()
 
 # Add CSS styling for expanders
 style_expanders()
@@ -39,8 +45,8 @@ cobenefit_columns = [
 ]
 # add/remove as needed
 
-# Sum each column individually
-column_sums = l2data_totals[cobenefit_columns].sum()
+# City totals (2025-2050) of each column
+column_sums = cobenefit_matrix.loc[cobenefit_columns, TOTAL_YEAR]
 
 # Convert to DataFrame with proper column names
 column_sums = column_sums.reset_index()
@@ -230,8 +236,10 @@ with st.expander('How to read the time series chart'):
 # Prepare data for time series line chart
 year_cols = [str(year) for year in range(2025, 2051)]
 
-# Group by co-benefit_type and sum across LSOAs for each year
-cobenefit_sums = l2data_time[~l2data_time['co-benefit_type'].isin(['noise', 'congestion','road_repairs','road_safety'])].groupby('co-benefit_type')[year_cols].sum()
+# City sums for each year and co-benefit type
+excluded_cobenefits = ['noise', 'congestion','road_repairs','road_safety']
+cobenefit_sums = cobenefit_matrix[year_cols]
+cobenefit_sums = cobenefit_sums[~cobenefit_sums.index.isin(excluded_cobenefits)]
 
 # Rename 'sum' to 'Total' if it exists
 if 'sum' in cobenefit_sums.index:
@@ -346,7 +354,7 @@ with tab1:
     # Add toggle for normalised vs absolute
     histogram_metric = st.radio(
     "Select metric:",
-    ["Absolute (million £)", "Normalised (£/person)"],
+    histogram_options,
     horizontal=True
     ,key=f"radio_{cobenefit}")
 
@@ -365,10 +373,7 @@ with tab1:
         )
 
     else:
-        histogram_column = [cobenefit+'_std']
-        histogram_label = 'Normalised Net-Zero Co-Benefits [£/person]'
-        x_labels = 'Normalised Net-Zero Co-benefits [£/person]',
-        titles = [f"Normalised {cobenefit_display} Distribution"]
+        histogram_column, x_labels, titles = per_person_histogram(cobenefit, cobenefit_display, histogram_metric)
         histogram_totals(
             num_cols = 1, 
             columns_to_plot = histogram_column,
@@ -383,7 +388,7 @@ with tab1:
         year_cols = [str(year) for year in range(2025, 2051)]
         cobenefit = cobenefit
         fig_diet = create_cobenefit_timeline(
-            l2data_time=l2data_time,
+            l2data_time=cobenefit_matrix,
             cobenefit_name=cobenefit,
             display_name=cobenefit_display,
             line_color=cobenefit_colors[cobenefit]['line'],
@@ -427,7 +432,7 @@ with tab1:
     # Add toggle for normalised vs absolute
     histogram_metric = st.radio(
     "Select metric:",
-    ["Absolute (million £)", "Normalised (£/person)"],
+    histogram_options,
     horizontal=True
     ,key=f"radio_{cobenefit}")
 
@@ -446,10 +451,7 @@ with tab1:
         )
 
     else:
-        histogram_column = [cobenefit+'_std']
-        histogram_label = 'Normalised Net-Zero Costs [£/person]'
-        x_labels = 'Normalised Net-Zero Costs [£/person]',
-        titles = [f"Normalised {cobenefit_display} Distribution"]
+        histogram_column, x_labels, titles = per_person_histogram(cobenefit, cobenefit_display, histogram_metric, measure='Costs')
         histogram_totals(
             num_cols = 1, 
             columns_to_plot = histogram_column,
@@ -464,7 +466,7 @@ with tab1:
         year_cols = [str(year) for year in range(2025, 2051)]
         cobenefit = cobenefit
         fig_diet = create_cobenefit_timeline(
-            l2data_time=l2data_time,
+            l2data_time=cobenefit_matrix,
             cobenefit_name=cobenefit,
             display_name=cobenefit_display,
             line_color=cobenefit_colors[cobenefit]['line'],
@@ -507,7 +509,7 @@ with tab1:
     # Add toggle for normalised vs absolute
     histogram_metric = st.radio(
     "Select metric:",
-    ["Absolute (million £)", "Normalised (£/person)"],
+    histogram_options,
     horizontal=True
     ,key=f"radio_{cobenefit}")
 
@@ -526,10 +528,7 @@ with tab1:
         )
 
     else:
-        histogram_column = [cobenefit+'_std']
-        histogram_label = 'Normalised Net-Zero Co-Benefits [£/person]'
-        x_labels = 'Normalised Net-Zero Co-benefits [£/person]',
-        titles = [f"Normalised {cobenefit_display} Distribution"]
+        histogram_column, x_labels, titles = per_person_histogram(cobenefit, cobenefit_display, histogram_metric)
         histogram_totals(
             num_cols = 1, 
             columns_to_plot = histogram_column,
@@ -543,7 +542,7 @@ with tab1:
         year_cols = [str(year) for year in range(2025, 2051)]
         cobenefit = cobenefit
         fig_diet = create_cobenefit_timeline(
-            l2data_time=l2data_time,
+            l2data_time=cobenefit_matrix,
             cobenefit_name=cobenefit,
             display_name=cobenefit_display,
             line_color=cobenefit_colors[cobenefit]['line'],
@@ -586,7 +585,7 @@ with tab1:
     # Add toggle for normalised vs absolute
     histogram_metric = st.radio(
     "Select metric:",
-    ["Absolute (million £)", "Normalised (£/person)"],
+    histogram_options,
     horizontal=True
     ,key=f"radio_{cobenefit}")
 
@@ -605,10 +604,7 @@ with tab1:
         )
 
     else:
-        histogram_column = [cobenefit+'_std']
-        histogram_label = 'Normalised Net-Zero Co-Benefits [£/person]'
-        x_labels = 'Normalised Net-Zero Co-benefits [£/person]',
-        titles = [f"Normalised {cobenefit_display} Distribution"]
+        histogram_column, x_labels, titles = per_person_histogram(cobenefit, cobenefit_display, histogram_metric)
         histogram_totals(
             num_cols = 1, 
             columns_to_plot = histogram_column,
@@ -623,7 +619,7 @@ with tab1:
         year_cols = [str(year) for year in range(2025, 2051)]
         cobenefit = cobenefit
         fig_diet = create_cobenefit_timeline(
-            l2data_time=l2data_time,
+            l2data_time=cobenefit_matrix,
             cobenefit_name=cobenefit,
             display_name=cobenefit_display,
             line_color=cobenefit_colors[cobenefit]['line'],
@@ -666,7 +662,7 @@ with tab1:
     # Add toggle for normalised vs absolute
     histogram_metric = st.radio(
     "Select metric:",
-    ["Absolute (million £)", "Normalised (£/person)"],
+    histogram_options,
     horizontal=True
     ,key=f"radio_{cobenefit}")
 
@@ -685,10 +681,7 @@ with tab1:
         )
 
     else:
-        histogram_column = [cobenefit+'_std']
-        histogram_label = 'Normalised Net-Zero Co-Benefits [£/person]'
-        x_labels = 'Normalised Net-Zero Co-benefits [£/person]',
-        titles = [f"Normalised {cobenefit_display} Distribution"]
+        histogram_column, x_labels, titles = per_person_histogram(cobenefit, cobenefit_display, histogram_metric)
         histogram_totals(
             num_cols = 1, 
             columns_to_plot = histogram_column,
@@ -702,7 +695,7 @@ with tab2:
     year_cols = [str(year) for year in range(2025, 2051)]
     cobenefit = cobenefit
     fig_diet = create_cobenefit_timeline(
-        l2data_time=l2data_time,
+        l2data_time=cobenefit_matrix,
         cobenefit_name=cobenefit,
         display_name=cobenefit_display,
         line_color=cobenefit_colors[cobenefit]['line'],
@@ -744,7 +737,7 @@ with tab1:
     # Add toggle for normalised vs absolute
     histogram_metric = st.radio(
     "Select metric:",
-    ["Absolute (million £)", "Normalised (£/person)"],
+    histogram_options,
     horizontal=True
     ,key=f"radio_{cobenefit}")
 
@@ -763,10 +756,7 @@ with tab1:
         )
 
     else:
-        histogram_column = [cobenefit+'_std']
-        histogram_label = 'Normalised Net-Zero Co-Benefits [£/person]'
-        x_labels = 'Normalised Net-Zero Co-benefits [£/person]',
-        titles = [f"Normalised {cobenefit_display} Distribution"]
+        histogram_column, x_labels, titles = per_person_histogram(cobenefit, cobenefit_display, histogram_metric)
         histogram_totals(
             num_cols = 1, 
             columns_to_plot = histogram_column,
@@ -780,7 +770,7 @@ with tab1:
         year_cols = [str(year) for year in range(2025, 2051)]
         cobenefit = cobenefit
         fig_diet = create_cobenefit_timeline(
-            l2data_time=l2data_time,
+            l2data_time=cobenefit_matrix,
             cobenefit_name=cobenefit,
             display_name=cobenefit_display,
             line_color=cobenefit_colors[cobenefit]['line'],
@@ -822,7 +812,7 @@ with tab1:
     # Add toggle for normalised vs absolute
     histogram_metric = st.radio(
     "Select metric:",
-    ["Absolute (million £)", "Normalised (£/person)"],
+    histogram_options,
     horizontal=True
     ,key=f"radio_{cobenefit}")
 
@@ -843,10 +833,7 @@ with tab1:
         )
 
     else:
-        histogram_column = [cobenefit+'_std']
-        histogram_label = 'Normalised Net-Zero Co-Benefits [£/person]'
-        x_labels = 'Normalised Net-Zero Co-benefits [£/person]',
-        titles = [f"Normalised {cobenefit_display} Distribution"]
+        histogram_column, x_labels, titles = per_person_histogram(cobenefit, cobenefit_display, histogram_metric)
         histogram_totals(
             num_cols = 1, 
             columns_to_plot = histogram_column,
@@ -860,7 +847,7 @@ with tab1:
         year_cols = [str(year) for year in range(2025, 2051)]
         cobenefit = cobenefit
         fig_diet = create_cobenefit_timeline(
-            l2data_time=l2data_time,
+            l2data_time=cobenefit_matrix,
             cobenefit_name=cobenefit,
             display_name=cobenefit_display,
             line_color=cobenefit_colors[cobenefit]['line'],
@@ -4,7 +4,10 @@ import plotly.express as px
 from plotly.subplots import make_subplots
 import plotly.graph_objects as go
 import geopandas as gpd
-from utils import histogram_totals, deprivation_quintiles_boxplots_totals, test_quintile_differences, display_quintile_test_results,choropleth_map, cobenefit_colors, bottom_line_message, Top3_Bottom3_LSOAs, style_expanders
+from utils import histogram_totals, deprivation_quintiles_boxplots_totals, test_quintile_differences, display_quintile_test_results,choropleth_map, cobenefit_colors, bottom_line_message, Top3_Bottom3_LSOAs, style_expanders, spatial_clusters, cluster_layer, LISA_COLOURS, has_smoothed_rates
+from data_access import load_l2data_totals, load_cardiff_gdf, load_inequality
+from inequality import league_table
+from rollup_cube import ALL_LOCAL_AUTHORITIES
 
 
 st.set_page_config(page_title="Social Deprivation Analysis", page_icon=":houses:")
@@ -15,20 +18,11 @@ st.markdown("# Social Deprivation Analysis :houses:")
 style_expanders()
 
 
-l2data_totals = pd.read_csv("data/l2data_totals.csv")
+l2data_totals = load_l2data_totals()
 
 ## geodata
-# Load shapefile and merge with data
-shapefile_path = "data/cardiff_shapefile/cardiff_lsoa.shp"
-cardiff_gdf = gpd.read_file(shapefile_path).to_crs(epsg=4326)
-cardiff_gdf["small_area"] = cardiff_gdf["small_area"].astype(str).str.strip()
-
-# Merge population data with geometry
-cardiff_gdf = cardiff_gdf.merge(
-    l2data_totals.rename(columns={"LSOA code": "small_area"}), 
-    on="small_area", 
-    how="left"
-)
+# Shapefile merged with data (cached and shared; copy because the maps add columns)
+cardiff_gdf = load_cardiff_gdf().copy()
 
 st.markdown(
     f"""
@@ -74,6 +68,8 @@ st.markdown("""
 - [Diet Change Co-Benefits](#diet-change-co-benefits)
 - [Dampness Co-Benefits](#dampness-co-benefits)
 - [Hassle Costs](#hassle-costs)
+##### Equity
+- [Equity Gaps](#equity-gaps)
 """)
 
 
@@ -202,6 +198,16 @@ with col2:
     metric = metric_options[metric_display]
     legend_title = metric_titles[metric_display]
 
+    # Smoothed per-person rates (shrunk towards the neighbouring areas), precomputed as _std_eb columns
+    # (not offered when the totals were built without geometry to smooth with)
+    smoothed = has_smoothed_rates(cardiff_gdf) and st.checkbox(
+        "Smoothed rates", key="smoothed_rates",
+        help="Pull each neighbourhood's value per person towards its neighbours' average, "
+             "more strongly for the less populated areas (empirical-Bayes smoothing)")
+    if smoothed:
+        metric = f'{metric}_eb'
+        legend_title = legend_title.replace("Normalised", "Smoothed")
+
     # Map the selected metric to the cobenefit_colors key
     cobenefit_key_map = {
         "Tot Co-Benefits Normalised": "total",
@@ -236,7 +242,22 @@ with col2:
     # Create a rounded version of the selected metric for the tooltip
     cardiff_gdf[f'{metric}_rounded'] = cardiff_gdf[metric].round(2)
     # Set the tooltip HTML dynamically
-    tooltip_html = f"Neighbourhood: <b>{{LSOA name (Eng)}}</b><br/> {metric_display} [per person]: <b>£{{{metric}_rounded}}</b>"
+    tooltip_html = f"Neighbourhood: <b>{{LSOA name (Eng)}}</b><br/> {metric_display}{' (smoothed)' if smoothed else ''} [per person]: <b>£{{{metric}_rounded}}</b>"
+
+    # Optional outline of the significant spatial clusters (local Moran's I)
+    extra_layers = None
+    if st.checkbox("Outline spatial clusters", key="spatial_clusters"):
+        global_moran, local_clusters = spatial_clusters(cardiff_gdf, metric)
+        extra_layers = [cluster_layer(cardiff_gdf, local_clusters['cluster'], zoom=9.75)]
+        cardiff_gdf['cluster'] = local_clusters['cluster'].astype(str)
+        tooltip_html += "<br/> Spatial cluster: <b>{cluster}</b>"
+        legend = " ".join(
+            f"<span style='border: 3px solid rgb({r},{g},{b}); padding: 0 4px; margin-right: 4px;'>{name}</span>"
+            for name, (r, g, b, _) in LISA_COLOURS.items())
+        st.markdown(
+            f"<div style='font-size: 11px;'>Moran's I = {global_moran['I']:.2f} (p = {global_moran['p_value']:.3f}). "
+            f"Outlined: areas whose value and neighbours' values are both high or both low (or contrast), p &lt; 0.05<br/>{legend}</div>",
+            unsafe_allow_html=True)
 
 
 
@@ -252,6 +273,7 @@ with col2:
         highlight_lsoa=selected_lsoa
         ,tooltip_html = tooltip_html
         ,colour_low= colour_low
+        ,extra_layers = extra_layers
         )
 
 
@@ -289,7 +311,8 @@ with tab2:
     # Test for total co-benefits
     test_results = test_quintile_differences(
         value_col='sum_std',  # Total co-benefits per person
-        alpha=0.05
+        alpha=0.05,
+        resampling=True
     )
     display_quintile_test_results(test_results, value_col_name="Total Co-benefits per person")
 
@@ -321,7 +344,8 @@ with tab2:
     # Test for total co-benefits
     test_results = test_quintile_differences(
         value_col='physical_activity_std',  # Total co-benefits per person
-        alpha=0.05
+        alpha=0.05,
+        resampling=True
     )
     display_quintile_test_results(test_results, value_col_name="Total Co-benefits per person")
 
@@ -353,7 +377,8 @@ with tab2:
     # Test for total co-benefits
     test_results = test_quintile_differences(
         value_col='air_quality_std',  # Total co-benefits per person
-        alpha=0.05
+        alpha=0.05,
+        resampling=True
     )
     display_quintile_test_results(test_results, value_col_name="Total Co-benefits per person")
 
@@ -386,7 +411,8 @@ with tab2:
     # Test for total co-benefits
     test_results = test_quintile_differences(
         value_col='excess_cold_std',  # Total co-benefits per person
-        alpha=0.05
+        alpha=0.05,
+        resampling=True
     )
     display_quintile_test_results(test_results, value_col_name="Total Co-benefits per person")
 
@@ -417,7 +443,8 @@ with tab2:
     # Test for total co-benefits
     test_results = test_quintile_differences(
         value_col='diet_change_std',  # Total co-benefits per person
-        alpha=0.05
+        alpha=0.05,
+        resampling=True
     )
     display_quintile_test_results(test_results, value_col_name="Total Co-benefits per person")
 
@@ -450,7 +477,8 @@ with tab2:
     # Test for total co-benefits
     test_results = test_quintile_differences(
         value_col='dampness_std',  # Total co-benefits per person
-        alpha=0.05
+        alpha=0.05,
+        resampling=True
     )
     display_quintile_test_results(test_results, value_col_name="Total Co-benefits per person")
 
@@ -482,7 +510,8 @@ with tab2:
     # Test for total co-benefits
     test_results = test_quintile_differences(
         value_col='hassle_costs_std',  # Total co-benefits per person
-        alpha=0.05
+        alpha=0.05,
+        resampling=True
     )
     display_quintile_test_results(test_results, value_col_name="Total Co-benefits per person")
 
@@ -499,6 +528,79 @@ st.markdown('[Back to Top](#top)', unsafe_allow_html=True)
 
 ########
 
+st.markdown("---")
+st.markdown("## Equity Gaps")
+st.markdown(
+    """
+    The boxplots compare quintiles; the indices below summarise each co-benefit's distribution in one number
+    (per person, population-weighted):
+    * **Concentration index**: ranks neighbourhoods by WIMD rank, from the most to the least deprived. It is negative when a co-benefit is concentrated in the most deprived areas, 
+    positive when it is concentrated in the least deprived areas, and 0 when it follows population
+    * **Gini** and **Theil** indices: overall inequality between neighbourhoods, whatever their deprivation (0 = equal). They are not shown for net costs
+    """
+)
+
+inequality_metrics, inequality_curves = load_inequality()
+local_authorities = sorted(la for la in inequality_metrics['local_authority'].unique() if la != ALL_LOCAL_AUTHORITIES)
+if len(local_authorities) > 1:
+    local_authority = st.selectbox("Local authority", [ALL_LOCAL_AUTHORITIES] + local_authorities,
+                                   index=1 + local_authorities.index("Cardiff") if "Cardiff" in local_authorities else 0)
+else:
+    local_authority = local_authorities[0]
+
+equity_columns = ['sum_std', 'physical_activity_std', 'air_quality_std', 'excess_cold_std',
+                  'diet_change_std', 'dampness_std', 'hassle_costs_std']
+equity_names = {col: 'Total' if col == 'sum_std' else col.replace('_std', '').replace('_', ' ').title()
+                for col in equity_columns}
+
+equity_table = (inequality_metrics[(inequality_metrics['local_authority'] == local_authority)
+                                   & inequality_metrics['column'].isin(equity_columns)]
+                .set_index('column').loc[equity_columns, ['mean', 'concentration_index', 'gini', 'theil']])
+equity_table.index = [equity_names[col] for col in equity_table.index]
+equity_table.columns = ['Mean [£/person]', 'Concentration index', 'Gini', 'Theil']
+
+tab1, tab2 = st.tabs(["INDICES", "CONCENTRATION CURVES"])
+with tab1:
+    st.dataframe(
+        equity_table.style.format({'Mean [£/person]': "{:,.2f}", 'Concentration index': "{:.3f}",
+                                   'Gini': "{:.3f}", 'Theil': "{:.3f}"}, na_rep="-"),
+        use_container_width=True)
+with tab2:
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=[0, 1], y=[0, 1], mode='lines', name='Equality',
+                             line=dict(color='grey', dash='dash'), hoverinfo='skip'))
+    for col in ['sum_std', 'physical_activity_std', 'dampness_std']:
+        curve = inequality_curves[(inequality_curves['local_authority'] == local_authority)
+                                  & (inequality_curves['column'] == col)
+                                  & (inequality_curves['curve'] == 'concentration')]
+        cobenefit = 'total' if col == 'sum_std' else col.replace('_std', '')
+        fig.add_trace(go.Scatter(
+            x=curve['population_share'], y=curve['value_share'], mode='lines', name=equity_names[col],
+            line=dict(color=cobenefit_colors[cobenefit]['line']),
+            hovertemplate='<b>%{fullData.name}</b><br>Most deprived %{x:.0%} of people: %{y:.1%} of the co-benefits<extra></extra>'
+        ))
+    fig.update_layout(
+        xaxis_title="Cumulative share of population, from most to least deprived",
+        yaxis_title="Cumulative share of co-benefits",
+        xaxis_tickformat='.0%', yaxis_tickformat='.0%',
+        height=500, template="plotly_white"
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+if len(local_authorities) > 1:
+    st.markdown("#### League Table of Equity Gaps")
+    league_column = st.selectbox("Co-benefit", equity_columns, format_func=equity_names.get)
+    league = league_table(inequality_metrics, column=league_column)
+    st.dataframe(
+        league[['rank', 'local_authority', 'mean', 'concentration_index', 'gini', 'theil']].rename(columns={
+            'rank': 'Rank', 'local_authority': 'Local authority', 'mean': 'Mean [£/person]',
+            'concentration_index': 'Concentration index', 'gini': 'Gini', 'theil': 'Theil'}),
+        hide_index=True, use_container_width=True)
+
+st.markdown('[Back to Top](#top)', unsafe_allow_html=True)
+
+########
+
 # st.markdown("---")
 # st.markdown("## Excess Heat Co-Benefits")
 # tab1, tab2 = st.tabs(["BOXPLOTS", "STATISTICAL TEST"])
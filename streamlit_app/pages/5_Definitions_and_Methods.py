@@ -39,7 +39,10 @@ st.markdown(
     """
     * We used the **Level 2 data** provided for the competition
     * The **Normalised Net-Zero Co-Benefits** are calculated by dividing the total value of co-benefits for a 
-      specific neighbourhood (in million £) by the overall number of people living in that neighbourhood (obtaining £/person) 
+      specific neighbourhood (in million £) by the overall number of people living in that neighbourhood (obtaining £/person)
+    * The **Smoothed Net-Zero Co-Benefits** (empirical-Bayes smoothing) pull each neighbourhood's normalised value towards the
+      population-weighted average of the neighbourhood and the ones bordering it, more strongly for the less populated neighbourhoods,
+      by an amount estimated from how much the values vary with population size
     * **Net-Zero Co-benefits categories excluded**: As evidenced in the Data Quality section, the categories 'Congestion', 'Noise', 'Road Repairs' 
      and 'Road Safety' appear null (£0) for Cardiff for all or most of the data points. Therefore, we excluded these categories 
      from the rest of this dashboard
@@ -0,0 +1,167 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+
+# Resamples are drawn as index matrices, `batch_size` rows at a time, and every statistic is
+# computed for a whole batch with array operations. Each batch gets its own child of one
+# SeedSequence, so the results only depend on `seed`, not on the batch order or on how many
+# worker processes the batches are spread over.
+N_RESAMPLES = 10000
+BATCH_SIZE = 1000
+
+
+def _batch_seeds(n_resamples, batch_size, seed):
+    """(batch length, SeedSequence) pairs covering `n_resamples` resamples."""
+    sizes = [batch_size] * (n_resamples // batch_size)
+    if n_resamples % batch_size:
+        sizes.append(n_resamples % batch_size)
+    return list(zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes))))
+
+
+def _run_batches(function, args, n_resamples, batch_size, seed, workers):
+    """Stack the outputs of `function(*args, size, seed_sequence)` over all batches."""
+    batches = _batch_seeds(n_resamples, batch_size, seed)
+    if workers and workers > 1 and len(batches) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(function, *zip(*[args + batch for batch in batches])))
+    else:
+        results = [function(*args, size, seed_sequence) for size, seed_sequence in batches]
+    return np.concatenate(results)
+
+
+def _group_codes(values, groups):
+    """Non-missing values, their integer group codes and the sorted group labels."""
+    values = np.asarray(values, dtype=float)
+    groups = pd.Series(np.asarray(groups))
+    keep = ~np.isnan(values) & groups.notna().to_numpy()
+    codes, labels = pd.factorize(groups[keep], sort=True)
+    return values[keep], codes, list(labels)
+
+
+##### PERMUTATION TESTS
+def _between_ss(values, codes, n_groups, counts):
+    """
+    Between-group sum of squares for each row of a (batch, n) matrix of group codes.
+    The group sizes and the total sum of squares do not change under permutation.
+    """
+    batch = codes.shape[0]
+    # one bincount over (row, group) pairs gives every group sum of every row
+    flat = (np.arange(batch)[:, None] * n_groups + codes).ravel()
+    sums = np.bincount(flat, weights=np.broadcast_to(values, codes.shape).ravel(),
+                       minlength=batch * n_groups).reshape(batch, n_groups)
+    grand_mean = values.mean()
+    return (counts * (sums / counts - grand_mean) ** 2).sum(axis=1)
+
+
+def _permuted_between_ss(values, codes, n_groups, size, seed_sequence):
+    rng = np.random.default_rng(seed_sequence)
+    permuted = rng.permuted(np.broadcast_to(codes, (size, len(codes))), axis=1)
+    return _between_ss(values, permuted, n_groups, np.bincount(codes, minlength=n_groups))
+
+
+def _permutation_test(values, codes, n_groups, n_resamples, batch_size, seed, workers):
+    """Observed between-group SS and the permutation p-value (upper tail, +1 corrected)."""
+    counts = np.bincount(codes, minlength=n_groups)
+    observed = _between_ss(values, codes[None, :], n_groups, counts)[0]
+    permuted = _run_batches(_permuted_between_ss, (values, codes, n_groups),
+                            n_resamples, batch_size, seed, workers)
+    # tolerance, so permutations tying with the observed split count as at least as extreme
+    extreme = np.count_nonzero(permuted >= observed * (1 - 1e-12))
+    return observed, (extreme + 1) / (n_resamples + 1)
+
+
+def permutation_anova(values, groups, n_resamples=N_RESAMPLES, batch_size=BATCH_SIZE, seed=0, workers=None):
+    """
+    One-way ANOVA with a permutation p-value: the group labels are shuffled `n_resamples`
+    times and the F statistic recomputed, with no normality assumption.
+
+    Parameters:
+    - values: array of values (NaN ignored)
+    - groups: array of group labels, one per value (e.g. WIMD quintiles)
+    - n_resamples: number of permutations
+    - batch_size: permutations computed together
+    - seed: seed of the permutations
+    - workers: number of worker processes (None or 1: in this process)
+
+    Returns a dict with F_statistic, p_value (permutation) and n_resamples.
+    """
+    values, codes, labels = _group_codes(values, groups)
+    n, n_groups = len(values), len(labels)
+    ss_between, p_value = _permutation_test(values, codes, n_groups, n_resamples, batch_size, seed, workers)
+
+    ss_within = ((values - values.mean()) ** 2).sum() - ss_between
+    f_stat = (ss_between / (n_groups - 1)) / (ss_within / (n - n_groups))
+    return {'F_statistic': f_stat, 'p_value': p_value, 'n_resamples': n_resamples}
+
+
+def kruskal_wallis(values, groups, n_resamples=N_RESAMPLES, batch_size=BATCH_SIZE, seed=0, workers=None):
+    """
+    Kruskal-Wallis H test (ANOVA on ranks), with its chi-squared p-value and a permutation
+    p-value (the ranks are shuffled between groups as in permutation_anova).
+
+    Parameters: as permutation_anova.
+
+    Returns a dict with H_statistic, p_value (chi-squared), permutation_p_value and n_resamples.
+    """
+    values, codes, labels = _group_codes(values, groups)
+    h_stat, p_value = stats.kruskal(*[values[codes == g] for g in range(len(labels))])
+
+    # H is a fixed multiple of the between-group SS of the ranks, so the permutation test
+    # on the ranks gives its permutation p-value
+    ranks = stats.rankdata(values)
+    _, permutation_p_value = _permutation_test(ranks, codes, len(labels), n_resamples, batch_size, seed, workers)
+    return {'H_statistic': h_stat, 'p_value': p_value, 'permutation_p_value': permutation_p_value,
+            'n_resamples': n_resamples}
+
+
+##### BOOTSTRAP
+def _bootstrap_medians(sorted_groups, size, seed_sequence):
+    """(size, n_groups) medians of resamples drawn with replacement within each group."""
+    rng = np.random.default_rng(seed_sequence)
+    medians = np.empty((size, len(sorted_groups)))
+    for g, group in enumerate(sorted_groups):
+        idx = rng.integers(0, len(group), size=(size, len(group)))
+        medians[:, g] = np.median(group[idx], axis=1)
+    return medians
+
+
+def bootstrap_medians(values, groups, reference=None, n_resamples=N_RESAMPLES, batch_size=BATCH_SIZE,
+                      confidence=0.95, seed=0, workers=None):
+    """
+    Percentile bootstrap confidence intervals of the median of each group, and of the gap
+    between each group's median and the median of a reference group. The groups are
+    resampled independently (stratified bootstrap), and the gaps use the same resamples.
+
+    Parameters:
+    - values, groups: as permutation_anova
+    - reference: label of the reference group (default: the first group, e.g. quintile 1)
+    - n_resamples, batch_size, seed, workers: as permutation_anova
+    - confidence: confidence level of the intervals
+
+    Returns a DataFrame indexed by group with n, median, median_low, median_high,
+    gap, gap_low and gap_high.
+    """
+    values, codes, labels = _group_codes(values, groups)
+    ref = 0 if reference is None else labels.index(reference)
+    group_values = [values[codes == g] for g in range(len(labels))]
+
+    boot = _run_batches(_bootstrap_medians, (group_values,), n_resamples, batch_size, seed, workers)
+    gaps = boot - boot[:, [ref]]
+
+    tail = 100 * (1 - confidence) / 2
+    median_low, median_high = np.percentile(boot, [tail, 100 - tail], axis=0)
+    gap_low, gap_high = np.percentile(gaps, [tail, 100 - tail], axis=0)
+    medians = np.array([np.median(group) for group in group_values])
+
+    return pd.DataFrame({
+        'n': [len(group) for group in group_values],
+        'median': medians,
+        'median_low': median_low,
+        'median_high': median_high,
+        'gap': medians - medians[ref],
+        'gap_low': gap_low,
+        'gap_high': gap_high,
+    }, index=pd.Index(labels))
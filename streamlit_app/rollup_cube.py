@@ -0,0 +1,123 @@
+import pandas as pd
+
+
+# markers for a rolled-up dimension
+ALL_QUINTILES = 0
+ALL_LOCAL_AUTHORITIES = "All"
+TOTAL_YEAR = "total"
+
+CUBE_KEYS = ['local_authority', 'quintile', 'co-benefit_type', 'year']
+ADDITIVE_MEASURES = ['value_sum', 'area_count', 'population']
+
+
+def build_rollup_cube(l2data, local_authority="Cardiff", year_cols=None,
+                      quintile_col='WIMD 2025 overall quintile', la_col='local_authority'):
+    """
+    Pre-aggregate the long table into a rollup cube over
+    (local authority, WIMD quintile, co-benefit, year).
+
+    Parameters:
+    - l2data: long table (one row per area and co-benefit type, one column per year, plus 'sum')
+    - local_authority: name used when the table has no `la_col` column (single partition)
+    - year_cols: list of year columns (if None, every all-digit column)
+    - quintile_col: WIMD quintile column
+    - la_col: local authority column, if present
+
+    Returns a DataFrame with one row per (local_authority, quintile, co-benefit_type, year):
+    - year: year as a string, or TOTAL_YEAR for the 2025-2050 total
+    - quintile: 1-5, or ALL_QUINTILES (0) for every quintile together
+    - value_sum: sum of the co-benefit values (£ million)
+    - area_count: number of areas
+    - population: total population of those areas
+    - value_per_person: population-weighted mean in £/person (same units as the _std columns)
+    """
+    if year_cols is None:
+        year_cols = [col for col in l2data.columns if str(col).isdigit()]
+    value_cols = list(year_cols) + ['sum']
+
+    if la_col in l2data.columns:
+        la = l2data[la_col].astype(str)
+    else:
+        la = pd.Series(local_authority, index=l2data.index)
+
+    keys = [
+        la.rename('local_authority'),
+        l2data[quintile_col].rename('quintile'),
+        l2data['co-benefit_type'].astype(str).rename('co-benefit_type'),
+    ]
+    grouped = l2data[value_cols + ['population']].groupby(keys, dropna=False, observed=True)
+    by_quintile = grouped.sum()
+    by_quintile['area_count'] = grouped.size()
+
+    # roll the quintile dimension up
+    all_quintiles = by_quintile.groupby(level=['local_authority', 'co-benefit_type']).sum()
+    all_quintiles['quintile'] = ALL_QUINTILES
+    all_quintiles = all_quintiles.set_index('quintile', append=True).reorder_levels(by_quintile.index.names)
+
+    wide = pd.concat([by_quintile, all_quintiles])
+    return _wide_to_cube(wide, value_cols)
+
+
+def _wide_to_cube(wide, value_cols):
+    # one column per year -> one row per year
+    cube = wide.reset_index().melt(
+        id_vars=['local_authority', 'quintile', 'co-benefit_type', 'population', 'area_count'],
+        value_vars=value_cols,
+        var_name='year',
+        value_name='value_sum'
+    )
+    cube['year'] = cube['year'].astype(str).replace('sum', TOTAL_YEAR)
+    return _finish_cube(cube)
+
+
+def _finish_cube(cube):
+    cube['quintile'] = cube['quintile'].astype('Int64')
+    cube['value_per_person'] = 1000000 * cube['value_sum'] / cube['population']
+    return cube[CUBE_KEYS + ADDITIVE_MEASURES + ['value_per_person']].reset_index(drop=True)
+
+
+def merge_rollup_cubes(cubes):
+    """
+    Merge the cubes of several partitions (e.g. one per local authority) and add the
+    ALL_LOCAL_AUTHORITIES rollup. Sums, counts and populations are additive, so no
+    row of the underlying tables is rescanned.
+    """
+    cube = pd.concat(cubes, ignore_index=True)
+    cube = cube[cube['local_authority'] != ALL_LOCAL_AUTHORITIES]
+
+    national = cube.groupby(['quintile', 'co-benefit_type', 'year'], dropna=False)[ADDITIVE_MEASURES].sum().reset_index()
+    national['local_authority'] = ALL_LOCAL_AUTHORITIES
+
+    return _finish_cube(pd.concat([cube, national], ignore_index=True))
+
+
+def cube_matrix(cube, local_authority=None, quintile=ALL_QUINTILES, cobenefits=None, years=None,
+                measure='value_sum'):
+    """
+    Read a co-benefit x year matrix out of the cube.
+
+    Parameters:
+    - cube: rollup cube from build_rollup_cube / merge_rollup_cubes
+    - local_authority: local authority name (if None, the only one in the cube, otherwise ALL_LOCAL_AUTHORITIES)
+    - quintile: WIMD quintile 1-5, or ALL_QUINTILES
+    - cobenefits: list of co-benefit types (rows, in this order; all if None)
+    - years: list of year labels (columns, in this order; all years without TOTAL_YEAR if None)
+    - measure: 'value_sum', 'area_count', 'population' or 'value_per_person'
+
+    Returns a DataFrame indexed by co-benefit type with one column per year.
+    """
+    if local_authority is None:
+        local_authorities = cube['local_authority'].unique()
+        local_authority = local_authorities[0] if len(local_authorities) == 1 else ALL_LOCAL_AUTHORITIES
+
+    rows = cube[(cube['local_authority'] == local_authority) & (cube['quintile'] == quintile)]
+    matrix = rows.pivot(index='co-benefit_type', columns='year', values=measure)
+
+    if years is None:
+        years = sorted(year for year in matrix.columns if year != TOTAL_YEAR)
+    if cobenefits is None:
+        cobenefits = matrix.index
+
+    matrix = matrix.reindex(index=list(cobenefits), columns=[str(year) for year in years])
+    matrix.columns.name = None
+    return matrix
@@ -0,0 +1,263 @@
+import numpy as np
+import pandas as pd
+import shapely
+from scipy import sparse
+from scipy import stats
+
+
+# Spatial autocorrelation of a value over the small areas: are high (or low) values next
+# to each other more often than chance? Neighbours come from the polygon adjacency.
+N_PERMUTATIONS = 999
+LISA_CLUSTERS = ['Not significant', 'High-High', 'Low-Low', 'Low-High', 'High-Low']
+HOT_SPOTS = ['Not significant', 'Hot spot', 'Cold spot']
+
+
+##### SPATIAL WEIGHTS
+def contiguity_weights(geometry, kind='queen', tolerance=0.0):
+    """
+    Sparse binary contiguity matrix of polygons, from one STRtree query.
+
+    Parameters:
+    - geometry: array or GeoSeries of (multi-)polygons
+    - kind: 'queen' (neighbours share at least a point) or 'rook' (they share an edge)
+    - tolerance: also count polygons closer than this (in the units of the CRS) as touching,
+      for boundaries that do not meet exactly (e.g. after simplification)
+
+    Returns a symmetric (n, n) CSR matrix with 1 for neighbours and 0 on the diagonal.
+    """
+    geometry = np.asarray(geometry, dtype=object)
+    tree = shapely.STRtree(geometry)
+    if tolerance > 0:
+        left, right = tree.query(geometry, predicate='dwithin', distance=tolerance)
+    else:
+        left, right = tree.query(geometry, predicate='intersects')
+    keep = left < right
+    left, right = left[keep], right[keep]
+
+    if kind == 'rook':
+        # an edge in common: the shared boundary has a length (not just a corner point)
+        if tolerance > 0:
+            shared = shapely.intersection(shapely.buffer(geometry[left], tolerance), shapely.boundary(geometry[right]))
+        else:
+            shared = shapely.intersection(shapely.boundary(geometry[left]), shapely.boundary(geometry[right]))
+        keep = shapely.length(shared) > 0
+        left, right = left[keep], right[keep]
+    elif kind != 'queen':
+        raise ValueError(f"Unknown contiguity {kind!r}, expected 'queen' or 'rook'")
+
+    n = len(geometry)
+    ones = np.ones(2 * len(left))
+    return sparse.csr_matrix((ones, (np.r_[left, right], np.r_[right, left])), shape=(n, n))
+
+
+def row_standardise(weights):
+    """Weights divided by their row sums (rows without neighbours stay 0)."""
+    row_sums = np.asarray(weights.sum(axis=1)).ravel()
+    scale = np.divide(1.0, row_sums, out=np.zeros_like(row_sums), where=row_sums > 0)
+    return sparse.diags(scale) @ weights
+
+
+##### GLOBAL MORAN'S I
+def morans_i(values, weights, permutations=N_PERMUTATIONS, seed=0):
+    """
+    Global Moran's I with a permutation p-value.
+
+    Parameters:
+    - values: array of values, one per area (no missing values)
+    - weights: sparse (n, n) weights (e.g. row_standardise(contiguity_weights(...)))
+    - permutations: number of random relabellings of the values, computed as one
+      sparse-dense product
+    - seed: seed of the permutations
+
+    Returns a dict with I, expected_I (-1 / (n - 1)), z (against the permutations) and
+    p_value (one-sided, in the direction of I, +1 corrected).
+    """
+    z = np.asarray(values, dtype=float)
+    z = z - z.mean()
+    n = len(z)
+    s0 = weights.sum()
+    scale = n / s0 / (z @ z)
+
+    observed = scale * (z @ (weights @ z))
+
+    rng = np.random.default_rng(seed)
+    shuffled = rng.permuted(np.broadcast_to(z[:, None], (n, permutations)), axis=0)
+    simulated = scale * np.einsum('ij,ij->j', shuffled, weights @ shuffled)
+
+    expected = -1 / (n - 1)
+    if observed >= expected:
+        extreme = np.count_nonzero(simulated >= observed)
+    else:
+        extreme = np.count_nonzero(simulated <= observed)
+    return {
+        'I': observed,
+        'expected_I': expected,
+        'z': (observed - simulated.mean()) / simulated.std(),
+        'p_value': (extreme + 1) / (permutations + 1),
+    }
+
+
+##### LOCAL STATISTICS
+def local_morans_i(values, weights, permutations=N_PERMUTATIONS, alpha=0.05, seed=0, batch_size=256):
+    """
+    Local Moran's I (LISA) of every area, with conditional permutation p-values.
+
+    For each area the value is held fixed and its neighbours' values are redrawn from the
+    other areas. The same random draws are reused for every area (shifted past the area
+    itself), so an area's simulated lags are a masked mean over one (permutations x max
+    neighbours) index matrix; areas are processed `batch_size` at a time.
+
+    Parameters:
+    - values: array of values, one per area (no missing values)
+    - weights: sparse binary contiguity (the lag is the mean of the neighbours)
+    - permutations, seed: as morans_i
+    - alpha: significance level of the cluster labels
+
+    Returns a DataFrame (one row per area) with I, lag (mean of the neighbours' standardised
+    values), p_value (folded, +1 corrected) and cluster (LISA_CLUSTERS).
+    """
+    x = np.asarray(values, dtype=float)
+    n = len(x)
+    z = (x - x.mean()) / x.std()
+
+    weights = sparse.csr_matrix(weights)
+    neighbours = np.diff(weights.indptr)
+    lag = row_standardise(weights) @ z
+    local_i = z * lag
+
+    max_neighbours = int(neighbours.max()) if n else 0
+    rng = np.random.default_rng(seed)
+    # without replacement from the n - 1 other areas: the first max_neighbours of a permutation
+    draws = np.argsort(rng.random((permutations, n - 1)), axis=1)[:, :max_neighbours]
+    taken = np.arange(max_neighbours)
+
+    larger = np.zeros(n, dtype=np.int64)
+    for start in range(0, n, batch_size):
+        rows = np.arange(start, min(start + batch_size, n))
+        # index k >= i is area k + 1, so the area itself is never drawn
+        ids = draws[None, :, :] + (draws[None, :, :] >= rows[:, None, None])
+        mask = taken[None, None, :] < neighbours[rows, None, None]
+        simulated_lag = (z[ids] * mask).sum(axis=2) / np.maximum(neighbours[rows, None], 1)
+        simulated_i = z[rows, None] * simulated_lag
+        larger[rows] = np.count_nonzero(simulated_i >= local_i[rows, None], axis=1)
+
+    extreme = np.minimum(larger, permutations - larger)
+    p_value = (extreme + 1) / (permutations + 1)
+
+    quadrant = np.select([(z > 0) & (lag > 0), (z < 0) & (lag < 0), (z < 0) & (lag > 0), (z > 0) & (lag < 0)],
+                         [1, 2, 3, 4], 0)
+    cluster = np.where((p_value < alpha) & (neighbours > 0), quadrant, 0)
+    return pd.DataFrame({
+        'I': local_i,
+        'lag': lag,
+        'p_value': p_value,
+        'cluster': pd.Categorical.from_codes(cluster, LISA_CLUSTERS),
+    })
+
+
+def getis_ord(values, weights, alpha=0.05):
+    """
+    Getis-Ord Gi* hot spots: for each area, the z-score of the sum of its own and its
+    neighbours' values against the global mean (analytical, one sparse product).
+
+    Parameters:
+    - values: array of values, one per area (no missing values)
+    - weights: sparse binary contiguity (the area itself is added)
+    - alpha: two-sided significance level of the labels
+
+    Returns a DataFrame (one row per area) with z, p_value and spot (HOT_SPOTS).
+    """
+    x = np.asarray(values, dtype=float)
+    n = len(x)
+    star = sparse.csr_matrix(weights) + sparse.identity(n, format='csr')
+
+    w_sum = np.asarray(star.sum(axis=1)).ravel()
+    w_squares = np.asarray(star.multiply(star).sum(axis=1)).ravel()
+    mean = x.mean()
+    s = np.sqrt((x ** 2).mean() - mean ** 2)
+
+    z = (star @ x - mean * w_sum) / (s * np.sqrt((n * w_squares - w_sum ** 2) / (n - 1)))
+    p_value = 2 * stats.norm.sf(np.abs(z))
+    spot = np.where(p_value < alpha, np.where(z > 0, 1, 2), 0)
+    return pd.DataFrame({
+        'z': z,
+        'p_value': p_value,
+        'spot': pd.Categorical.from_codes(spot, HOT_SPOTS),
+    })
+
+
+##### RATE SMOOTHING
+def smoothed_rates(amounts, population, weights, scale=1.0):
+    """
+    Empirical-Bayes smoothing of per-person rates (scale * amount / population): each rate
+    is shrunk towards the population-weighted mean of its area and its neighbours, more
+    strongly the smaller the population.
+
+    Model: rate_i = theta_i + e_i with Var(theta) = tau2 and Var(e_i) = sigma2 / population_i.
+    tau2 and sigma2 come from the method of moments, E[(rate - local mean)^2] = tau2 + sigma2 / population,
+    fitted for every column at once; the shrinkage weight is tau2 / (tau2 + sigma2 / population_i).
+
+    Parameters:
+    - amounts: (n, m) array of amounts (e.g. co-benefit totals), one row per area
+    - population: (n,) array of populations
+    - weights: sparse binary contiguity (n, n)
+    - scale: multiplier of the rates (1e6 for the £/person _std columns of £ million totals)
+
+    Returns the (n, m) smoothed rates; areas with a missing amount or no population stay NaN.
+    """
+    amounts = np.asarray(amounts, dtype=float).reshape(len(population), -1)
+    population = np.asarray(population, dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rates = scale * amounts / population[:, None]
+    valid = np.isfinite(rates) & (population > 0)[:, None]
+
+    # population-weighted mean rate of each area and its neighbours
+    star = sparse.csr_matrix(weights) + sparse.identity(len(population), format='csr')
+    local_amounts = star @ np.where(valid, amounts, 0.0)
+    local_population = star @ np.where(valid, population[:, None], 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        local_mean = scale * local_amounts / local_population
+        inverse_population = np.where(valid, 1 / population[:, None], 0.0)
+    squares = np.where(valid, (rates - local_mean) ** 2, 0.0)
+
+    # least squares of squares ~ tau2 + sigma2 * inverse_population, every column together
+    s0 = valid.sum(axis=0)
+    s1 = inverse_population.sum(axis=0)
+    s2 = (inverse_population ** 2).sum(axis=0)
+    t0 = squares.sum(axis=0)
+    t1 = (squares * inverse_population).sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        determinant = s0 * s2 - s1 ** 2
+        tau2 = np.clip(np.nan_to_num((s2 * t0 - s1 * t1) / determinant), 0, None)
+        sigma2 = np.clip(np.nan_to_num((s0 * t1 - s1 * t0) / determinant), 0, None)
+        shrinkage = tau2 / (tau2 + sigma2 * inverse_population)
+    # no sampling variance detected: keep the raw rates
+    shrinkage = np.where(sigma2 > 0, shrinkage, 1.0)
+
+    smoothed = local_mean + shrinkage * (rates - local_mean)
+    return np.where(valid, smoothed, np.nan)
+
+
+def add_smoothed_rates(totals, areas, value_cols, population_col='population', area_col='LSOA code',
+                       scale=1e6, suffix='_std_eb', kind='queen'):
+    """
+    Totals table with a smoothed per-person rate `<col><suffix>` for every value column,
+    all from one contiguity matrix and one smoothed_rates call.
+
+    Parameters:
+    - totals: one row per area, with `area_col`, `population_col` and the value columns
+    - areas: GeoDataFrame with `small_area` codes and polygons; areas without a polygon
+      have no neighbours, and areas without neighbours keep their own rate as local mean
+    - value_cols: amount columns to smooth (e.g. the co-benefit totals in £ million)
+    - scale: as smoothed_rates (1e6 matches the _std columns)
+    - kind: contiguity of the neighbours ('queen' or 'rook')
+    """
+    codes = totals[area_col].astype(str).str.strip()
+    polygons = areas.assign(small_area=areas['small_area'].astype(str).str.strip()) \
+        .drop_duplicates('small_area').set_index('small_area').geometry.reindex(codes)
+    weights = contiguity_weights(polygons.values, kind=kind)
+
+    smoothed = smoothed_rates(totals[value_cols].to_numpy(dtype=float),
+                              totals[population_col].to_numpy(dtype=float), weights, scale=scale)
+    columns = pd.DataFrame(smoothed, columns=[f'{col}{suffix}' for col in value_cols], index=totals.index)
+    return pd.concat([totals.drop(columns=columns.columns, errors='ignore'), columns], axis=1)
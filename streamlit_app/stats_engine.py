@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+from scipy import stats
+from scipy.stats import tukey_hsd
+
+
+class GroupTests:
+    """
+    One-way ANOVA of many value columns across the same groups (e.g. WIMD quintiles).
+
+    The rows are sorted by group once, and the group counts, sums, sums of squares,
+    min and max of every column come out of one reduceat per statistic, so the F
+    statistics and p-values of all columns are computed together. Missing values are
+    left out column by column (as dropping NaN before scipy.stats.f_oneway).
+    Post-hoc (Tukey HSD) tables are only computed when asked for, and kept.
+
+    Parameters:
+    - data: DataFrame with the group column and the value columns
+    - group_col: grouping column (rows where it is missing are ignored)
+    - value_cols: value columns to test (if None, every other numeric column)
+    """
+    def __init__(self, data, group_col, value_cols=None):
+        if value_cols is None:
+            value_cols = [col for col in data.columns
+                          if col != group_col and pd.api.types.is_numeric_dtype(data[col])]
+        self.group_col = group_col
+        self.value_cols = list(value_cols)
+        self._column_index = {col: j for j, col in enumerate(self.value_cols)}
+
+        data = data[data[group_col].notna()]
+        codes, labels = pd.factorize(data[group_col], sort=True)
+        self.groups = list(labels)
+
+        # sort rows by group, so every statistic is one reduceat over contiguous blocks
+        order = np.argsort(codes, kind='stable')
+        self._codes = codes[order]
+        self._values = data[self.value_cols].to_numpy(dtype=float)[order]
+        self._starts = np.flatnonzero(np.r_[True, self._codes[1:] != self._codes[:-1]])
+
+        valid = ~np.isnan(self._values)
+        filled = np.where(valid, self._values, 0.0)
+        self.counts = np.add.reduceat(valid, self._starts, axis=0)
+        sums = np.add.reduceat(filled, self._starts, axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.means = sums / self.counts
+        self.minimum = np.fmin.reduceat(self._values, self._starts, axis=0)
+        self.maximum = np.fmax.reduceat(self._values, self._starts, axis=0)
+
+        # within-group sum of squares around the group means (two passes, no cancellation)
+        centred = np.where(valid, self._values - self.means[self._codes], 0.0)
+        ss_within = np.add.reduceat(centred ** 2, self._starts, axis=0).sum(axis=0)
+
+        n = self.counts.sum(axis=0)
+        n_groups = (self.counts > 0).sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            grand_mean = sums.sum(axis=0) / n
+            ss_between = np.nansum(self.counts * (self.means - grand_mean) ** 2, axis=0)
+            df_between = n_groups - 1
+            df_within = n - n_groups
+            f_stat = (ss_between / df_between) / (ss_within / df_within)
+        p_value = stats.f.sf(f_stat, df_between, df_within)
+
+        self.anova = pd.DataFrame({
+            'F_statistic': f_stat,
+            'p_value': p_value,
+            'df_between': df_between,
+            'df_within': df_within,
+        }, index=pd.Index(self.value_cols, name='column'))
+
+        self._posthoc = {}
+
+    def __repr__(self):
+        return f"GroupTests({len(self.value_cols)} columns x {len(self.groups)} groups of {self.group_col!r})"
+
+    def group_values(self, column):
+        """List of arrays, the non-missing values of `column` in each group (in group order)."""
+        j = self._column_index[column]
+        blocks = np.split(self._values[:, j], self._starts[1:])
+        return [block[~np.isnan(block)] for block in blocks]
+
+    def group_stats(self, column):
+        """DataFrame indexed by group: mean, min and max of `column`."""
+        j = self._column_index[column]
+        return pd.DataFrame({
+            'mean': self.means[:, j],
+            'min': self.minimum[:, j],
+            'max': self.maximum[:, j],
+        }, index=pd.Index(self.groups, name=self.group_col))
+
+    def posthoc(self, column):
+        """
+        Tukey HSD p-values of `column` between every pair of groups (DataFrame indexed by group),
+        computed on first use.
+        """
+        if column not in self._posthoc:
+            result = tukey_hsd(*self.group_values(column))
+            self._posthoc[column] = pd.DataFrame(result.pvalue, index=self.groups, columns=self.groups)
+        return self._posthoc[column]
@@ -1,4 +1,5 @@
 from __future__ import annotations
+import numpy as np
 import pandas as pd
 from plotly.subplots import make_subplots
 import plotly.express as px
@@ -6,6 +7,16 @@ import plotly.graph_objects as go
 import streamlit as st
 import pydeck as pdk
 import json
+import re
+import hashlib
+from data_access import load_l2data_totals, load_quintile_tests, load_resampling_tests, load_area_geometry, load_topology
+from cobenefit_tensor import CobenefitTensor
+from distributions import histogram_bins, box_summary
+from resampling import N_RESAMPLES
+from spatial_stats import (contiguity_weights, row_standardise, morans_i, local_morans_i, getis_ord,
+                           N_PERMUTATIONS)
+from map_geometry import (PolygonBuffers, write_attribute_table, read_tiles_metadata, build_topology,
+                          quantise_topology, decode_topology, zoom_quantisation_step)
 
 
 cobenefit_colors = {
@@ -48,18 +59,373 @@ def value_to_color(colour_value, min_pop, max_pop
     
     return [r, g, b, 180]
 
+
+# Vectorised colour engine: a whole value column -> (N, 4) uint8 RGBA array in one NumPy pass
+NAN_COLOUR = (200, 200, 200, 180)
+COLOUR_SCALES = ('linear', 'quantile', 'diverging')
+
+def colour_scale_positions(values, scale='linear', centre=0.0, fit_values=None):
+    """
+    Position of each value on the colour ramp, between 0 and 1 (NaN stays NaN).
+
+    Parameters:
+    - values: array of values to place on the ramp
+    - scale: 'linear' (min -> 0, max -> 1), 'quantile' (share of values below, so each
+      colour covers the same number of areas) or 'diverging' (centre -> 0.5, symmetric range)
+    - centre: midpoint value of the diverging scale
+    - fit_values: values the scale is fitted on (default: `values`), e.g. to place legend edges
+    """
+    values = np.asarray(values, dtype=float)
+    fit = values if fit_values is None else np.asarray(fit_values, dtype=float)
+    fit = fit[np.isfinite(fit)]
+    if fit.size == 0:
+        return np.full(values.shape, np.nan)
+
+    if scale == 'linear':
+        lo, hi = fit.min(), fit.max()
+        t = (values - lo) / (hi - lo) if hi != lo else np.zeros_like(values)
+    elif scale == 'quantile':
+        # mid-rank of each value among the fitted values (ties share a position)
+        ordered = np.sort(fit)
+        below = np.searchsorted(ordered, values, side='left')
+        upto = np.searchsorted(ordered, values, side='right')
+        t = ((below + upto - 1) / 2) / (ordered.size - 1) if ordered.size > 1 else np.zeros_like(values)
+    elif scale == 'diverging':
+        half_range = np.abs(fit - centre).max()
+        t = 0.5 + 0.5 * (values - centre) / half_range if half_range > 0 else np.full(values.shape, 0.5)
+    else:
+        raise ValueError(f"Unknown colour scale {scale!r}, expected one of {COLOUR_SCALES}")
+
+    t = np.clip(t, 0, 1)
+    t[np.isnan(values)] = np.nan
+    return t
+
+
+def colour_ramp(t, colours, alpha=180, nan_colour=NAN_COLOUR):
+    """
+    Interpolate ramp positions `t` (0..1, NaN allowed) between evenly spaced RGB stops.
+    Returns an (N, 4) uint8 RGBA array.
+    """
+    t = np.asarray(t, dtype=float)
+    stops = np.asarray(colours, dtype=float)
+    stop_positions = np.linspace(0, 1, len(stops))
+
+    missing = np.isnan(t)
+    t_filled = np.where(missing, 0, t)
+
+    rgba = np.empty((t.size, 4), dtype=np.uint8)
+    for channel in range(3):
+        # truncation, as int() does in value_to_color
+        rgba[:, channel] = np.interp(t_filled, stop_positions, stops[:, channel]).astype(int)
+    rgba[:, 3] = alpha
+    rgba[missing] = nan_colour
+    return rgba
+
+
+def values_to_rgba(values, colour_low, colour_high, colour_mid=None, scale='linear', centre=0.0,
+                   alpha=180, nan_colour=NAN_COLOUR):
+    """
+    Colour a whole value column at once (vectorised replacement of value_to_color).
+
+    Parameters:
+    - values: array-like of values (NaN -> nan_colour)
+    - colour_low / colour_high: RGB tuples for the two ends of the ramp
+    - colour_mid: optional RGB tuple for the middle of the ramp (default white for 'diverging')
+    - scale: 'linear', 'quantile' or 'diverging' (see colour_scale_positions)
+    - centre: midpoint value of the diverging scale
+
+    Returns an (N, 4) uint8 RGBA array.
+    """
+    if colour_mid is None and scale == 'diverging':
+        colour_mid = (255, 255, 255)
+    colours = [colour_low, colour_high] if colour_mid is None else [colour_low, colour_mid, colour_high]
+
+    t = colour_scale_positions(values, scale=scale, centre=centre)
+    return colour_ramp(t, colours, alpha=alpha, nan_colour=nan_colour)
+
+
+# Geometry/attribute split: the GeoJSON geometries never change between metric switches,
+# so they are serialised once per dataset version; each map only attaches the few
+# properties its colours and tooltip need.
+def _serialise_geometry(gdf):
+    return [feature['geometry'] for feature in json.loads(gdf.geometry.to_json())['features']]
+
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def _geometry_features(geometry_key, _gdf):
+    return _serialise_geometry(_gdf)
+
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def _polygon_buffers(geometry_key, _gdf):
+    return PolygonBuffers.from_geometry(_gdf.geometry.values)
+
+
+# zoom levels a map can be zoomed in past its initial view (the max_zoom of choropleth_map)
+MAP_ZOOM_IN = 3
+
+
+def map_max_zoom(zoom, max_zoom=None):
+    """Largest zoom a map opened at `zoom` can be viewed at (max_zoom, else zoom + MAP_ZOOM_IN)."""
+    return max_zoom if max_zoom is not None else zoom + MAP_ZOOM_IN
+
+
+def ordered_digest(values):
+    """Digest of a Series or Index that changes when its values are reordered (cache keys of row order)."""
+    return hashlib.sha1(pd.util.hash_pandas_object(values, index=False).to_numpy().tobytes()).hexdigest()
+
+
+def map_geometry(gdf, zoom=None):
+    """
+    Geometry drawn for the rows of `gdf`, as (cache key, frame in row order).
+
+    If `zoom` is given and the simplified geometry levels exist (data/cardiff_geometry),
+    the coarsest level drawn at that zoom is used instead of gdf's own geometry, joined
+    on `small_area`. The geometry is sent once and kept when the map is zoomed in the
+    browser, so pass the largest zoom the view allows (map_max_zoom), not the initial one.
+
+    The key is gdf.attrs['dataset_version'] (set by data_access.load_cardiff_gdf) plus the
+    row index in row order, so a metric change does not re-serialise the polygons and a
+    reordered frame (e.g. sorted by a metric) gets its own entry. It is None for
+    frames without a dataset version (not cached).
+    """
+    if zoom is not None and 'small_area' in gdf.columns:
+        level = load_area_geometry(zoom)
+        if level is not None and gdf['small_area'].isin(level['small_area']).all():
+            geometry_key = (level.attrs['dataset_version'], ordered_digest(gdf['small_area']))
+            return geometry_key, level.set_index('small_area').loc[gdf['small_area']]
+
+    dataset_version = gdf.attrs.get('dataset_version')
+    if dataset_version is None:
+        return None, gdf
+    return (dataset_version, len(gdf), ordered_digest(gdf.index)), gdf
+
+
+def geometry_features(gdf, zoom=None):
+    """GeoJSON geometry of each row of `gdf` (list in row order), see map_geometry."""
+    geometry_key, source = map_geometry(gdf, zoom)
+    if geometry_key is None:
+        return _serialise_geometry(source)
+    return _geometry_features(geometry_key, source)
+
+
+def polygon_buffers(gdf, zoom=None):
+    """Flat typed-array encoding (PolygonBuffers) of the rows of `gdf`, see map_geometry."""
+    geometry_key, source = map_geometry(gdf, zoom)
+    if geometry_key is None:
+        return PolygonBuffers.from_geometry(source.geometry.values)
+    return _polygon_buffers(geometry_key, source)
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _gdf_topology(geometry_key, _gdf):
+    return build_topology(_gdf.geometry.values)
+
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def _topology_features(topology_key, step, _topology):
+    return decode_topology(quantise_topology(_topology, step), fallback=_topology)
+
+
+def topology_features(gdf, zoom):
+    """
+    GeoJSON geometry of each row of `gdf` decoded from the shared-arc topology, with the
+    coordinates quantised to half a pixel at `zoom` (map_geometry.zoom_quantisation_step,
+    at the latitude of the middle of `gdf`). Features that the quantisation would make
+    invalid are drawn at full precision.
+
+    Uses the topology written by the geography build (data/cardiff_geometry), joined on
+    `small_area`, or else encodes gdf's own geometry once per dataset version.
+    """
+    _, min_lat, _, max_lat = gdf.total_bounds
+    step = zoom_quantisation_step(zoom, latitude=round((min_lat + max_lat) / 2, 1))
+    topology = load_topology()
+    if topology is not None and 'small_area' in gdf.columns:
+        position = {feature.get('id'): i for i, feature in enumerate(topology['geometries'])}
+        rows = [position.get(code) for code in gdf['small_area']]
+        if None not in rows:
+            decoded = _topology_features(topology['dataset_version'], step, topology)
+            return [decoded[i] for i in rows]
+
+    geometry_key, source = map_geometry(gdf)
+    if geometry_key is None:
+        topology = build_topology(source.geometry.values)
+        return decode_topology(quantise_topology(topology, step), fallback=topology)
+    return _topology_features(geometry_key, step, _gdf_topology(geometry_key, source))
+
+
+def tooltip_columns(tooltip_html):
+    """Column names referenced as {column} in a pydeck tooltip template."""
+    if not tooltip_html:
+        return []
+    return list(dict.fromkeys(re.findall(r'\{([^{}]+)\}', tooltip_html)))
+
+
+def geojson_features(geometries, properties=None):
+    """
+    Join cached geometries with per-feature properties (list of dicts, same order).
+    The geometry dicts are shared, not copied.
+    """
+    if properties is None:
+        properties = [{}] * len(geometries)
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature", "geometry": geometry, "properties": props}
+            for geometry, props in zip(geometries, properties)
+        ]
+    }
+
+
+def tile_layer(gdf, rgba, properties, is_highlighted, tile_server_url):
+    """
+    MVTLayer drawing `gdf`'s colours on the local vector tiles.
+
+    The colours (split into scalar fill_r/g/b/a, as tile properties cannot hold arrays),
+    the highlight flag and the tooltip values are saved as an attribute table keyed by
+    `small_area`; the tile server adds them to the features of every tile it serves.
+    Areas of the tiles missing from `gdf` are drawn transparent.
+    """
+    table = {}
+    for code, colour, props, highlight in zip(gdf['small_area'], rgba.tolist(), properties, is_highlighted):
+        row = {name: value for name, value in props.items() if name != 'fill_color'}
+        row.update(fill_r=colour[0], fill_g=colour[1], fill_b=colour[2], fill_a=colour[3],
+                   highlight=int(highlight))
+        table[str(code)] = row
+    table_name = write_attribute_table(table)
+
+    metadata = read_tiles_metadata() or {}
+    return pdk.Layer(
+        "MVTLayer",
+        data=f"{tile_server_url.rstrip('/')}/tiles/{{z}}/{{x}}/{{y}}.pbf?table={table_name}",
+        min_zoom=metadata.get("min_zoom", 6),
+        max_zoom=metadata.get("max_zoom", 14),
+        filled=True,
+        stroked=True,
+        get_fill_color="@@=properties.fill_a ? [properties.fill_r, properties.fill_g, properties.fill_b, properties.fill_a] : [0, 0, 0, 0]",
+        get_line_color="@@=properties.highlight ? [255, 0, 0, 255] : [40, 40, 40, 100]",
+        get_line_width="@@=properties.highlight ? 4 : 1",
+        line_width_units="pixels",
+        pickable=True,
+    )
+
+
+##### SPATIAL CLUSTERS
+# Outline colours of the significant LISA clusters drawn over a choropleth
+LISA_COLOURS = {
+    'High-High': [215, 25, 28, 255],
+    'Low-Low': [44, 123, 182, 255],
+    'Low-High': [171, 217, 233, 255],
+    'High-Low': [253, 174, 97, 255],
+}
+
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def _contiguity_weights(geometry_key, kind, _gdf):
+    return contiguity_weights(_gdf.geometry.values, kind=kind)
+
+
+def spatial_weights(gdf, kind='queen'):
+    """
+    Sparse contiguity matrix of the rows of `gdf` (see spatial_stats.contiguity_weights),
+    built once per geometry version and row order (full-resolution geometry, see map_geometry):
+    row i of the matrix is always the area of row i of `gdf`.
+    """
+    geometry_key, source = map_geometry(gdf)
+    if geometry_key is None:
+        return contiguity_weights(source.geometry.values, kind=kind)
+    if 'small_area' in gdf.columns:
+        geometry_key = geometry_key + (ordered_digest(gdf['small_area']),)
+    return _contiguity_weights(geometry_key, kind, source)
+
+
+def spatial_clusters(gdf, column, kind='queen', permutations=N_PERMUTATIONS, alpha=0.05):
+    """
+    Spatial autocorrelation of `column` over the areas of `gdf`.
+
+    Returns (global, local):
+    - global: global Moran's I (dict, see spatial_stats.morans_i)
+    - local: DataFrame indexed like gdf with the local Moran's I (I, lag, p_value, cluster)
+      and the Getis-Ord Gi* (z, spot); areas with a missing value are 'Not significant'
+    """
+    weights = spatial_weights(gdf, kind)
+    values = gdf[column].to_numpy(dtype=float)
+    valid = np.isfinite(values)
+    if not valid.all():
+        weights = weights[valid][:, valid]
+    values = values[valid]
+
+    local = local_morans_i(values, weights, permutations=permutations, alpha=alpha)
+    hot_spots = getis_ord(values, weights, alpha=alpha)
+    local = local.assign(z=hot_spots['z'], spot=hot_spots['spot'])
+    local.index = gdf.index[valid]
+    local = local.reindex(gdf.index)
+    local['cluster'] = local['cluster'].fillna('Not significant')
+    local['spot'] = local['spot'].fillna('Not significant')
+
+    return morans_i(values, row_standardise(weights), permutations=permutations), local
+
+
+def cluster_layer(gdf, labels, colours=None, zoom=None, line_width=3, max_zoom=None):
+    """
+    GeoJsonLayer outlining the areas of `gdf` whose label (e.g. spatial_clusters' 'cluster'
+    column, in row order) has a colour in `colours` (default LISA_COLOURS), for the
+    extra_layers of choropleth_map. Reuses the cached geometry of the choropleth, given
+    the same `zoom` and `max_zoom`.
+    """
+    if colours is None:
+        colours = LISA_COLOURS
+    labels = pd.Series(labels).astype(object).to_numpy()
+    rows = [i for i, label in enumerate(labels) if label in colours]
+    geometries = geometry_features(gdf, zoom=None if zoom is None else map_max_zoom(zoom, max_zoom))
+    features = geojson_features([geometries[i] for i in rows], [{"line_color": colours[labels[i]]} for i in rows])
+    return pdk.Layer(
+        "GeoJsonLayer",
+        features,
+        filled=False,
+        stroked=True,
+        get_line_color="properties.line_color",
+        get_line_width=line_width,
+        line_width_units="pixels",
+        pickable=False,
+    )
+
+
 def choropleth_map(gdf, column_colour='population', 
                    colour_low=None, colour_high= None,
                    legend_title=None, height=400
                    ,zoom=10.5, lon_correction = 0, lat_correction = 0
                    ,legend_bins=5, tooltip_font_size=11,
-                   highlight_lsoa=None, tooltip_html = None):
+                   highlight_lsoa=None, tooltip_html = None,
+                   scale='linear', colour_mid=None, centre=0.0,
+                   geometry_transport='geojson', tile_server_url=None, extra_layers=None, max_zoom=None):
+    """
+    Choropleth of `column_colour` over the areas of `gdf`, with a legend below it.
+
+    The map opens at `zoom` and can be zoomed in up to `max_zoom` (default zoom + MAP_ZOOM_IN);
+    the simplified geometry level and the topology quantisation are chosen for `max_zoom`,
+    so the outlines stay accurate at every zoom the view allows.
+
+    geometry_transport='binary' draws a PolygonLayer fed from flat coordinate arrays
+    (map_geometry.PolygonBuffers) instead of a GeoJsonLayer of nested GeoJSON lists.
+    geometry_transport='topojson' decodes the geometry from the shared-arc topology,
+    quantised for `max_zoom` (fewer vertices and digits, no gaps between areas).
+
+    tile_server_url (e.g. "http://127.0.0.1:8765", see python_code/tile_server.py) draws
+    an MVTLayer from the local vector tiles instead: only the colours and tooltip values
+    are written, as an attribute table the tile server joins on `small_area`.
+
+    extra_layers (list of pdk.Layer, e.g. cluster_layer) are drawn on top of the map.
+    """
     
     # Set default colors if not provided
     if colour_low is None:
         colour_low = (255, 255, 255)
     if colour_high is None:
         colour_high = (220, 20, 20)
+    if colour_mid is None and scale == 'diverging':
+        colour_mid = (255, 255, 255)
+    ramp_colours = [colour_low, colour_high] if colour_mid is None else [colour_low, colour_mid, colour_high]
     
     min_pop = gdf[column_colour].min()
     max_pop = gdf[column_colour].max()
@@ -68,15 +434,11 @@ def choropleth_map(gdf, column_colour='population',
     # Calculate rank (1 = highest value)
     gdf['rank'] = gdf[column_colour].rank(ascending=False, method='min').astype(int)
     total_areas = len(gdf)
-    gdf['rank_display'] = gdf['rank'].apply(lambda x: f"{int(x)} of {total_areas}")
-
-    gdf['fill_color'] = gdf[column_colour].apply(
-        lambda x: value_to_color(x, min_pop, max_pop, 
-                                      colour_low, colour_high)
-    )
+    gdf['rank_display'] = gdf['rank'].astype(str) + f" of {total_areas}"
 
-    # Convert to GeoJSON
-    geo_json = json.loads(gdf.to_json())
+    values = gdf[column_colour].to_numpy(dtype=float)
+    rgba = values_to_rgba(values, colour_low, colour_high, colour_mid=colour_mid, scale=scale, centre=centre)
+    gdf['fill_color'] = rgba.tolist()
 
     # Calculate center of map
     minx, miny, maxx, maxy = gdf.total_bounds
@@ -85,26 +447,97 @@ def choropleth_map(gdf, column_colour='population',
     center_lon = center_lon + lon_correction
     center_lat= center_lat + lat_correction
 
-    # Create the PyDeck layer
-    layer = pdk.Layer(
-        "GeoJsonLayer",
-        geo_json,
-        filled=True,
-        stroked=True,
-        get_fill_color="properties.fill_color",
-        get_line_color=[40, 40, 40, 100],
-        get_line_width=2,
-        line_width_min_pixels=1,
-        pickable=True,
-    )
+    # Round the sum and sum_std values for tooltip display
+    if 'sum' in gdf.columns:
+        gdf['sum_rounded'] = gdf['sum'].round(2)
+    if 'sum_std' in gdf.columns:
+        gdf['sum_std_rounded'] = gdf['sum_std'].round(2)
+    if 'sum_std_eb' in gdf.columns:
+        gdf['sum_std_eb_rounded'] = gdf['sum_std_eb'].round(2)
+
+    # If tooltip_html is not provided or doesn't contain rank, add it
+    if tooltip_html and '{rank_display}' not in tooltip_html:
+        # Insert rank after the first line (neighbourhood name)
+        parts = tooltip_html.split('<br/>', 1)
+        if len(parts) == 2:
+            tooltip_html = f"{parts[0]}<br/>Rank: <b>{{rank_display}}</b><br/>{parts[1]}"
+        else:
+            tooltip_html = f"{tooltip_html}<br/>Rank: <b>{{rank_display}}</b>"
+
+    # Cached geometry + only the properties used by the layer and the tooltip
+    property_cols = ['fill_color'] + [col for col in tooltip_columns(tooltip_html)
+                                      if col in gdf.columns and col != 'fill_color']
+    properties = json.loads(gdf[property_cols].to_json(orient='records'))
+    is_highlighted = ((gdf['LSOA name (Eng)'] == highlight_lsoa).to_numpy()
+                      if highlight_lsoa and highlight_lsoa != "None" else np.zeros(len(gdf), dtype=bool))
+
+    # geometry detail for the largest zoom of the view, not just the initial one
+    max_zoom = map_max_zoom(zoom, max_zoom)
+
+    if tile_server_url:
+        layer = tile_layer(gdf, rgba, properties, is_highlighted, tile_server_url)
+    elif geometry_transport == 'binary':
+        # flat XY coordinate arrays, one record per polygon part (multi-polygons are split)
+        buffers = polygon_buffers(gdf, zoom=max_zoom)
+        polygons = buffers.polygon_records()
+        colours = buffers.polygon_colours(rgba).reshape(-1, 4).tolist()
+        data = [dict(properties[row], polygon=polygon, fill_color=colour)
+                for row, polygon, colour in zip(buffers.feature_index, polygons, colours)]
+        layer = pdk.Layer(
+            "PolygonLayer",
+            data,
+            get_polygon="polygon",
+            position_format="XY",
+            filled=True,
+            stroked=True,
+            get_fill_color="fill_color",
+            get_line_color=[40, 40, 40, 100],
+            get_line_width=2,
+            line_width_min_pixels=1,
+            pickable=True,
+        )
+    else:
+        if geometry_transport == 'topojson':
+            geometries = topology_features(gdf, max_zoom)
+        else:
+            geometries = geometry_features(gdf, zoom=max_zoom)
+        geo_json = geojson_features(geometries, properties)
+
+        # Create the PyDeck layer
+        layer = pdk.Layer(
+            "GeoJsonLayer",
+            geo_json,
+            filled=True,
+            stroked=True,
+            get_fill_color="properties.fill_color",
+            get_line_color=[40, 40, 40, 100],
+            get_line_width=2,
+            line_width_min_pixels=1,
+            pickable=True,
+        )
 
     layers = [layer]
     
     # Add highlight layer if an LSOA is selected
-    if highlight_lsoa and highlight_lsoa != "None":
-        highlight_gdf = gdf[gdf['LSOA name (Eng)'] == highlight_lsoa]
-        if not highlight_gdf.empty:
-            highlight_json = json.loads(highlight_gdf.to_json())
+    highlight_rows = np.flatnonzero(is_highlighted)
+    # (tile layers outline the highlighted area themselves)
+    if highlight_rows.size and not tile_server_url:
+        if geometry_transport == 'binary':
+            highlight_layer = pdk.Layer(
+                "PolygonLayer",
+                [{"polygon": polygon} for polygon in buffers.polygon_records(rows=highlight_rows)],
+                get_polygon="polygon",
+                position_format="XY",
+                filled=False,
+                stroked=True,
+                get_line_color=[255, 0, 0, 255],  # Red border
+                get_line_width=50,
+                line_width_min_pixels=4,
+                pickable=False,
+            )
+        else:
+            # reuse the cached geometry, no properties needed
+            highlight_json = geojson_features([geometries[i] for i in highlight_rows])
             highlight_layer = pdk.Layer(
                 "GeoJsonLayer",
                 highlight_json,
@@ -115,32 +548,20 @@ def choropleth_map(gdf, column_colour='population',
                 line_width_min_pixels=4,
                 pickable=False,
             )
-            layers.append(highlight_layer)
+        layers.append(highlight_layer)
+
+    if extra_layers:
+        layers.extend(extra_layers)
 
     # Set the view
     view_state = pdk.ViewState(
         latitude=center_lat,
         longitude=center_lon,
         zoom=zoom,
+        max_zoom=max_zoom,
         pitch=0
     )
 
-    # Round the sum and sum_std values for tooltip display
-    if 'sum' in gdf.columns:
-        gdf['sum_rounded'] = gdf['sum'].round(2)
-    if 'sum_std' in gdf.columns:
-        gdf['sum_std_rounded'] = gdf['sum_std'].round(2)
-
-    # If tooltip_html is not provided or doesn't contain rank, add it
-    if tooltip_html and '{rank_display}' not in tooltip_html:
-        # Insert rank after the first line (neighbourhood name)
-        parts = tooltip_html.split('<br/>', 1)
-    if len(parts) == 2:
-        tooltip_html = f"{parts[0]}<br/>Rank: <b>{{rank_display}}</b><br/>{parts[1]}"
-    else:
-        tooltip_html = f"{tooltip_html}<br/>Rank: <b>{{rank_display}}</b>"
-
-
     # Create the deck
     deck = pdk.Deck(
         layers=layers, 
@@ -173,11 +594,9 @@ def choropleth_map(gdf, column_colour='population',
             return f"{v:,.0f}"
         return f"{v:.2f}"
 
-    # Build equal-width bins and swatch colours (midpoint colour per bin)
+    # Build bins and swatch colours (midpoint colour per bin)
     def color_at_t(t):
-        r = int(colour_low[0] + (colour_high[0] - colour_low[0]) * t)
-        g = int(colour_low[1] + (colour_high[1] - colour_low[1]) * t)
-        b = int(colour_low[2] + (colour_high[2] - colour_low[2]) * t)
+        r, g, b, _ = colour_ramp([t], ramp_colours)[0]
         return f"rgb({r},{g},{b})"
     
     # Check if the data is discrete (few unique values, e.g., <= legend_bins)
@@ -194,10 +613,17 @@ def choropleth_map(gdf, column_colour='population',
         edges = [min_pop, max_pop]
         swatches = [color_at_t(0.5)]
         labels = [f"{fmt_val(min_pop)}–{fmt_val(max_pop)}"]
+    elif scale == 'quantile':
+        # Equal-count bins: each swatch covers the same share of areas
+        edges = list(np.nanquantile(values, np.linspace(0, 1, legend_bins + 1)))
+        swatches = [color_at_t((i + 0.5) / legend_bins) for i in range(legend_bins)]
+        labels = [f"{fmt_val(edges[i])}–{fmt_val(edges[i + 1])}" for i in range(legend_bins)]
     else:
-        # Original continuous logic
+        # Original continuous logic (equal-width bins)
         edges = [min_pop + (rng * i / legend_bins) for i in range(legend_bins + 1)]
-        swatches = [color_at_t((i + 0.5) / legend_bins) for i in range(legend_bins)]
+        midpoints = [(edges[i] + edges[i + 1]) / 2 for i in range(legend_bins)]
+        positions = colour_scale_positions(midpoints, scale=scale, centre=centre, fit_values=values)
+        swatches = [color_at_t(t) for t in positions]
         labels = [f"{fmt_val(edges[i])}–{fmt_val(edges[i + 1])}" for i in range(legend_bins)]
 
 
@@ -288,7 +714,7 @@ def Top3_Bottom3_LSOAs(data=None, value_col=None, value_col_display_name=None,
     Get top 3 and bottom 3 LSOAs based on a value column.
     
     Parameters:
-    - data: DataFrame to use (if None, uses l2data_totals from CSV)
+    - data: DataFrame to use (if None, uses the cached l2data_totals)
     - value_col: Column name to sort by
     - value_col_display_name: Optional display name for the value column (if None, uses value_col)
     - round_decimals: Number of decimal places to round values (default: 2)
@@ -299,7 +725,7 @@ def Top3_Bottom3_LSOAs(data=None, value_col=None, value_col_display_name=None,
     """
 
     if data is None:
-        data = pd.read_csv("data/l2data_totals.csv")
+        data = load_l2data_totals()
 
     # Sort the entire dataset and add rank
     data_sorted = data.sort_values(value_col, ascending=False).reset_index(drop=True)
@@ -347,9 +773,60 @@ def Top3_Bottom3_LSOAs(data=None, value_col=None, value_col_display_name=None,
     return(styled_df)
 
 
+@st.cache_resource(max_entries=128, show_spinner=False)
+def _binned_column(values_key, column, scale_factor, binning, _values):
+    rule, bins = binning
+    return histogram_bins(_values * scale_factor, rule=rule, bins=bins)
+
+
+def binned_column(data, column, scale_factor=1, binning='fd', bins=None):
+    """
+    Histogram bins of data[column] * scale_factor (see distributions.histogram_bins),
+    cached per (column values, scale_factor, binning).
+    """
+    values = data[column]
+    values_key = int(pd.util.hash_pandas_object(values, index=False).sum())
+    return _binned_column(values_key, column, scale_factor, (binning, bins), values.to_numpy(dtype=float))
+
+
+# options of the metric toggle above the co-benefit histograms
+HISTOGRAM_METRICS = ["Absolute (million £)", "Normalised (£/person)", "Smoothed (£/person)"]
+
+
+def has_smoothed_rates(data, column='sum_std_eb'):
+    """Whether `data` has smoothed rates (the _std_eb columns are empty without geometry to smooth with)."""
+    return column in data.columns and bool(data[column].notna().any())
+
+
+def histogram_metrics(data):
+    """Options of the histogram metric toggle: HISTOGRAM_METRICS, without the smoothed rates if `data` has none."""
+    return HISTOGRAM_METRICS if has_smoothed_rates(data) else HISTOGRAM_METRICS[:2]
+
+
+def per_person_histogram(cobenefit, cobenefit_display, histogram_metric, measure='Co-Benefits'):
+    """
+    Column and labels of the per-person histogram of a co-benefit: the _std column, or its
+    smoothed _std_eb version (shrunk towards the neighbouring areas, precomputed by the data
+    prep) when `histogram_metric` is "Smoothed (£/person)".
+
+    Parameters:
+    - cobenefit: co-benefit column, e.g. 'air_quality'
+    - cobenefit_display: display name used in the title
+    - histogram_metric: selected option of HISTOGRAM_METRICS
+    - measure: 'Co-Benefits' or 'Costs' in the axis label
+
+    Returns (histogram_column, x_labels, titles), as passed to histogram_totals.
+    """
+    rate = 'Smoothed' if histogram_metric == HISTOGRAM_METRICS[2] else 'Normalised'
+    histogram_column = [cobenefit + ('_std_eb' if rate == 'Smoothed' else '_std')]
+    x_labels = [f'{rate} Net-Zero {measure} [£/person]']
+    return histogram_column, x_labels, [f"{rate} {cobenefit_display} Distribution"]
+
+
 def histogram_totals(num_cols, columns_to_plot, data=None, x_labels=None, 
                      colors=None, colorscales=None, titles = None,x_range = None
                     ,scale_factor=1, unit_multiplier_label=None
+                    ,binning='fd', bins=None
                      ):
     """
     Create histogram subplots for given columns.
@@ -357,17 +834,20 @@ def histogram_totals(num_cols, columns_to_plot, data=None, x_labels=None,
     Parameters:
     - num_cols: number of columns in subplot grid
     - columns_to_plot: list of column names to plot
-    - data: DataFrame to use (if None, uses l2data_totals from session)
+    - data: DataFrame to use (if None, uses the cached l2data_totals)
     - x_labels: list of x-axis labels
     - colors: list of colors for bars
     - colorscales: list of colorscale names for colored bars
     - scale_factor: multiply values by this factor (e.g., 1000 for thousands)
     - unit_multiplier_label : custom label for y-axis (e.g., "Co-benefit Value (£ Thousands)")
+    - binning: 'fd' (Freedman-Diaconis), 'fixed' (equal width) or 'quantile' (equal count);
+      values are binned here and only the bins are sent to the chart
+    - bins: number of bins for 'fixed' and 'quantile'
   
     """
     
     if data is None:
-        data = pd.read_csv("data/l2data_totals.csv")
+        data = load_l2data_totals()
 
     # Create subplots
     num_rows = (len(columns_to_plot) + num_cols - 1) // num_cols
@@ -395,13 +875,10 @@ def histogram_totals(num_cols, columns_to_plot, data=None, x_labels=None,
         row = i // num_cols + 1
         col_pos = i % num_cols + 1
 
-        # Scale the data
-        scaled_data = data[col] * scale_factor
-
         # Check if this subplot should use a colorscale
         if colorscales is not None and i < len(colorscales) and colorscales[i] is not None:
             # Get unique values and their counts for colored bars
-            value_counts = scaled_data.value_counts().sort_index()
+            value_counts = (data[col] * scale_factor).value_counts().sort_index()
             
             fig.add_trace(
                 go.Bar(
@@ -420,18 +897,21 @@ def histogram_totals(num_cols, columns_to_plot, data=None, x_labels=None,
                 col=col_pos
             )
         else:
-            # Use regular histogram with solid color
+            # Histogram binned server-side, drawn as bars (one per bin)
+            binned = binned_column(data, col, scale_factor=scale_factor, binning=binning, bins=bins)
             fig.add_trace(
-                go.Histogram(
-                    #x=data[col], 
-                    x=scaled_data, 
+                go.Bar(
+                    x=binned['centre'],
+                    y=binned['count'],
+                    width=binned['width'],
+                    customdata=binned[['left', 'right']].to_numpy(),
                     name=col, 
                     showlegend=False,
                     marker=dict(
                         color=colors[i],
                         line=dict(color='black', width=1)
                     ),
-                    hovertemplate=f'x value = %{{x}}<br>y value = %{{y}} <extra></extra>'
+                    hovertemplate='x value = %{customdata[0]:.4g} – %{customdata[1]:.4g}<br>y value = %{y} <extra></extra>'
                 ),
                 row=row, 
                 col=col_pos
@@ -460,15 +940,32 @@ def histogram_totals(num_cols, columns_to_plot, data=None, x_labels=None,
     
     st.plotly_chart(fig, use_container_width=True)
 
+@st.cache_resource(max_entries=64, show_spinner=False)
+def _quintile_box_summary(values_key, value_col, quintile_col, _data):
+    return box_summary(_data[value_col], _data[quintile_col])
+
+
 def deprivation_quintiles_boxplots_totals(
-        data_path="data/l2data_totals.csv", 
+        data_path=None, 
         quintile_col = 'WIMD 2025 overall quintile',
         value_col =None
         , title = ""
+        , summary_stats = True
         ):
+    """
+    Box plots of value_col by WIMD quintile.
+
+    Parameters:
+    - data_path: totals table (if None, the cached l2data_totals)
+    - quintile_col: quintile column
+    - value_col: column to plot
+    - title: chart title
+    - summary_stats: if True, the quartiles and fences are computed here (cached) and only
+      the outliers are sent as points; if False, every value is sent and Plotly computes the boxes
+    """
     
-    # Load data if not provided
-    data = pd.read_csv(data_path)
+    # Load data (cached, shared between reruns)
+    data = load_l2data_totals(data_path)
 
     if (value_col == 'sum'):
         value_label = 'Total'
@@ -494,7 +991,43 @@ def deprivation_quintiles_boxplots_totals(
     
     #colors = px.colors.qualitative.Plotly
     
-    for quintile in sorted(data[quintile_col].unique()):
+    if summary_stats:
+        values_key = int(pd.util.hash_pandas_object(data[[quintile_col, value_col]], index=False).sum())
+        summary, outliers = _quintile_box_summary(values_key, value_col, quintile_col, data)
+
+    for quintile in quintiles:
+        if summary_stats:
+            stats = summary.loc[quintile]
+            name = f'Quintile {int(quintile)}'
+            fig.add_trace(
+                go.Box(
+                    x=[name],
+                    q1=[stats['q1']],
+                    median=[stats['median']],
+                    q3=[stats['q3']],
+                    lowerfence=[stats['lowerfence']],
+                    upperfence=[stats['upperfence']],
+                    name=name,
+                    marker_color=colors[int(quintile)-1],
+                    boxmean=False,
+                    customdata=[[quintile, stats['q1'], stats['median'], stats['q3']]],
+                    hovertemplate='<b>Quintile %{customdata[0]:.0f}</b><br>Q1: %{customdata[1]:.2f}<br>Median: %{customdata[2]:.2f}<br>Q3: %{customdata[3]:.2f}<extra></extra>'
+                )
+            )
+            # only the outliers are sent as points
+            quintile_outliers = outliers.loc[outliers['group'] == quintile, 'value']
+            if len(quintile_outliers):
+                fig.add_trace(
+                    go.Scatter(
+                        x=[name] * len(quintile_outliers),
+                        y=quintile_outliers,
+                        mode='markers',
+                        marker=dict(color=colors[int(quintile)-1], size=5),
+                        hovertemplate='%{y:.2f}<extra></extra>'
+                    )
+                )
+            continue
+
         data_subset = data[data[quintile_col] == quintile]
 
         # Calculate Q1, median, Q3
@@ -538,8 +1071,9 @@ def create_cobenefit_timeline(l2data_time, cobenefit_name, display_name,
     
     Parameters:
     -----------
-    l2data_time : DataFrame
-        The dataframe containing time series data
+    l2data_time : DataFrame or CobenefitTensor
+        The time series data: the long table, a co-benefit x year matrix of sums
+        (data_access.load_cobenefit_matrix), or the (area, co-benefit, year) tensor
     cobenefit_name : str
         The name of the co-benefit column in the dataframe (e.g., 'diet_change')
     display_name : str
@@ -560,11 +1094,18 @@ def create_cobenefit_timeline(l2data_time, cobenefit_name, display_name,
     fig : plotly.graph_objects.Figure
         The configured plotly figure
     """
-    # Filter for the specific co-benefit and sum across all LSOAs for each year
-    cobenefit_time = l2data_time[l2data_time['co-benefit_type'] == cobenefit_name][year_cols].sum()
+    if isinstance(l2data_time, CobenefitTensor):
+        # Sum across all LSOAs for each year (reduction over the area axis)
+        cobenefit_time = l2data_time.total_by_year(cobenefit_name, years=year_cols)
+    elif 'co-benefit_type' not in l2data_time.columns:
+        # Pre-aggregated matrix: the sums are already there
+        cobenefit_time = l2data_time.loc[cobenefit_name, year_cols].to_numpy(dtype=float)
+    else:
+        # Filter for the specific co-benefit and sum across all LSOAs for each year
+        cobenefit_time = l2data_time[l2data_time['co-benefit_type'] == cobenefit_name][year_cols].sum().values
     
     # Scale the values
-    scaled_values = cobenefit_time.values * scale_factor
+    scaled_values = cobenefit_time * scale_factor
     
     # Determine y-axis label
     if unit_multiplier_label:
@@ -611,24 +1152,31 @@ def create_cobenefit_timeline(l2data_time, cobenefit_name, display_name,
 # Function to add to utils.py
 
 def test_quintile_differences(
-    data_path="data/l2data_totals.csv",
+    data_path=None,
     quintile_col='WIMD 2025 overall quintile',
     value_col='sum_std',
-    alpha=0.05
+    alpha=0.05,
+    resampling=False,
+    n_resamples=N_RESAMPLES
 ):
     """
     Test for statistical differences between WIMD quintiles using ANOVA and post-hoc tests.
     
     Parameters:
     -----------
-    data_path : str
-        Path to the data CSV file
+    data_path : str, optional
+        Path to the data file (parquet or CSV; if None, uses the default l2data_totals artifact)
     quintile_col : str
         Column name for the quintile grouping variable
     value_col : str
         Column name for the co-benefit value to test (per person, e.g., 'sum_std')
     alpha : float
         Significance level for hypothesis testing (default: 0.05)
+    resampling : bool
+        Also run the distribution-free tests (permutation ANOVA, Kruskal-Wallis and
+        bootstrap CIs of the quintile medians, see resampling.py)
+    n_resamples : int
+        Number of permutations / bootstrap resamples
     
     Returns:
     --------
@@ -637,34 +1185,16 @@ def test_quintile_differences(
         - 'quintile_stats': Descriptive statistics by quintile
         - 'significant': Boolean indicating if differences are significant
         - 'posthoc': Post-hoc test results (if ANOVA is significant)
+        - 'resampling': Resampling test results (if resampling is True)
     """
-    import scipy.stats as stats
-    from scipy.stats import f_oneway
-    import pandas as pd
-    import numpy as np
-    
-    # Load data
-    data = pd.read_csv(data_path)
-    
-    # Remove any NaN values in the relevant columns
-    data_clean = data[[quintile_col, value_col]].dropna()
+    # ANOVA of every column at once, cached per version of the data
+    tests = load_quintile_tests(data_path, quintile_col)
+    anova = tests.anova.loc[value_col]
+    f_stat, p_value = anova['F_statistic'], anova['p_value']
+    quintile_names = tests.groups
     
-    # Group data by quintile
-    groups = [group[value_col].values for name, group in data_clean.groupby(quintile_col)]
-    quintile_names = sorted(data_clean[quintile_col].unique())
-    
-    # Calculate descriptive statistics by quintile
-    quintile_stats = data_clean.groupby(quintile_col)[value_col].agg([
-        #('n', 'count'),
-        ('mean', 'mean'),
-        #('median', 'median'),
-        #('std', 'std'),
-        ('min', 'min'),
-        ('max', 'max')
-    ]).round(2)
-    
-    # Perform one-way ANOVA
-    f_stat, p_value = f_oneway(*groups)
+    # Descriptive statistics by quintile
+    quintile_stats = tests.group_stats(value_col).round(2)
     
     # Determine if significant
     is_significant = p_value < alpha
@@ -673,8 +1203,8 @@ def test_quintile_differences(
         'anova_result': {
             'F_statistic': round(f_stat, 4),
             'p_value': round(p_value, 6),
-            'df_between': len(groups) - 1,
-            'df_within': len(data_clean) - len(groups)
+            'df_between': int(anova['df_between']),
+            'df_within': int(anova['df_within'])
         },
         'quintile_stats': quintile_stats,
         'significant': is_significant,
@@ -683,44 +1213,20 @@ def test_quintile_differences(
     
     # If ANOVA is significant, perform post-hoc Tukey HSD test
     if is_significant:
-        try:
-            from scipy.stats import tukey_hsd
-            
-            # Perform Tukey HSD test
-            res = tukey_hsd(*groups)
-            
-            # Create a matrix of p-values
-            posthoc_df = pd.DataFrame(
-                res.pvalue,
-                index=[f'Q{int(q)}' for q in quintile_names],
-                columns=[f'Q{int(q)}' for q in quintile_names]
-            ).round(4)
-            
-            results['posthoc'] = posthoc_df
-            results['interpretation'] = f"ANOVA is significant (p={p_value:.6f}). There are statistically significant differences between at least two quintiles."
-            
-        except ImportError:
-            # Fallback to pairwise t-tests with Bonferroni correction
-            n_comparisons = len(groups) * (len(groups) - 1) / 2
-            bonferroni_alpha = alpha / n_comparisons
-            
-            pairwise_results = []
-            for i in range(len(groups)):
-                for j in range(i + 1, len(groups)):
-                    t_stat, p_val = stats.ttest_ind(groups[i], groups[j])
-                    pairwise_results.append({
-                        'Quintile_1': f'Q{int(quintile_names[i])}',
-                        'Quintile_2': f'Q{int(quintile_names[j])}',
-                        't_statistic': round(t_stat, 4),
-                        'p_value': round(p_val, 6),
-                        'significant_bonferroni': p_val < bonferroni_alpha
-                    })
-            
-            results['posthoc'] = pd.DataFrame(pairwise_results)
-            results['interpretation'] = f"ANOVA is significant (p={p_value:.6f}). Pairwise comparisons use Bonferroni correction (α={bonferroni_alpha:.6f})."
+        # Tukey HSD p-values (computed once per column, then kept)
+        posthoc_df = tests.posthoc(value_col).round(4)
+        posthoc_df.index = [f'Q{int(q)}' for q in quintile_names]
+        posthoc_df.columns = [f'Q{int(q)}' for q in quintile_names]
+
+        results['posthoc'] = posthoc_df
+        results['interpretation'] = f"ANOVA is significant (p={p_value:.6f}). There are statistically significant differences between at least two quintiles."
     else:
         results['interpretation'] = f"ANOVA is not significant (p={p_value:.6f}). No evidence of differences between quintiles."
     
+    if resampling:
+        # cached per version of the data, column and number of resamples
+        results['resampling'] = load_resampling_tests(value_col, data_path, quintile_col, n_resamples)
+    
     return results
 
 
@@ -767,35 +1273,52 @@ def display_quintile_test_results(test_results, value_col_name=None):
         
         posthoc = test_results['posthoc']
         
-        if isinstance(posthoc, pd.DataFrame) and 'Quintile_1' in posthoc.columns:
-            # Pairwise comparison format (Bonferroni)
-            sig_pairs = posthoc[posthoc['significant_bonferroni'] == True]
-            if len(sig_pairs) > 0:
-                sig_text = []
-                for _, row in sig_pairs.iterrows():
-                    sig_text.append(f"**{row['Quintile_1']} vs {row['Quintile_2']}** (p = {row['p_value']:.4f})")
-                st.write("Significantly different quintile pairs:")
-                for text in sig_text:
-                    st.write("- " + text)
-            else:
-                st.write("No significant pairwise differences found after Bonferroni correction.")
+        # Tukey HSD p-value matrix (quintile x quintile)
+        sig_pairs = []
+        for i in range(len(posthoc)):
+            for j in range(i+1, len(posthoc)):
+                p_val = posthoc.iloc[i, j]
+                if p_val < 0.05:
+                    q1 = posthoc.index[i]
+                    q2 = posthoc.columns[j]
+                    sig_pairs.append(f"**{q1} vs {q2}** (p = {p_val:.4f})")
+        
+        if sig_pairs:
+            st.write("Significantly different quintile pairs:")
+            for pair in sig_pairs:
+                st.write("- " + pair)
         else:
-            # Tukey HSD matrix format
-            sig_pairs = []
-            for i in range(len(posthoc)):
-                for j in range(i+1, len(posthoc)):
-                    p_val = posthoc.iloc[i, j]
-                    if p_val < 0.05:
-                        q1 = posthoc.index[i]
-                        q2 = posthoc.columns[j]
-                        sig_pairs.append(f"**{q1} vs {q2}** (p = {p_val:.4f})")
-            
-            if sig_pairs:
-                st.write("Significantly different quintile pairs:")
-                for pair in sig_pairs:
-                    st.write("- " + pair)
-            else:
-                st.write("No significant pairwise differences found (all p-values ≥ 0.05).")
+            st.write("No significant pairwise differences found (all p-values ≥ 0.05).")
+
+    # Distribution-free tests, if computed
+    if test_results.get('resampling') is not None:
+        resampling = test_results['resampling']
+        permutation = resampling['permutation_anova']
+        kruskal = resampling['kruskal_wallis']
+
+        st.markdown("#### Robust Tests (no normality assumption)")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Permutation ANOVA p-value", f"{permutation['p_value']:.4f}")
+        with col2:
+            st.metric("Kruskal-Wallis H", f"{kruskal['H_statistic']:.2f}")
+        with col3:
+            st.metric("Kruskal-Wallis p-value", f"{kruskal['p_value']:.6f}")
+        st.caption(
+            f"Permutation p-values from {permutation['n_resamples']:,} shuffles of the quintile labels "
+            f"(the smallest possible value is {1 / (permutation['n_resamples'] + 1):.4f})."
+        )
+
+        st.markdown("#### Bootstrap Medians by Quintile (95% CI)")
+        bootstrap = resampling['bootstrap']
+        bootstrap_table = pd.DataFrame({
+            'Median': bootstrap['median'],
+            'Median 95% CI': [f"{low:,.2f} to {high:,.2f}" for low, high in zip(bootstrap['median_low'], bootstrap['median_high'])],
+            'Gap to Q1': bootstrap['gap'],
+            'Gap 95% CI': [f"{low:,.2f} to {high:,.2f}" for low, high in zip(bootstrap['gap_low'], bootstrap['gap_high'])],
+        }, index=[f'Q{int(q)}' for q in bootstrap.index])
+        st.dataframe(bootstrap_table.style.format({'Median': "{:,.2f}", 'Gap to Q1': "{:,.2f}"}),
+                     use_container_width=True)
 
 
 def style_expanders():
@@ -0,0 +1,71 @@
+import os
+import sys
+
+import geopandas as gpd
+import shapely
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(ROOT, "streamlit_app"))
+from utils import map_geometry, geometry_features, polygon_buffers
+
+
+def _areas():
+    gdf = gpd.GeoDataFrame({
+        'small_area': ['A', 'B', 'C'],
+        'sum_std': [3.0, 1.0, 2.0],
+    }, geometry=[shapely.box(i, 0, i + 1, 1) for i in range(3)], crs=4326)
+    gdf.attrs['dataset_version'] = ('test', 0)
+    return gdf
+
+
+def _min_x(feature):
+    return min(point[0] for point in feature['coordinates'][0])
+
+
+def test_sorted_frame_gets_its_own_geometry():
+    gdf = _areas()
+    ordered = gdf.sort_values('sum_std')
+    assert map_geometry(gdf)[0] != map_geometry(ordered)[0]
+
+    # cache the unsorted frame first, then check each row of both keeps its own polygon
+    unsorted_features = geometry_features(gdf)
+    sorted_features = geometry_features(ordered)
+    assert sorted_features != unsorted_features
+    assert [_min_x(feature) for feature in unsorted_features] == gdf.bounds['minx'].tolist()
+    assert [_min_x(feature) for feature in sorted_features] == ordered.bounds['minx'].tolist()
+
+    polygon_buffers(gdf)
+    buffers = polygon_buffers(ordered)
+    starts = buffers.start_indices
+    first_x = [buffers.positions[2 * starts[i]:2 * starts[i + 1]:2].min() for i in range(len(ordered))]
+    assert first_x == ordered.bounds['minx'].tolist()
+
+
+def test_simplified_level_follows_row_order(monkeypatch):
+    import utils
+
+    level = _areas()[['small_area', 'geometry']]
+    level.attrs['dataset_version'] = ('level', 0)
+    monkeypatch.setattr(utils, 'load_area_geometry', lambda zoom: level)
+
+    gdf = _areas()
+    ordered = gdf.sort_values('sum_std')
+    assert map_geometry(gdf, zoom=10)[0] != map_geometry(ordered, zoom=10)[0]
+
+    geometry_features(gdf, zoom=10)
+    sorted_features = geometry_features(ordered, zoom=10)
+    assert [_min_x(feature) for feature in sorted_features] == ordered.bounds['minx'].tolist()
+
+
+def test_weights_follow_row_order():
+    from utils import spatial_weights
+
+    gdf = _areas()
+    ordered = gdf.iloc[[2, 0, 1]]
+    spatial_weights(gdf)
+    weights = spatial_weights(ordered).toarray()
+
+    # only the boxes next to each other (A-B, B-C) are neighbours
+    codes = ordered['small_area'].tolist()
+    neighbours = {(codes[i], codes[j]) for i, j in zip(*weights.nonzero())}
+    assert neighbours == {('A', 'B'), ('B', 'A'), ('B', 'C'), ('C', 'B')}
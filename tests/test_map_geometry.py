@@ -0,0 +1,99 @@
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+import shapely
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(ROOT, "streamlit_app"))
+from map_geometry import build_topology, quantise_topology, decode_topology, zoom_quantisation_step
+
+CARDIFF_SHAPEFILE_PATH = os.path.join(ROOT, "data", "cardiff_shapefile", "cardiff_lsoa.shp")
+
+
+def _shapes(geometries):
+    return np.array([shapely.from_geojson(json.dumps(geom)) if geom else None for geom in geometries],
+                    dtype=object)
+
+
+@pytest.fixture(scope="module")
+def cardiff_topology():
+    if not os.path.exists(CARDIFF_SHAPEFILE_PATH):
+        pytest.skip("Cardiff shapefile not available")
+    import geopandas as gpd
+
+    areas = gpd.read_file(CARDIFF_SHAPEFILE_PATH).to_crs(epsg=4326)
+    return build_topology(areas.geometry.values, ids=areas["small_area"].tolist())
+
+
+@pytest.mark.parametrize("zoom", [9, 9.75, 10.5, 11, 12, 13, 14])
+def test_quantised_cardiff_geometry_is_valid(cardiff_topology, zoom):
+    step = zoom_quantisation_step(zoom, latitude=51.5)
+    shapes = _shapes(decode_topology(quantise_topology(cardiff_topology, step), fallback=cardiff_topology))
+
+    assert len(shapes) == len(cardiff_topology["geometries"])
+    assert not shapely.is_missing(shapes).any()
+    assert not shapely.is_empty(shapes).any()
+    assert shapely.is_valid(shapes).all()
+
+
+def test_full_precision_round_trip(cardiff_topology):
+    import geopandas as gpd
+
+    areas = gpd.read_file(CARDIFF_SHAPEFILE_PATH).to_crs(epsg=4326)
+    shapes = _shapes(decode_topology(cardiff_topology))
+
+    assert shapely.is_valid(shapes).all()
+    assert shapely.hausdorff_distance(shapes, areas.geometry.values).max() < 1e-5
+
+
+def test_collapsed_feature_is_null():
+    squares = [shapely.box(0, 0, 10, 10), shapely.box(20, 0, 20.1, 0.1)]
+    topology = build_topology(squares, ids=["large", "small"], step=1.0)
+
+    assert topology["geometries"][1] == {"type": None, "id": "small"}
+    geometries = decode_topology(topology)
+    assert geometries[1] is None
+    assert shapely.is_valid(shapely.from_geojson(json.dumps(geometries[0])))
+
+
+def test_collapsed_part_is_dropped():
+    frame = shapely.Polygon(shapely.box(0, 0, 1000, 1000).exterior.coords,
+                            [shapely.box(10, 10, 990, 990).exterior.coords])
+    speck = shapely.box(2000, 2000, 2003, 2003)
+    topology = build_topology([frame, shapely.MultiPolygon([speck, shapely.box(3000, 0, 4000, 1000)])], step=1.0)
+
+    geometries = decode_topology(quantise_topology(topology, 100.0), fallback=topology)
+    shapes = _shapes(geometries)
+
+    assert shapely.is_valid(shapes).all()
+    # the 3 x 3 part falls within one grid cell, the other part is kept
+    assert geometries[1]["type"] == "MultiPolygon" and len(geometries[1]["coordinates"]) == 1
+
+
+def test_attribute_tables_are_evicted(tmp_path):
+    from map_geometry import write_attribute_table, read_attribute_table
+
+    names = [write_attribute_table({"A": {"value": i}}, directory=tmp_path, max_tables=3) for i in range(5)]
+    # reusing the oldest kept table marks it as recently used
+    os.utime(tmp_path / f"{names[2]}.json", ns=(0, 0))
+    assert write_attribute_table({"A": {"value": 2}}, directory=tmp_path, max_tables=3) == names[2]
+    write_attribute_table({"A": {"value": 5}}, directory=tmp_path, max_tables=3)
+
+    kept = sorted(path.stem for path in tmp_path.glob("*.json"))
+    assert len(kept) == 3
+    assert names[2] in kept and names[3] not in kept
+    assert read_attribute_table(names[2], directory=tmp_path) == {"A": {"value": 2}}
+
+
+def test_polygon_buffers_skip_missing_geometry():
+    from map_geometry import PolygonBuffers
+
+    geometry = [shapely.box(0, 0, 1, 1), None, shapely.Polygon(), shapely.box(2, 0, 3, 1)]
+    buffers = PolygonBuffers.from_geometry(geometry)
+
+    assert buffers.feature_index.tolist() == [0, 3]
+    records = buffers.polygon_records()
+    assert len(records) == 2 and min(records[1]["positions"][::2]) == 2